@@ -1,12 +1,19 @@
 from __future__ import annotations
 
-import csv
+import argparse
+import fnmatch
+import json
 import os
 import re
+import sys
 from datetime import datetime, date
 from pathlib import Path
 from typing import Dict, List
 
+import pandas as pd
+
+from balances_store import BalancesStore
+
 def get_csv_path() -> Path:
     """
     Priority order:
@@ -26,7 +33,17 @@ def get_csv_path() -> Path:
     # Local / repo fallback
     return Path("data/Balances.csv")
     
+def get_db_path(csv_path: Path) -> Path:
+    """
+    BALANCES_DB env var, else Balances.sqlite next to the CSV.
+    """
+    env = os.environ.get("BALANCES_DB")
+    if env:
+        return Path(env)
+    return csv_path.with_suffix(".sqlite")
+
 CSV_Path = get_csv_path()
+DB_Path = get_db_path(CSV_Path)
 
 ACCOUNTS = ["TSP", "SERS", "403(b)", "457(b)", "ROTH IRA", "Brokerage"]
 
@@ -56,6 +73,26 @@ def parse_money(s:str) -> float:
 
     return float(s)
 
+def parse_money_series(values) -> pd.Series:
+    """
+    parse_money for a whole column at once. Numeric columns pass straight
+    through; blank cells become NaN (no balance); anything else that is
+    not a number raises ValueError listing the offending values.
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype(float)
+
+    s = values.astype("string").str.strip()
+    s = s.str.replace(r"^\((.*)\)$", r"-\1", regex=True)      #(1,234.56) -> -1,234.56
+    s = s.str.replace(r"[\$, ]", "", regex=True)
+    s = s.mask(s == "")
+
+    bad = s.notna() & ~s.str.fullmatch(r"-?\d+(\.\d+)?").fillna(False)
+    if bad.any():
+        raise ValueError(f"Not a valid number: {values[bad].head(5).tolist()}")
+    return s.astype(float)
+
 def prompt_date() -> str:
     """
     Returns a month-start date string in M/D/YYYY format (e.g., 2/1/2026).
@@ -101,60 +138,6 @@ def prompt_date() -> str:
     dt = date(dt.year, dt.month, 1)
     return f"{dt.month}/{dt.day}/{dt.year}"
 
-def read_existing_dates(path: Path) -> set[str]:
-    """
-    Returns existing Date values normalized to M/D/YYYY.
-    This lets you detect duplicates even if older rows were saved as YYYY-MM-DD.
-    """
-    if not path.exists():
-        return set()
-
-    def _normalize_date_str(s: str) -> str:
-        s = (s or "").strip()
-        if not s:
-            return ""
-        for fmt in ("%Y-%m-%d", "%m/%d/%Y"):
-            try:
-                dt = datetime.strptime(s, fmt).date()
-                dt = date(dt.year, dt.month, 1)
-                return f"{dt.month}/{dt.day}/{dt.year}"
-            except ValueError:
-                continue
-        return s  # unknown format; keep as-is
-
-    with path.open("r", newline="") as f:
-        reader = csv.DictReader(f)
-        if "Date" not in (reader.fieldnames or []):
-            raise ValueError(f"{path} is missing required 'Date' column.")
-        return {
-            _normalize_date_str(row.get("Date", ""))
-            for row in reader
-            if row.get("Date")
-        }
-
-def ensure_csv_header(path: Path, fieldnames: List[str]) -> None:
-    """
-    Create file with header if it doesn't exist.
-    If it exists, validate header contains required columns.
-    """
-
-    if not path.exists():
-        path.parent.mkdir(parents=True, exist_ok=True)
-        with path.open("w", newline="") as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-        return
-
-    with path.open("r", newline="") as f:
-        reader = csv.DictReader(f)
-        existing = reader.fieldnames or []
-    missing = [c for c in fieldnames if c not in existing]
-    if missing:
-        raise ValueError(
-            f"{path} header missing columns: {missing}. "
-            f"Existing columns: {existing}"
-        )
-
 def prompt_balances(accounts: List[str]) -> Dict[str, float]:
     values: Dict[str, float] = {}
     for acct in accounts:
@@ -167,71 +150,147 @@ def prompt_balances(accounts: List[str]) -> Dict[str, float]:
                 print(f"  {e}. Try again (examples: 1234.56, $1,234.56).")
     return values
 
-def ensure_trailing_newline(path: Path) -> None:
+def open_store() -> BalancesStore:
     """
-    Ensure the file ends with a newline before appending.
-
-    If a CSV file's last line does not end with a newline character, appending a
-    new row will appear to continue on the same line (i.e., "to the right" of
-    the last entry). This fixes that by adding a newline when needed.
+    Open the balances store. On first use it is seeded from the existing
+    Balances.csv, so the history carries over.
     """
-    if not path.exists():
-        return
-    try:
-        with path.open("rb") as fb:
-            fb.seek(0, os.SEEK_END)
-            if fb.tell() == 0:
-                return  # empty file
-            fb.seek(-1, os.SEEK_END)
-            last = fb.read(1)
-        if last not in (b"\n", b"\r"):
-            # Force a newline so the next writerow starts on a fresh line.
-            with path.open("a", newline="") as f:
-                f.write("\n")
-    except OSError:
-        # If we can't read/seek for some reason, fall back to no-op.
+    if not DB_Path.exists() and CSV_Path.exists():
+        return BalancesStore.from_csv(CSV_Path, DB_Path)
+    return BalancesStore(DB_Path)
+
+# Bulk import of custodian statement exports (python Balances_update.py ingest
+# mapping.json statements/...). The mapping file says how to read each
+# custodian's files, picked by file name:
+#   {
+#     "tsp": {"match": "tsp_*.csv", "date_column": "Date", "columns": {"TSP": "Total Balance"}},
+#     "vanguard": {"match": "vanguard*.csv", "date_column": "As Of",
+#                  "account_column": "Account", "amount_column": "Balance",
+#                  "accounts": {"Roth IRA 1234": "ROTH IRA", "Brokerage 5678": "Brokerage"}}
+#   }
+# "columns" maps ACCOUNTS to the columns of a wide file (one row per date);
+# "account_column" / "amount_column" / "accounts" read a long file (one row per
+# account). Optional: "date_format", "month_offset" (e.g. 1 when a month end
+# statement is the next month's opening balance) and "read_csv" (extra
+# pandas.read_csv arguments, e.g. {"skiprows": 3}).
+
+def load_mapping(path: Path) -> Dict[str, dict]:
+    mapping = json.loads(Path(path).read_text(encoding="utf-8"))
+    for name, spec in mapping.items():
+        targets = spec["columns"].keys() if "columns" in spec else spec.get("accounts", {}).values()
+        unknown = [acct for acct in targets if acct not in ACCOUNTS]
+        if unknown:
+            raise ValueError(f"Mapping {name!r} targets unknown accounts {unknown}; accounts are {ACCOUNTS}")
+    return mapping
+
+def find_custodian(path: Path, mapping: Dict[str, dict]) -> str:
+    for name, spec in mapping.items():
+        if fnmatch.fnmatch(path.name, spec.get("match", f"{name}*")):
+            return name
+    raise ValueError(f"No mapping matches {path.name}")
+
+def read_statement(path: Path, spec: dict) -> pd.DataFrame:
+    #One statement file -> long rows (date, account, balance)
+    df = pd.read_csv(path, dtype=str, **spec.get("read_csv", {}))
+    df.columns = df.columns.str.strip()
+    dates = pd.to_datetime(df[spec["date_column"]].str.strip(), format=spec.get("date_format", "mixed"))
+
+    if "columns" in spec:
+        long = pd.concat([
+            pd.DataFrame({"date": dates, "account": acct, "balance": parse_money_series(df[column])})
+            for acct, column in spec["columns"].items()
+        ])
+    else:
+        accounts = df[spec["account_column"]].str.strip().map(spec["accounts"])
+        long = pd.DataFrame({"date": dates, "account": accounts, "balance": parse_money_series(df[spec["amount_column"]])})
+        long = long[long["account"].notna()]             #accounts the mapping doesn't list are ignored
+
+    offset = int(spec.get("month_offset", 0))
+    long["month"] = (long["date"].dt.to_period("M") + offset).dt.to_timestamp()
+    return long.dropna(subset=["balance"])
+
+def collect_statements(paths: List[Path]) -> List[Path]:
+    files = []
+    for path in paths:
+        files.extend(sorted(path.glob("*.csv")) if path.is_dir() else [path])
+    return files
+
+def ingest_statements(files: List[Path], mapping: Dict[str, dict]) -> pd.DataFrame:
+    """
+    Read every statement and reduce them to one balance per (month, account):
+    the latest-dated statement in the month wins (later files break ties).
+    Returns the wide Date + ACCOUNTS frame of the months found.
+    """
+    frames = []
+    for order, path in enumerate(files):
+        long = read_statement(path, mapping[find_custodian(path, mapping)])
+        frames.append(long.assign(order=order))
+    if not frames:
+        return pd.DataFrame(columns=["Date"] + ACCOUNTS)
+
+    rows = pd.concat(frames, ignore_index=True)
+    rows = rows.sort_values(["date", "order"], kind="stable").drop_duplicates(["month", "account"], keep="last")
+    wide = rows.pivot(index="month", columns="account", values="balance")
+    wide = wide.reindex(columns=[acct for acct in ACCOUNTS if acct in wide.columns])
+    return wide.rename_axis("Date").rename_axis(None, axis=1).reset_index()
+
+def ingest_main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(prog="Balances_update.py ingest", description="Import custodian statement CSVs into the balances history")
+    parser.add_argument("mapping", type=Path, help="JSON mapping of custodian files to ACCOUNTS")
+    parser.add_argument("statements", type=Path, nargs="+", help="statement CSVs or directories of them")
+    parser.add_argument("--dry-run", action="store_true", help="show what would be written and stop")
+    args = parser.parse_args(argv)
+
+    files = collect_statements(args.statements)
+    wide = ingest_statements(files, load_mapping(args.mapping))
+    print(f"{len(files)} statement files -> {len(wide)} months ({', '.join(wide.columns[1:])})")
+    if args.dry_run or wide.empty:
+        print(wide.to_string(index=False))
         return
 
-def append_row(path: Path, row: Dict[str, object], fieldnames: List[str]) -> None:
-    ensure_trailing_newline(path)
-    with path.open("a", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writerow(row)
+    with open_store() as store:
+        replaced = sum(store.has_month(d) for d in wide["Date"])
+        store.upsert_frame(wide)                              #one transaction: all months or none
+        store.export_csv(CSV_Path)
+    print(f"Saved {len(wide)} months ({replaced} already present, updated) to {DB_Path} and exported to {CSV_Path}")
 
 def main():
     fieldnames= ["Date"] + ACCOUNTS
-    ensure_csv_header(CSV_Path, fieldnames)
-
-    entry_date = prompt_date()
-    existing_dates = read_existing_dates(CSV_Path)
-
-    if entry_date in existing_dates:
-        print(f"\n An entry for {entry_date} already exists in {CSV_Path}.")
-        ans = input("Do you want to append anyway? (type YES to force append): ").strip()
-        if ans != "YES":
+    with open_store() as store:
+        entry_date = prompt_date()
+
+        if store.has_month(entry_date):
+            print(f"\n An entry for {entry_date} already exists in {DB_Path}.")
+            ans = input("Do you want to overwrite it? (type YES to overwrite): ").strip()
+            if ans != "YES":
+                print("Aborted (no changes made).")
+                return
+        print("\nEnter balances (you can values like $437,133.95):")
+        balances = prompt_balances(ACCOUNTS)
+
+        row: Dict[str, object] = {"Date": entry_date, **balances}
+
+        print("\nAbout to save this row:")
+        for k in fieldnames:
+            v = row[k]
+            if k =="Date":
+                print(f"  {k}:  {v}")
+            else:
+                print(f"  {k}: {float(v):,.2f}")
+
+        confirm = input("\nSave? (y/N): ").strip().lower()
+        if confirm !="y":
             print("Aborted (no changes made).")
             return
-    print("\nEnter balances (you can values like $437,133.95):")
-    balances = prompt_balances(ACCOUNTS)
-
-    row: Dict[str, object] = {"Date": entry_date, **balances}
-
-    print("\nAbout to append this row:")
-    for k in fieldnames:
-        v = row[k]
-        if k =="Date":
-            print(f"  {k}:  {v}")
-        else:
-            print(f"  {k}: {float(v):,.2f}")
-    
-    confirm = input("\nAppend to CSV? (y/N): ").strip().lower()
-    if confirm !="y":
-        print("Aborted (no changes made).")
-        return
 
-    append_row(CSV_Path, row, fieldnames)
-    print(f"\n Append to {CSV_Path}")
+        store.upsert(entry_date, balances)
+        #Keep Balances.csv as a readable copy of the store
+        store.export_csv(CSV_Path)
+        print(f"\n Saved to {DB_Path} and exported to {CSV_Path}")
 
 if __name__ == "__main__":
-    main()    
+    if sys.argv[1:2] == ["ingest"]:
+        ingest_main(sys.argv[2:])
+    else:
+        main()    
     
\ No newline at end of file
@@ -0,0 +1,162 @@
+import sqlite3
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import pandas as pd
+
+# Monthly account balances history. One row per (month, account) in a SQLite
+# table whose primary key is the pair, so a month is looked up through the
+# index instead of scanning the file, and re-entering a month replaces the
+# balances it gives (accounts it leaves out keep theirs, so statements from
+# different custodians for the same month merge).
+#
+#   store = BalancesStore("Balances.sqlite")
+#   store.upsert("2026-02-01", {"TSP": 437133.95, ...})
+#   store.frame("2025-01-01", "2025-12-01")      #wide: Date + one column per account
+#   store.export_csv("Balances.csv")
+#
+# Readers go through load_balances(path), which accepts the store or a
+# Balances.csv and parses each file once per process (until it changes).
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS balances (
+    month   TEXT NOT NULL,              -- first of the month, YYYY-MM-DD
+    account TEXT NOT NULL,
+    balance REAL NOT NULL,
+    PRIMARY KEY (month, account)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS accounts (
+    account  TEXT PRIMARY KEY,
+    position INTEGER NOT NULL           -- column order for frames and CSV export
+);
+"""
+
+STORE_SUFFIXES = (".sqlite", ".sqlite3", ".db")
+
+
+def month_key(value) -> str:
+    #Any date-like value -> "YYYY-MM-01"
+    return pd.Timestamp(value).to_period("M").to_timestamp().strftime("%Y-%m-%d")
+
+
+class BalancesStore:
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def accounts(self) -> List[str]:
+        return [name for (name,) in self.conn.execute("SELECT account FROM accounts ORDER BY position")]
+
+    def months(self) -> List[str]:
+        return [month for (month,) in self.conn.execute("SELECT DISTINCT month FROM balances ORDER BY month")]
+
+    def has_month(self, month) -> bool:
+        return self.conn.execute("SELECT 1 FROM balances WHERE month = ? LIMIT 1", (month_key(month),)).fetchone() is not None
+
+    def upsert_many(self, rows: Iterable[Tuple[object, Dict[str, float]]]) -> int:
+        """
+        Insert or replace (month, {account: balance}) rows in one transaction;
+        nothing is written if any row fails. Returns the number of months written.
+        """
+        count = 0
+        with self.conn:
+            known = set(self.accounts)
+            for month, balances in rows:
+                key = month_key(month)
+                for account, balance in balances.items():
+                    if account not in known:
+                        self.conn.execute(
+                            "INSERT INTO accounts (account, position) VALUES (?, (SELECT COUNT(*) FROM accounts))",
+                            (account,),
+                        )
+                        known.add(account)
+                    self.conn.execute(
+                        "INSERT INTO balances (month, account, balance) VALUES (?, ?, ?) "
+                        "ON CONFLICT (month, account) DO UPDATE SET balance = excluded.balance",
+                        (key, account, float(balance)),
+                    )
+                count += 1
+        return count
+
+    def upsert(self, month, balances: Dict[str, float]) -> None:
+        self.upsert_many([(month, balances)])
+
+    def upsert_frame(self, frame: pd.DataFrame) -> int:
+        #Wide frame with a Date column (or index) and one column per account; empty cells are skipped
+        frame = frame.reset_index() if "Date" not in frame.columns else frame
+        accounts = [c for c in frame.columns if c != "Date"]
+        return self.upsert_many(
+            (date, {acct: value for acct, value in zip(accounts, values) if pd.notna(value)})
+            for date, *values in frame[["Date"] + accounts].itertuples(index=False)
+        )
+
+    def delete_month(self, month) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM balances WHERE month = ?", (month_key(month),))
+
+    def frame(self, start=None, end=None) -> pd.DataFrame:
+        #Wide balances for months in [start, end] (either may be None), sorted by Date
+        query = "SELECT month, account, balance FROM balances WHERE month >= ? AND month <= ? ORDER BY month"
+        long = pd.read_sql_query(
+            query,
+            self.conn,
+            params=(month_key(start) if start is not None else "", month_key(end) if end is not None else "9999"),
+        )
+        wide = long.pivot(index="month", columns="account", values="balance")
+        wide = wide.reindex(columns=[acct for acct in self.accounts if acct in wide.columns])
+        wide.index = pd.to_datetime(wide.index, format="%Y-%m-%d")
+        wide.index.name = "Date"
+        wide.columns.name = None
+        return wide.reset_index()
+
+    def export_csv(self, path, start=None, end=None) -> None:
+        #Same layout Balances_update writes: Date as M/D/YYYY, then the accounts
+        frame = self.frame(start, end)
+        frame["Date"] = [f"{d.month}/{d.day}/{d.year}" for d in frame["Date"]]
+        frame.to_csv(path, index=False)
+
+    @classmethod
+    def from_csv(cls, csv_path, path) -> "BalancesStore":
+        #Build (or refresh) a store from an existing Balances.csv
+        store = cls(path)
+        store.upsert_frame(read_balances_csv(csv_path))
+        return store
+
+
+def read_balances_csv(path) -> pd.DataFrame:
+    bal = pd.read_csv(path)
+    bal["Date"] = pd.to_datetime(bal["Date"], format="mixed")       #rows may be M/D/YYYY or YYYY-MM-DD
+    return bal.sort_values("Date", kind="stable").reset_index(drop=True)
+
+
+@lru_cache(maxsize=8)
+def _load(path: str, mtime_ns: int, size: int) -> pd.DataFrame:
+    if Path(path).suffix.lower() in STORE_SUFFIXES:
+        with BalancesStore(path) as store:
+            return store.frame()
+    return read_balances_csv(path)
+
+
+def load_balances(path) -> pd.DataFrame:
+    """
+    Balances history (Date + one column per account, sorted by Date) from a
+    balances store or a Balances.csv. Parsed once per file version; every
+    call returns its own copy.
+    """
+    path = Path(path)
+    stat = path.stat()
+    return _load(str(path.resolve()), stat.st_mtime_ns, stat.st_size).copy()
@@ -0,0 +1,313 @@
+import sys
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import matplotlib.dates as mdates
+import matplotlib.ticker as ticker
+
+from executors import get_executor
+
+# Headless chart rendering for batches of projections (nightly runs, scenario
+# sweeps). Same panels as plotting.plotting / plotting_monte_carlo, but:
+#   - Agg canvases on plain Figures: no pyplot state, no plt.show()
+#   - actuals are passed in preloaded, and every series is converted to plain
+#     arrays (dates as matplotlib day numbers) once, in the parent
+#   - each worker builds a figure template (axes, formatters, legends, layout)
+#     once and only swaps line data per projection
+#   - series longer than the axes is wide are decimated to min/max per pixel
+#     column, which draws the same picture from a few points per pixel
+#
+#   render_charts({"base": {"projection": df, "order": [...], "monte_carlo": summary}},
+#                 "Output/charts", actuals=load_balances(...), executor="pool:8")
+#
+# or from the shell, for projection.csv files written by run_projection:
+#   python src/chart_renderer.py --balances Balances.csv --executor pool:8 Output/*/projection.csv
+
+FIGSIZE = (14, 8)
+DEFAULT_DPI = 150
+FAN_COLOR = "b"
+FAN_PANELS = (("Net_Worth_Real", 1e6, "M"), ("Income_Real", 1e3, "k"), ("Net_Income_Real", 1e3, "k"))
+
+
+def decimate_indices(y, pixels: int) -> np.ndarray:
+    #Indices of the first, last, min and max point of every pixel column (all points if there are few)
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if pixels <= 0 or n <= 4 * pixels:
+        return np.arange(n)
+
+    width = -(-n // pixels)
+    padded = np.full(pixels * width, np.nan)
+    padded[:n] = y
+    columns = padded.reshape(pixels, width)
+    starts = np.arange(pixels) * width
+    lows = starts + np.argmin(np.where(np.isnan(columns), np.inf, columns), axis=1)
+    highs = starts + np.argmax(np.where(np.isnan(columns), -np.inf, columns), axis=1)
+    ends = np.minimum(starts + width - 1, n - 1)
+    keep = np.unique(np.concatenate([starts, lows, highs, ends]))
+    return keep[keep < n]
+
+
+def decimate(x, y, pixels: int):
+    idx = decimate_indices(y, pixels)
+    return np.asarray(x)[idx], np.asarray(y)[idx]
+
+
+def agg_figure(nrows: int, ncols: int, figsize=FIGSIZE, dpi: int = DEFAULT_DPI, **subplot_kw):
+    #(figure, axes) on an Agg canvas, outside pyplot: nothing opens a window, safe in scripts and workers
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    return fig, fig.subplots(nrows, ncols, **subplot_kw)
+
+
+def save_figure(fig: Figure, path, dpi: int | None = None) -> Path:
+    #PNG of a figure from agg_figure (or plotting.plotting_monte_carlo / plotting_sensitivity)
+    path = Path(path)
+    fig.savefig(path, dpi=dpi or fig.dpi, bbox_inches="tight")
+    return path
+
+
+def _date_numbers(dates) -> np.ndarray:
+    return mdates.date2num(pd.DatetimeIndex(dates).to_pydatetime())
+
+
+def actuals_series(actuals: pd.DataFrame) -> Dict:
+    #Balances history (Date + account columns, e.g. load_balances) -> net worth arrays
+    if actuals is None or actuals.empty:
+        return {"x": np.zeros(0), "net_worth": np.zeros(0)}
+    actuals = actuals.reset_index() if "Date" not in actuals.columns else actuals
+    accounts = [c for c in actuals.columns if c != "Date"]
+    return {
+        "x": _date_numbers(actuals["Date"]),
+        "net_worth": actuals[accounts].sum(axis=1).to_numpy(dtype=float),
+    }
+
+
+PROJECTION_COLUMNS = ("Net_Worth", "Net_Worth_Real", "Income_Real", "Income", "Net_Income_Real", "Total Tax", "Fed Tax", "VA Tax")
+
+
+def projection_series(projection: pd.DataFrame, order: Sequence[str]) -> Dict:
+    #The columns the projection chart draws, as arrays
+    return {
+        "x": _date_numbers(projection["Date"]),
+        "columns": {c: projection[c].to_numpy(dtype=float) for c in PROJECTION_COLUMNS},
+        "accounts": {acct: projection[acct].to_numpy(dtype=float) for acct in order if acct in projection.columns},
+    }
+
+
+def monte_carlo_series(summary) -> Dict:
+    #Percentile bands, survival curve and headline numbers of a MonteCarloSummary
+    return {
+        "x": _date_numbers(summary.months),
+        "levels": list(summary.quantile_levels),
+        "bands": {metric: summary.quantile_frame(metric).to_numpy().T for metric, _, _ in FAN_PANELS},
+        "survival": summary.survival().to_numpy(),
+        "success_rate": summary.success_rate,
+        "n_paths": summary.n_paths,
+    }
+
+
+def _format_axis(ax, title, ylabel="($)", scale=None, unit=""):
+    ax.set_title(title)
+    ax.set_xlabel("Date")
+    ax.set_ylabel(ylabel)
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m"))
+    if scale is not None:
+        ax.yaxis.set_major_formatter(ticker.FuncFormatter(lambda v, _: f"${v/scale:.2f}{unit}"))
+    ax.tick_params(axis="x", labelrotation=45)
+    ax.grid(True)
+
+
+class _Template:
+    #A figure with every axis, line and legend in place; render() swaps in new data
+
+    def __init__(self, dpi: int):
+        self.fig = Figure(figsize=FIGSIZE, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.axes = self.fig.subplots(2, 2, sharex=True)
+        self.lines = {}
+
+    def _line(self, ax, key, **style):
+        (self.lines[key],) = ax.plot([], [], **style)
+
+    def _finish(self, legends: bool = True):
+        if legends:
+            for ax in self.axes.flat:
+                ax.legend(loc="best")
+        self.fig.tight_layout()
+        self.canvas.draw()
+        self.pixels = {id(ax): int(ax.bbox.width) for ax in self.axes.flat}
+
+    def _set(self, key, x, y):
+        line = self.lines[key]
+        line.set_data(*decimate(x, y, self.pixels[id(line.axes)]))
+
+    def _rescale(self):
+        for ax in self.axes.flat:
+            ax.relim()
+            ax.autoscale_view()
+
+    def save(self, path: Path) -> Path:
+        #Straight to the Agg canvas: savefig's extra layout/draw pass costs ~20% per chart
+        self.canvas.print_png(path)
+        return path
+
+
+class ProjectionTemplate(_Template):
+
+    def __init__(self, accounts: Sequence[str], dpi: int):
+        super().__init__(dpi)
+        (nw, income), (accts, tax) = self.axes
+        self._line(nw, "actual", label="Actual Balances", linestyle="-", color="b")
+        self._line(nw, "Net_Worth", label="Projected Nominal Balances", linestyle="dotted", color="r")
+        self._line(nw, "Net_Worth_Real", label="Projected Real Balances", linestyle="dotted", color="g")
+        _format_axis(nw, "Net Worth", "Net Worth ($)", 1e6, "M")
+
+        self._line(income, "Income_Real", label="Real Income")
+        self._line(income, "Income", label="Nominal Income")
+        self._line(income, "Net_Income_Real", label="Net Real Income")
+        _format_axis(income, "Income", scale=1e3, unit="k")
+
+        for acct in accounts:
+            self._line(accts, ("account", acct), label=f"{acct} Balances")
+        _format_axis(accts, "Account Balances", "Balance ($)", 1e6, "M")
+
+        self._line(tax, "Total Tax", label="Taxes")
+        self._line(tax, "Fed Tax", label="Fed")
+        self._line(tax, "VA Tax", label="VA")
+        _format_axis(tax, "Taxes- Nominal", scale=1e3, unit="k")
+        self._finish()
+
+    def render(self, series: Dict, actuals: Dict) -> None:
+        x = series["x"]
+        self._set("actual", actuals["x"], actuals["net_worth"])
+        for key in PROJECTION_COLUMNS:
+            self._set(key, x, series["columns"][key])
+        for acct, values in series["accounts"].items():
+            self._set(("account", acct), x, values)
+        self._rescale()
+
+
+class MonteCarloTemplate(_Template):
+
+    def __init__(self, dpi: int):
+        super().__init__(dpi)
+        for ax, (metric, scale, unit) in zip(self.axes.flat, FAN_PANELS):
+            self._line(ax, ("median", metric), color=FAN_COLOR)
+            _format_axis(ax, metric, scale=scale, unit=unit)
+        survival = self.axes[1, 1]
+        self._line(survival, "survival", color="g")
+        _format_axis(survival, "Success Rate", "Paths Funded")
+        survival.yaxis.set_major_formatter(ticker.PercentFormatter(1.0))
+        survival.set_ylim(0.0, 1.02)
+        self._finish(legends=False)                     #band legends change with the quantile levels
+
+    def render(self, series: Dict) -> None:
+        x, levels = series["x"], series["levels"]
+        half = len(levels) // 2
+        for ax, (metric, _, _) in zip(self.axes.flat, FAN_PANELS):
+            for band in list(ax.collections):
+                band.remove()
+            bands = series["bands"][metric]
+            idx = np.unique(np.concatenate([decimate_indices(b, self.pixels[id(ax)]) for b in bands]))
+            #outermost band first so inner bands draw on top
+            for lo, hi in zip(range(half), range(len(levels) - 1, len(levels) - 1 - half, -1)):
+                ax.fill_between(x[idx], bands[lo][idx], bands[hi][idx], alpha=0.25, color=FAN_COLOR, label=f"{levels[lo]:.0%}-{levels[hi]:.0%}", linewidth=0)
+            median = self.lines[("median", metric)]
+            if len(levels) % 2:
+                median.set_data(x[idx], bands[half][idx])
+                median.set_label(f"{levels[half]:.0%}")
+            median.set_visible(bool(len(levels) % 2))
+            ax.set_title(f"{metric} ({series['n_paths']} paths)")
+            ax.legend(loc="best")
+        self._set("survival", x, series["survival"])
+        self.axes[1, 1].set_title(f"Success Rate {series['success_rate']:.1%}")
+        self._rescale()
+
+
+#Per worker process: templates are built on first use and reused for every job
+_TEMPLATES: Dict[tuple, _Template] = {}
+
+
+def _template(key, build):
+    if key not in _TEMPLATES:
+        _TEMPLATES[key] = build()
+    return _TEMPLATES[key]
+
+
+def render_job(context: Dict, task: Dict) -> List[str]:
+    #Executor task: draw one scenario's charts into task["output_dir"], return the files written
+    dpi = context["dpi"]
+    output_dir = Path(task["output_dir"])
+    output_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+
+    if task.get("projection") is not None:
+        accounts = tuple(task["projection"]["accounts"])
+        template = _template(("projection", accounts, dpi), lambda: ProjectionTemplate(accounts, dpi))
+        template.render(task["projection"], context["actuals"])
+        written.append(str(template.save(output_dir / "net_worth.png")))
+
+    if task.get("monte_carlo") is not None:
+        template = _template(("monte_carlo", dpi), lambda: MonteCarloTemplate(dpi))
+        template.render(task["monte_carlo"])
+        written.append(str(template.save(output_dir / "monte_carlo.png")))
+    return written
+
+
+def render_charts(jobs: Dict[str, Dict], output_dir, actuals: pd.DataFrame = None, dpi: int = DEFAULT_DPI, executor=None, progress=None) -> Dict[str, List[str]]:
+    """
+    Render every job's charts into output_dir/<job name>/.
+
+    jobs: {name: {"projection": DataFrame, "order": accounts to draw,
+                  "monte_carlo": MonteCarloSummary (optional)}}
+    A job may also set "output_dir" to write somewhere else. Returns
+    {name: [files written]}.
+    """
+    output_dir = Path(output_dir)
+    names = list(jobs)
+    tasks = []
+    for name in names:
+        job = jobs[name]
+        projection = job.get("projection")
+        summary = job.get("monte_carlo")
+        tasks.append({
+            "output_dir": str(job.get("output_dir", output_dir / name)),
+            "projection": projection_series(projection, job.get("order", [])) if projection is not None else None,
+            "monte_carlo": monte_carlo_series(summary) if summary is not None else None,
+        })
+
+    context = {"actuals": actuals_series(actuals), "dpi": dpi}
+    results = {}
+    for i, written in get_executor(executor, progress=progress).map(render_job, context, tasks):
+        results[names[i]] = written
+    return results
+
+
+def main(argv: List[str]) -> None:
+    import argparse
+    from balances_store import load_balances
+
+    parser = argparse.ArgumentParser(description="Render charts for projection.csv files (next to each, in charts/)")
+    parser.add_argument("projections", type=Path, nargs="+")
+    parser.add_argument("--balances", type=Path, help="Balances.csv or balances store with the actuals")
+    parser.add_argument("--executor", default=None, help='"inprocess", "pool[:N]" or "spool:dir[:N]"')
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI)
+    args = parser.parse_args(argv)
+
+    actuals = load_balances(args.balances) if args.balances else None
+    jobs = {}
+    for path in args.projections:
+        projection = pd.read_csv(path, parse_dates=["Date"])
+        order = [c for c in (actuals.columns if actuals is not None else []) if c in projection.columns and c != "Date"]
+        jobs[str(path)] = {"projection": projection, "order": order, "output_dir": path.parent / "charts"}
+    for name, written in render_charts(jobs, ".", actuals, args.dpi, args.executor).items():
+        print(name, "->", ", ".join(written))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
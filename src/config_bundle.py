@@ -0,0 +1,420 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from income_types import ACCOUNT_TYPE_INCOME
+from tax_engine import BASE_TAX_YEAR, TAX_SYSTEMS
+
+# Config/ compiled into one binary bundle. Compiling validates every input
+# (tax_system.json, its bracket CSVs, account_meta.csv and
+# uniform_lifetime_table.csv) up front, so bad data fails before a run
+# starts instead of mid-loop:
+#
+#   bundle = load_bundle("Config")      #compiles first if a source file changed
+#   bundle.tax_systems                  #load_tax_systems layout
+#   bundle.account_tax_map              #account_meta.csv, indexed by account
+#   bundle.rmd_table                    #{age: divisor}
+#
+#   python config_bundle.py Config      #compile (and validate) by hand
+#
+# File: MAGIC, a little endian uint32 header length, the JSON header (format
+# version, sha256 of every source file, tax system settings, account names,
+# and each array's dtype/shape/offset), then the arrays, 64-byte aligned.
+# Loading maps the file and takes read-only views of the arrays; only the
+# header is parsed. Bundles live in <config_dir>/.compiled/.
+
+BUNDLE_VERSION = 1
+MAGIC = b"FIRECFG\0"
+BUNDLE_DIR = ".compiled"
+
+_ALIGN = 64
+_LENGTH = struct.Struct("<I")
+
+TAX_METHODS = ("marginal", "stacked", "base_plus_top_rate")
+
+#tax_system.json schema: key -> (types, required)
+SYSTEM_SCHEMA = {
+    "method": (str, True),
+    "brackets_file": (str, True),
+    "year": (int, False),
+    "standard_deduction": ((int, float), False),
+    "round_tax": (bool, False),
+    "indexed": (bool, False),
+    "tables": (dict, False),
+}
+TABLE_SCHEMA = {
+    "brackets_file": (str, True),
+    "standard_deduction": ((int, float), False),
+}
+
+BRACKET_COLUMNS = ("lower", "upper", "rate", "fee")
+
+
+def file_hash(path: Path) -> Optional[str]:
+    #sha256 of a source file, None when it doesn't exist
+    try:
+        return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def _check_fields(obj, schema: Dict, where: str, errors: List[str]) -> bool:
+    #Check one object of tax_system.json against its schema; False (with the reasons in `errors`) when it fails
+    if not isinstance(obj, dict):
+        errors.append(f"{where}: expected an object, got {type(obj).__name__}")
+        return False
+    found = len(errors)
+    for key in obj.keys() - schema.keys():
+        errors.append(f"{where}: unknown key {key!r} (expected {sorted(schema)})")
+    for key, (types, required) in schema.items():
+        if key not in obj:
+            if required:
+                errors.append(f"{where}: missing {key!r}")
+            continue
+        value = obj[key]
+        if not isinstance(value, types) or (isinstance(value, bool) and types is not bool):
+            names = " or ".join(t.__name__ for t in (types if isinstance(types, tuple) else (types,)))
+            errors.append(f"{where}: {key!r} must be {names}, got {value!r}")
+    return len(errors) == found
+
+
+def read_brackets(path: Path, errors: List[str]) -> Optional[np.ndarray]:
+    #A brackets CSV as a (brackets x 4) array of lower, upper, rate, fee; problems go to `errors`
+    try:
+        df = pd.read_csv(path, dtype=str)
+    except (OSError, pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+        errors.append(f"{path.name}: {e}")
+        return None
+    df.columns = df.columns.str.strip()
+    missing = [column for column in BRACKET_COLUMNS if column not in df.columns]
+    if missing:
+        errors.append(f"{path.name}: missing columns {missing}")
+        return None
+    if df.empty:
+        errors.append(f"{path.name}: no brackets")
+        return None
+
+    upper = df["upper"].fillna("inf").str.strip().replace("", "inf")
+    values = pd.concat([df[["lower", "rate", "fee"]], upper.rename("upper")], axis=1)
+    values = values.apply(pd.to_numeric, errors="coerce")[list(BRACKET_COLUMNS)]
+    bad = values.isna()
+    for column in BRACKET_COLUMNS:
+        for row in np.flatnonzero(bad[column]):
+            errors.append(f"{path.name}: row {row + 1}: {column} is not a number ({df[column].iloc[row]!r})")
+    if bad.any(axis=None):
+        return None
+
+    bracket = values.to_numpy(dtype=float)
+    lowers, uppers, rates, fees = bracket.T
+    problems = [
+        (np.any(lowers[1:] <= lowers[:-1]), "lower bounds must increase"),
+        (np.any(uppers <= lowers), "every upper bound must be above its lower bound"),
+        (np.any(uppers[:-1] != lowers[1:]), "each bracket must start where the previous one ends"),
+        (np.isfinite(uppers[-1]), "the top bracket's upper bound must be inf"),
+        (np.any((rates < 0) | (rates > 1)), "rates must be between 0 and 1"),
+        (np.any(fees < 0), "fees must not be negative"),
+    ]
+    for failed, message in problems:
+        if failed:
+            errors.append(f"{path.name}: {message}")
+    return bracket
+
+
+def _read_tax_systems(config_dir: Path, errors: List[str], sources: List[Path]) -> Dict[str, Dict]:
+    #Validated tax_system.json with each table's bracket array; every file read goes to `sources`
+    config_path = config_dir / "tax_system.json"
+    sources.append(config_path)
+    try:
+        cfg = json.loads(config_path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError) as e:
+        errors.append(f"tax_system.json: {e}")
+        return {}
+    if not isinstance(cfg, dict):
+        errors.append("tax_system.json: expected an object of tax systems")
+        return {}
+    if "ltcg" not in cfg:
+        #Older configs keep the LTCG brackets in their own file
+        cfg = {**cfg, "ltcg": {"method": "stacked", "brackets_file": "ltcg_brackets.csv"}}
+    for name in TAX_SYSTEMS:
+        if name not in cfg:
+            errors.append(f"tax_system.json: missing tax system {name!r}")
+
+    systems = {}
+    for name, system in cfg.items():
+        where = f"tax_system.json: {name}"
+        if not _check_fields(system, SYSTEM_SCHEMA, where, errors):
+            continue
+        if system.get("method") not in TAX_METHODS:
+            errors.append(f"{where}: method must be one of {TAX_METHODS}, got {system.get('method')!r}")
+        standard_deduction = float(system.get("standard_deduction", 0.0))
+        if standard_deduction < 0:
+            errors.append(f"{where}: standard_deduction must not be negative")
+
+        specs = {int(system.get("year", BASE_TAX_YEAR)): system}
+        for year, table in system.get("tables", {}).items():
+            if not str(year).isdigit():
+                errors.append(f"{where}: table year {year!r} is not a year")
+            elif _check_fields(table, TABLE_SCHEMA, f"{where}: tables.{year}", errors):
+                specs[int(year)] = table
+
+        tables = {}
+        for year, spec in sorted(specs.items()):
+            brackets_path = config_dir / spec["brackets_file"]
+            sources.append(brackets_path)
+            bracket = read_brackets(brackets_path, errors)
+            if bracket is not None:
+                tables[year] = (float(spec.get("standard_deduction", standard_deduction)), bracket)
+        systems[name] = {
+            "method": system.get("method"),
+            "year": int(system.get("year", BASE_TAX_YEAR)),
+            "standard_deduction": standard_deduction,
+            "round_tax": bool(system.get("round_tax", False)),
+            "indexed": bool(system.get("indexed", True)),
+            "tables": tables,
+        }
+    return systems
+
+
+def _read_account_meta(path: Path, errors: List[str]) -> Optional[pd.DataFrame]:
+    try:
+        meta = pd.read_csv(path, dtype=str)
+    except (OSError, pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+        errors.append(f"{path.name}: {e}")
+        return None
+    missing = [column for column in ("account", "account_type") if column not in meta.columns]
+    if missing:
+        errors.append(f"{path.name}: missing columns {missing}")
+        return None
+    meta["account"] = meta["account"].str.strip()
+    meta["account_type"] = meta["account_type"].str.strip()
+    for row in np.flatnonzero(meta["account"].isna() | (meta["account"] == "")):
+        errors.append(f"{path.name}: row {row + 1}: empty account name")
+    for account in meta["account"][meta["account"].duplicated()].unique():
+        errors.append(f"{path.name}: account {account!r} is listed more than once")
+    for account, account_type in meta[["account", "account_type"]].itertuples(index=False):
+        if account_type not in ACCOUNT_TYPE_INCOME:
+            errors.append(
+                f"{path.name}: unknown account_type {account_type!r} for account {account!r} "
+                f"(expected one of {sorted(ACCOUNT_TYPE_INCOME)})"
+            )
+    return meta
+
+
+def _read_rmd_table(path: Path, errors: List[str]) -> Optional[np.ndarray]:
+    #(rows x 2) array of age, divisor
+    try:
+        table = pd.read_csv(path, encoding="utf-8-sig")
+    except (OSError, pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+        errors.append(f"{path.name}: {e}")
+        return None
+    missing = [column for column in ("age", "divisor") if column not in table.columns]
+    if missing:
+        errors.append(f"{path.name}: missing columns {missing}")
+        return None
+    age = pd.to_numeric(table["age"], errors="coerce")
+    divisor = pd.to_numeric(table["divisor"], errors="coerce")
+    if age.isna().any() or (age != age.round()).any():
+        errors.append(f"{path.name}: ages must be whole numbers")
+    elif age.duplicated().any() or not age.is_monotonic_increasing:
+        errors.append(f"{path.name}: ages must increase with no repeats")
+    if divisor.isna().any() or (divisor <= 0).any():
+        errors.append(f"{path.name}: divisors must be positive numbers")
+    return np.column_stack([age.to_numpy(dtype=float), divisor.to_numpy(dtype=float)])
+
+
+def default_sources(config_dir, account_meta_csv=None, rmd_table_csv=None):
+    config_dir = Path(config_dir)
+    return (
+        Path(account_meta_csv) if account_meta_csv is not None else config_dir / "account_meta.csv",
+        Path(rmd_table_csv) if rmd_table_csv is not None else config_dir / "uniform_lifetime_table.csv",
+    )
+
+
+def bundle_path(config_dir, account_meta_csv=None, rmd_table_csv=None) -> Path:
+    #One bundle per set of source files, so callers with different account_meta / RMD tables don't overwrite each other
+    config_dir = Path(config_dir)
+    sources = [config_dir, *default_sources(config_dir, account_meta_csv, rmd_table_csv)]
+    key = hashlib.sha256("\n".join(str(path.resolve()) for path in sources).encode()).hexdigest()[:12]
+    return config_dir / BUNDLE_DIR / f"config-{key}.bundle"
+
+
+def compile_bundle(config_dir="Config", account_meta_csv=None, rmd_table_csv=None) -> Path:
+    """
+    Validate every Config/ input and write them as one bundle. Raises
+    ValueError listing every problem found (nothing is written then).
+    account_meta.csv and the RMD table are optional; a missing one is
+    recorded, and reading it from the bundle raises.
+    """
+    config_dir = Path(config_dir)
+    account_meta_csv, rmd_table_csv = default_sources(config_dir, account_meta_csv, rmd_table_csv)
+    errors, sources = [], []
+    systems = _read_tax_systems(config_dir, errors, sources)
+
+    meta = rmd = None
+    if account_meta_csv.exists():
+        meta = _read_account_meta(account_meta_csv, errors)
+    if rmd_table_csv.exists():
+        rmd = _read_rmd_table(rmd_table_csv, errors)
+    if errors:
+        raise ValueError(f"Invalid config in {config_dir}:\n  - " + "\n  - ".join(errors))
+
+    arrays = {}
+    header_systems = {}
+    for name, system in systems.items():
+        tables = {}
+        for year, (standard_deduction, bracket) in system["tables"].items():
+            arrays[f"tax/{name}/{year}"] = bracket
+            tables[str(year)] = standard_deduction
+        header_systems[name] = {**system, "tables": tables}
+    if rmd is not None:
+        arrays["rmd"] = rmd
+
+    header = {
+        "version": BUNDLE_VERSION,
+        "sources": {str(path.resolve()): file_hash(path) for path in dict.fromkeys([*sources, account_meta_csv, rmd_table_csv])},
+        "tax_systems": header_systems,
+        "accounts": None if meta is None else meta[["account", "account_type"]].values.tolist(),
+        "arrays": {},
+    }
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array, dtype="<f8")
+        arrays[name] = array
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += -(-array.nbytes // _ALIGN) * _ALIGN
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    start = -(-(len(MAGIC) + _LENGTH.size + len(header_bytes)) // _ALIGN) * _ALIGN
+    path = bundle_path(config_dir, account_meta_csv, rmd_table_csv)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + _LENGTH.pack(len(header_bytes)) + header_bytes)
+        for name, array in arrays.items():
+            f.seek(start + header["arrays"][name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(start + offset)
+    os.replace(tmp, path)        #atomic, so concurrent runs and workers never see a half written bundle
+    return path
+
+
+class ConfigBundle:
+    """
+    A compiled bundle mapped into memory. Arrays are read-only views into the
+    mapping; the tax_systems / account_tax_map / rmd_table properties build
+    the structures the engines use from them.
+    """
+
+    def __init__(self, path, header: Dict, buffer, data_start: int):
+        self.path = Path(path)
+        self.header = header
+        self._buffer = buffer
+        self._data_start = data_start
+
+    @classmethod
+    def open(cls, path) -> "ConfigBundle":
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a config bundle")
+        (length,) = _LENGTH.unpack_from(buffer, len(MAGIC))
+        header_end = len(MAGIC) + _LENGTH.size + length
+        header = json.loads(buffer[len(MAGIC) + _LENGTH.size:header_end])
+        return cls(path, header, buffer, -(-header_end // _ALIGN) * _ALIGN)
+
+    @property
+    def digest(self) -> str:
+        #sha256 over the format version and every source file's hash: bundles compiled from the same files share it
+        sources = json.dumps([self.header.get("version"), sorted(self.header["sources"].items())])
+        return hashlib.sha256(sources.encode()).hexdigest()
+
+    def __eq__(self, other) -> bool:
+        #Equal when mapped from the same path and compiled from identical sources (the tax_engine cache key)
+        return isinstance(other, ConfigBundle) and (self.path, self.digest) == (other.path, other.digest)
+
+    def __hash__(self) -> int:
+        return hash((self.path, self.digest))
+
+    def is_current(self) -> bool:
+        #Same format version and every source file unchanged (a file that appeared or vanished counts as a change)
+        return self.header.get("version") == BUNDLE_VERSION and all(
+            file_hash(path) == digest for path, digest in self.header["sources"].items()
+        )
+
+    def array(self, name: str) -> np.ndarray:
+        spec = self.header["arrays"][name]
+        shape = tuple(spec["shape"])
+        return np.frombuffer(
+            self._buffer, np.dtype(spec["dtype"]), count=int(np.prod(shape)), offset=self._data_start + spec["offset"]
+        ).reshape(shape)
+
+    @property
+    def tax_systems(self) -> Dict[str, dict]:
+        systems = {}
+        for name, system in self.header["tax_systems"].items():
+            tables = {}
+            for year, standard_deduction in system["tables"].items():
+                bracket = self.array(f"tax/{name}/{year}")
+                tables[int(year)] = (standard_deduction, tuple(bracket.T))
+            systems[name] = {
+                "method": system["method"],
+                "standard_deduction": system["standard_deduction"],
+                "round_tax": system["round_tax"],
+                "bracket": tables[system["year"]][1],
+                "indexed": system["indexed"],
+                "tables": tables,
+            }
+        return systems
+
+    @property
+    def account_tax_map(self) -> pd.DataFrame:
+        if self.header["accounts"] is None:
+            raise FileNotFoundError(f"No account_meta.csv was compiled into {self.path}")
+        return pd.DataFrame(self.header["accounts"], columns=["account", "account_type"]).set_index("account")
+
+    @property
+    def rmd_table(self) -> Dict[int, float]:
+        if "rmd" not in self.header["arrays"]:
+            raise FileNotFoundError(f"No RMD table was compiled into {self.path}")
+        ages, divisors = self.array("rmd").T
+        return dict(zip(ages.astype(int).tolist(), divisors.tolist()))
+
+
+def load_bundle(config_dir="Config", account_meta_csv=None, rmd_table_csv=None) -> ConfigBundle:
+    #The bundle for these sources, compiled first when it is missing, from another format version, or stale
+    path = bundle_path(config_dir, account_meta_csv, rmd_table_csv)
+    try:
+        bundle = ConfigBundle.open(path)
+        if bundle.is_current():
+            return bundle
+    except (OSError, ValueError):
+        pass
+    return ConfigBundle.open(compile_bundle(config_dir, account_meta_csv, rmd_table_csv))
+
+
+def main(argv: List[str]) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Validate Config/ and compile it into a binary bundle")
+    parser.add_argument("config_dir", nargs="?", default="Config")
+    parser.add_argument("--account-meta", help="account_meta.csv outside the config directory")
+    parser.add_argument("--rmd-table", help="uniform_lifetime_table.csv outside the config directory")
+    args = parser.parse_args(argv)
+
+    try:
+        path = compile_bundle(args.config_dir, args.account_meta, args.rmd_table)
+    except ValueError as e:
+        sys.exit(str(e))
+    print(f"Wrote {path} ({path.stat().st_size} bytes)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
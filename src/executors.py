@@ -0,0 +1,276 @@
+import multiprocessing
+import os
+import pickle
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+from shared_data import SharedData, attached
+
+# Executors run fn(context, task) for every task and yield (task index, result)
+# as tasks finish, in any order. `context` is the large read-only input shared
+# by every task (a compiled plan, assumptions, ...); tasks are small (a chunk
+# of paths, a scenario). Callers merge results in task order themselves, so
+# swapping the executor never changes the answer.
+#
+#   InProcessExecutor()             run in this process
+#   PoolExecutor(workers)           local process pool, context in shared memory
+#   SpoolExecutor(directory)        work queue in a shared directory, served by
+#                                   `python src/executors.py worker <directory>`
+#                                   on any number of nodes
+#
+# Every backend retries a failed task up to max_retries times and reports
+# progress(done, total) after each task.
+
+
+class TaskFailed(RuntimeError):
+    pass
+
+
+def print_progress(done: int, total: int) -> None:
+    print(f"\r{done}/{total} chunks", end="\n" if done == total else "", flush=True)
+
+
+def _run_task(fn, context, task):
+    #(ok, result or formatted traceback) so worker errors come back as data
+    try:
+        return True, fn(context, task)
+    except Exception:
+        return False, traceback.format_exc()
+
+
+class InProcessExecutor:
+
+    def __init__(self, max_retries: int = 2, progress: Callable | None = None):
+        self.max_retries = max_retries
+        self.progress = progress
+
+    def map(self, fn, context, tasks: Sequence) -> Iterator[Tuple[int, object]]:
+        for i, task in enumerate(tasks):
+            for attempt in range(self.max_retries + 1):
+                ok, result = _run_task(fn, context, task)
+                if ok:
+                    break
+            if not ok:
+                raise TaskFailed(f"Task {i} failed after {self.max_retries + 1} attempts:\n{result}")
+            if self.progress:
+                self.progress(i + 1, len(tasks))
+            yield i, result
+
+
+def _pool_call(args):
+    fn, handle, index, task = args
+    ok, result = _run_task(fn, attached(handle), task)
+    return index, ok, result
+
+
+class PoolExecutor:
+
+    def __init__(self, workers: int | None = None, max_retries: int = 2, progress: Callable | None = None):
+        self.workers = workers or os.cpu_count()
+        self.max_retries = max_retries
+        self.progress = progress
+
+    def map(self, fn, context, tasks: Sequence) -> Iterator[Tuple[int, object]]:
+        attempts = [0] * len(tasks)
+        pending = list(range(len(tasks)))
+        done = 0
+        with SharedData.publish(context) as shared, multiprocessing.Pool(self.workers) as pool:
+            while pending:
+                retry = []
+                calls = [(fn, shared.handle, i, tasks[i]) for i in pending]
+                for i, ok, result in pool.imap_unordered(_pool_call, calls):
+                    if not ok:
+                        attempts[i] += 1
+                        if attempts[i] > self.max_retries:
+                            raise TaskFailed(f"Task {i} failed after {attempts[i]} attempts:\n{result}")
+                        retry.append(i)
+                        continue
+                    done += 1
+                    if self.progress:
+                        self.progress(done, len(tasks))
+                    yield i, result
+                pending = retry
+
+
+# Spool layout, one file per task named <run id>-<task index>.pkl:
+#   context/<run id>.pkl   shared input, loaded once per worker per run
+#   pending/               waiting tasks: (fn, task, attempts)
+#   running/               claimed by a worker (atomic rename), kept fresh by its heartbeat
+#   done/                  results
+#   failed/                tracebacks of tasks out of retries
+SPOOL_DIRS = ("context", "pending", "running", "done", "failed")
+
+
+def _write_atomic(path: Path, obj) -> None:
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp, "wb") as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def _read(path: Path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+class SpoolExecutor:
+
+    def __init__(
+        self,
+        directory,
+        local_workers: int = 0,
+        max_retries: int = 2,
+        lease_timeout: float = 300.0,
+        poll_interval: float = 0.2,
+        progress: Callable | None = None,
+    ):
+        #local_workers > 0 also starts that many worker processes on this machine
+        self.directory = Path(directory)
+        self.local_workers = local_workers
+        self.max_retries = max_retries
+        self.lease_timeout = lease_timeout
+        self.poll_interval = poll_interval
+        self.progress = progress
+        for name in SPOOL_DIRS:
+            (self.directory / name).mkdir(parents=True, exist_ok=True)
+
+    def _start_local_workers(self) -> List[subprocess.Popen]:
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(Path(__file__).parent), os.environ.get("PYTHONPATH")])))
+        return [
+            subprocess.Popen([sys.executable, __file__, "worker", str(self.directory)], env=env)
+            for _ in range(self.local_workers)
+        ]
+
+    def _requeue_stale(self, run_id: str) -> None:
+        #A task whose worker stopped heart-beating goes back to pending (the worker died or lost the share)
+        now = time.time()
+        for path in (self.directory / "running").glob(f"{run_id}-*"):
+            try:
+                if now - path.stat().st_mtime > self.lease_timeout:
+                    os.replace(path, self.directory / "pending" / path.name.split("@")[0])
+            except FileNotFoundError:
+                pass
+
+    def map(self, fn, context, tasks: Sequence) -> Iterator[Tuple[int, object]]:
+        run_id = uuid.uuid4().hex[:12]
+        _write_atomic(self.directory / "context" / f"{run_id}.pkl", {"context": context, "max_retries": self.max_retries})
+        for i, task in enumerate(tasks):
+            _write_atomic(self.directory / "pending" / f"{run_id}-{i}.pkl", (fn, task, 0))
+
+        workers = self._start_local_workers()
+        remaining = set(range(len(tasks)))
+        try:
+            while remaining:
+                found = False
+                for path in sorted((self.directory / "done").glob(f"{run_id}-*.pkl")):
+                    i = int(path.stem.split("-")[1])
+                    result = _read(path)
+                    path.unlink()
+                    if i in remaining:
+                        remaining.discard(i)
+                        found = True
+                        if self.progress:
+                            self.progress(len(tasks) - len(remaining), len(tasks))
+                        yield i, result
+                for path in (self.directory / "failed").glob(f"{run_id}-*.pkl"):
+                    raise TaskFailed(f"Task {path.stem} failed after {self.max_retries + 1} attempts:\n{_read(path)}")
+                if not found:
+                    self._requeue_stale(run_id)
+                    time.sleep(self.poll_interval)
+        finally:
+            for proc in workers:
+                proc.terminate()
+            for proc in workers:
+                proc.wait()
+            for name in ("pending", "running", "done", "failed"):
+                for path in (self.directory / name).glob(f"{run_id}-*"):
+                    path.unlink(missing_ok=True)
+            (self.directory / "context" / f"{run_id}.pkl").unlink(missing_ok=True)
+
+
+def _heartbeat(path: Path, stop: threading.Event, interval: float) -> None:
+    while not stop.wait(interval):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return
+
+
+def spool_worker(directory, poll_interval: float = 0.5, heartbeat: float = 30.0, idle_exit: float | None = None) -> None:
+    """
+    Serve tasks from a spool directory until stopped (or idle for idle_exit
+    seconds). Start one per core on every node that can see the directory.
+    """
+    directory = Path(directory)
+    worker_id = f"{socket.gethostname()}.{os.getpid()}"
+    contexts: Dict[str, Dict] = {}
+    idle_since = time.time()
+
+    while True:
+        claimed = None
+        for path in sorted((directory / "pending").glob("*.pkl")):
+            target = directory / "running" / f"{path.name}@{worker_id}"
+            try:
+                os.rename(path, target)
+            except OSError:
+                continue                            #another worker got it first
+            os.utime(target)                        #the lease starts now, not when the task was queued
+            claimed = target
+            break
+
+        if claimed is None:
+            if idle_exit is not None and time.time() - idle_since > idle_exit:
+                return
+            time.sleep(poll_interval)
+            continue
+
+        name = claimed.name.split("@")[0]
+        run_id = name.split("-")[0]
+        stop = threading.Event()
+        threading.Thread(target=_heartbeat, args=(claimed, stop, heartbeat), daemon=True).start()
+        try:
+            if run_id not in contexts:
+                contexts.clear()                    #keep only the current run's context in memory
+                contexts[run_id] = _read(directory / "context" / f"{run_id}.pkl")
+            fn, task, attempts = _read(claimed)
+            ok, result = _run_task(fn, contexts[run_id]["context"], task)
+            if ok:
+                _write_atomic(directory / "done" / name, result)
+            elif attempts < contexts[run_id]["max_retries"]:
+                _write_atomic(directory / "pending" / name, (fn, task, attempts + 1))
+            else:
+                _write_atomic(directory / "failed" / name, result)
+        except FileNotFoundError:
+            pass                                    #run was cancelled and cleaned up
+        finally:
+            stop.set()
+            claimed.unlink(missing_ok=True)
+        idle_since = time.time()
+
+
+def get_executor(spec=None, progress: Callable | None = None):
+    #"inprocess", "pool" / "pool:8", "spool:/shared/dir" / "spool:/shared/dir:4" (4 local workers), or an executor
+    if spec is None or spec == "inprocess":
+        return InProcessExecutor(progress=progress)
+    if not isinstance(spec, str):
+        return spec
+    kind, _, arg = spec.partition(":")
+    if kind == "pool":
+        return PoolExecutor(int(arg) if arg else None, progress=progress)
+    if kind == "spool":
+        directory, _, local = arg.rpartition(":") if arg.rpartition(":")[2].isdigit() else (arg, "", "0")
+        return SpoolExecutor(directory, local_workers=int(local), progress=progress)
+    raise ValueError(f"Unknown executor: {spec}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "worker":
+        sys.exit("usage: python executors.py worker <spool directory>")
+    spool_worker(sys.argv[2])
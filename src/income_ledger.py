@@ -0,0 +1,157 @@
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from income_types import INCOME_TYPES, INCOME_TYPE_BUCKETS, TAX_BUCKETS
+
+
+class IncomeLedger:
+    """
+    Columnar record of every income amount the projection booked for tax.
+
+    Rows are kept as parallel arrays (month index, source ID, income type ID,
+    account ID, amount) in month order. Source and account names are interned,
+    so a row is five numbers instead of an IncomeEvent + IncomeSource.
+    Amounts are in real (basis year) dollars; the tax engine taxes them
+    in nominal dollars of their month.
+    """
+
+    def __init__(self, dates):
+        self.dates = pd.DatetimeIndex(dates)
+        self.sources: List[str] = []
+        self.accounts: List[str] = []
+        self._source_ids: Dict[str, int] = {}
+        self._account_ids: Dict[str, int] = {}
+        self._columns = ([], [], [], [], [])
+        self._arrays = None
+
+    def _intern(self, names, ids, name) -> int:
+        if name not in ids:
+            ids[name] = len(names)
+            names.append(name)
+        return ids[name]
+
+    def record(self, month_idx: int, entries) -> None:
+        #entries: iterable of (source name, income type ID, account name, amount)
+        month, source, income_type, account, amount = self._columns
+        for source_name, type_id, account_name, value in entries:
+            month.append(month_idx)
+            source.append(self._intern(self.sources, self._source_ids, source_name))
+            income_type.append(type_id)
+            account.append(self._intern(self.accounts, self._account_ids, account_name))
+            amount.append(value)
+        self._arrays = None
+
+    def _finalize(self):
+        if self._arrays is None:
+            month, source, income_type, account, amount = self._columns
+            self._arrays = {
+                "month": np.array(month, dtype=np.int32),
+                "source": np.array(source, dtype=np.int32),
+                "income_type": np.array(income_type, dtype=np.int16),
+                "account": np.array(account, dtype=np.int32),
+                "amount": np.array(amount, dtype=float),
+            }
+        return self._arrays
+
+    @property
+    def month(self) -> np.ndarray:
+        return self._finalize()["month"]
+
+    @property
+    def source(self) -> np.ndarray:
+        return self._finalize()["source"]
+
+    @property
+    def income_type(self) -> np.ndarray:
+        return self._finalize()["income_type"]
+
+    @property
+    def account(self) -> np.ndarray:
+        return self._finalize()["account"]
+
+    @property
+    def amount(self) -> np.ndarray:
+        return self._finalize()["amount"]
+
+    def __len__(self) -> int:
+        return len(self._columns[0])
+
+    def _year_groups(self):
+        #Start row and year of each run of rows in the same tax year
+        years = self.dates.year.to_numpy()[self.month]
+        if len(years) == 0:
+            return np.array([], dtype=int), years
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(years)) + 1])
+        return starts, years[starts]
+
+    def by_year(self) -> pd.Series:
+        starts, years = self._year_groups()
+        totals = np.add.reduceat(self.amount, starts) if len(starts) else np.array([])
+        return pd.Series(totals, index=pd.Index(years, name="year"), name="amount")
+
+    def by_year_and_bucket(self) -> pd.DataFrame:
+        #Tax buckets (federal ordinary, LTCG, VA ordinary, ...) each year's income landed in
+        starts, years = self._year_groups()
+        bucket_amounts = self.amount[:, None] * INCOME_TYPE_BUCKETS[self.income_type]
+        totals = np.add.reduceat(bucket_amounts, starts, axis=0) if len(starts) else np.zeros((0, len(TAX_BUCKETS)))
+        return pd.DataFrame(totals, index=pd.Index(years, name="year"), columns=list(TAX_BUCKETS))
+
+    def by_source(self) -> pd.Series:
+        totals = np.bincount(self.source, weights=self.amount, minlength=len(self.sources))
+        return pd.Series(totals, index=pd.Index(self.sources, name="source"), name="amount")
+
+    def by_year_and_source(self) -> pd.DataFrame:
+        starts, years = self._year_groups()
+        year_idx = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(self))))
+        totals = np.zeros((len(starts), len(self.sources)))
+        np.add.at(totals, (year_idx, self.source), self.amount)
+        return pd.DataFrame(totals, index=pd.Index(years, name="year"), columns=self.sources)
+
+    def to_frame(self) -> pd.DataFrame:
+        income_type_names = np.array([type(t).__name__ for t in INCOME_TYPES])
+        return pd.DataFrame({
+            "Date": self.dates[self.month],
+            "source": np.array(self.sources, dtype=object)[self.source],
+            "income_type": income_type_names[self.income_type],
+            "account": np.array(self.accounts, dtype=object)[self.account],
+            "amount": self.amount,
+        })
+
+    def save(self, path: str | Path) -> None:
+        arrays = self._finalize()
+        np.savez_compressed(
+            path,
+            dates=self.dates.to_numpy(dtype="datetime64[ns]"),
+            sources=np.array(self.sources, dtype=str),
+            accounts=np.array(self.accounts, dtype=str),
+            **arrays,
+        )
+
+    @classmethod
+    def from_arrays(cls, dates, sources, accounts, month, source, income_type, account, amount) -> "IncomeLedger":
+        #Ledger from already interned columns (rows in month order)
+        ledger = cls(dates)
+        ledger.sources = list(sources)
+        ledger.accounts = list(accounts)
+        ledger._source_ids = {name: i for i, name in enumerate(ledger.sources)}
+        ledger._account_ids = {name: i for i, name in enumerate(ledger.accounts)}
+        ledger._arrays = {
+            "month": np.asarray(month, dtype=np.int32),
+            "source": np.asarray(source, dtype=np.int32),
+            "income_type": np.asarray(income_type, dtype=np.int16),
+            "account": np.asarray(account, dtype=np.int32),
+            "amount": np.asarray(amount, dtype=float),
+        }
+        ledger._columns = tuple(ledger._arrays[key].tolist() for key in ("month", "source", "income_type", "account", "amount"))
+        return ledger
+
+    @classmethod
+    def load(cls, path: str | Path) -> "IncomeLedger":
+        with np.load(path) as data:
+            return cls.from_arrays(
+                data["dates"], data["sources"].tolist(), data["accounts"].tolist(),
+                *(data[key] for key in ("month", "source", "income_type", "account", "amount")),
+            )
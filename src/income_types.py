@@ -2,6 +2,8 @@ from abc import ABC, abstractmethod
 from dataclasses import dataclass, field, asdict
 from typing import Dict, Any
 
+import numpy as np
+
 @dataclass
 class TaxResult:
     federal_ordinary_income: float = 0.0
@@ -45,6 +47,13 @@ class TaxResult:
     def zero(cls) -> "TaxResult":
         return cls()
 
+    def to_array(self) -> np.ndarray:
+        return np.array([getattr(self, name) for name in TAX_BUCKETS])
+
+    @classmethod
+    def from_array(cls, values) -> "TaxResult":
+        return cls(*(float(v) for v in values))
+
 
 class IncomeType(ABC):
 
@@ -141,6 +150,67 @@ class CapitalAssetSaleIncome(IncomeType):
                 va_ordinary_income=gain
             )
 
+TAX_BUCKETS = tuple(TaxResult.__dataclass_fields__)
+
+#IncomeType classes hold no state, so every event shares one instance per type.
+#An income type ID is the position of its instance in INCOME_TYPES.
+INCOME_TYPES = (
+    EarnedIncome(),
+    SelfEmploymentIncome(),
+    InterestIncome(),
+    QualifiedDividendIncome(),
+    ShortTermCapitalGainIncome(),
+    LongTermCapitalGainIncome(),
+    RetirementDistributionIncome(),
+    RothDistributionIncome(),
+    SocialSecurityIncome(),
+    MunicipalBondInterestIncome(),
+    CapitalAssetSaleIncome(),
+)
+INCOME_TYPE_IDS = {type(income_type): i for i, income_type in enumerate(INCOME_TYPES)}
+NO_INCOME_TYPE = -1
+
+#Tax buckets for $1 of each income type: (types x TAX_BUCKETS).
+#CapitalAssetSaleIncome depends on basis/proceeds so its row is zero.
+INCOME_TYPE_BUCKETS = np.array([
+    [getattr(income_type.classify_for_tax(1.0), name) for name in TAX_BUCKETS]
+    for income_type in INCOME_TYPES
+])
+
+def income_type_id(income_type_cls) -> int:
+    return INCOME_TYPE_IDS[income_type_cls]
+
+#Income type of a withdrawal from each account_type in account_meta.csv (None: not taxed as a distribution)
+ACCOUNT_TYPE_INCOME = {
+    "401k": RetirementDistributionIncome,
+    "403b": RetirementDistributionIncome,
+    "457b": RetirementDistributionIncome,
+    "traditional_ira": RetirementDistributionIncome,
+    "annuity": RetirementDistributionIncome,
+    "pension": RetirementDistributionIncome,
+    "tsp": RetirementDistributionIncome,
+    "roth_conv": EarnedIncome,
+    "salary": EarnedIncome,
+    "roth_ira": RothDistributionIncome,
+    "roth_401k": RothDistributionIncome,
+    "roth_tsp": RothDistributionIncome,
+    "brokerage": None,
+    "cash": None,
+}
+
+def compile_account_classification(account_tax_map) -> Dict[str, int]:
+    #Account name -> income type ID, checked once when account_meta.csv is loaded
+    classification = {}
+    for acct, account_type in account_tax_map["account_type"].items():
+        if account_type not in ACCOUNT_TYPE_INCOME:
+            raise ValueError(
+                f"Unknown account_type {account_type!r} for account {acct!r} in account_meta "
+                f"(expected one of {sorted(ACCOUNT_TYPE_INCOME)})"
+            )
+        income_type_cls = ACCOUNT_TYPE_INCOME[account_type]
+        classification[acct] = NO_INCOME_TYPE if income_type_cls is None else income_type_id(income_type_cls)
+    return classification
+
 @dataclass
 class IncomeSource:
 
@@ -0,0 +1,341 @@
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from income_ledger import IncomeLedger
+from income_types import INCOME_TYPES, INCOME_TYPE_BUCKETS, NO_INCOME_TYPE
+from monte_carlo import compile_projection
+from price_index import constant_price_index, month_ordinal
+from projection_engine import (
+    INTEREST,
+    LOT_SALE_SOURCES,
+    PENSION_START,
+    QUALIFIED_DIVIDEND,
+    RETIREMENT_DISTRIBUTION,
+    SOCIAL_SECURITY,
+    opening_brokerage_cost,
+    projection_engine,
+)
+from run_projection import Inputs, Result, parse_assumptions
+from tax_lots import TaxLots, check_lot_method
+from tax_engine import compile_tax_schedule, tax_engine_vec, tax_tables_for_year
+
+# projection_engine split into stages, so an assumption edit only recomputes
+# what it can change:
+#
+#   balances  the monthly loop: growth, withdrawals, RMDs, Roth conversions, cashflows
+#   real      deflators and every nominal <-> real conversion
+#   income    taxable income by type (the income ledger) and income totals
+#   tax       YTD federal / Medicare / Virginia tax and net income
+#
+#   incremental = IncrementalProjection(inputs)
+#   incremental.run()                                  #every stage
+#   incremental.run({"brokerage_qdiv_yield": 0.02})    #income and tax, balances reused
+#   incremental.recomputed                             #("income", "tax")
+#
+# Only the balances stage runs month by month (it is projection_engine itself);
+# the others are vectorised over months from its trace, and match it to
+# rounding. The income stage also replays the Brokerage tax lots from the
+# trace (one TaxLots pass, a few ms), so yield and lot method edits don't
+# re-run the balances.
+
+STAGES = ("balances", "real", "income", "tax")
+
+STAGE_DEPENDS = {
+    "balances": (),
+    "real": ("balances",),
+    "income": ("balances", "real"),
+    "tax": ("real", "income"),
+}
+
+#Columns of projection_engine's output each stage produces (balances also owns the account columns)
+STAGE_COLUMNS = {
+    "balances": ("Age", "Withdrawal", "Withdrawal Shortfall", "RMD Extra", "ROTH Conversion", "Net_Worth"),
+    "real": ("Withdrawal_real", "ROTH Conversion Real", "Pension", "Pension_Real", "Net_Worth_Real"),
+    "income": ("qdiv real", "interest real", "Income", "Income_Real"),
+    "tax": ("Fed Tax", "Medicare Tax", "VA Tax", "Total Tax", "Net_Income_Real"),
+}
+
+#Assumptions read outside the monthly loop; any other assumption feeds the balances stage
+STAGE_ASSUMPTIONS = {
+    "real": {"inflation", "basis", "pension", "pension_start"},
+    "income": {
+        "brokerage_interest_yield",
+        "brokerage_qdiv_yield",
+        "brokerage_ltcg_realization_ratio",
+        "brokerage_lot_method",
+        "ssa_benefit",
+        "service_length",
+    },
+    "tax": {"inflation", "filing_status"},
+}
+
+#Assumptions projection_engine doesn't read (Monte Carlo / pension estimate inputs)
+UNUSED_ASSUMPTIONS = {
+    "mra",
+    "high_3",
+    "annual_volatility",
+    "inflation_volatility",
+    "inflation_persistence",
+    "inflation_return_correlation",
+}
+
+#Withdrawal strategies whose draws depend only on balances, age and the rate
+BALANCE_ONLY_STRATEGIES = {"VPW", "vpw_age", "rmd"}
+#Strategies that also index their draw by inflation
+INFLATION_INDEXED_STRATEGIES = {"4pct", "guyton_klinger", "floor_ceiling"}
+#Any other strategy ("net", plugins) may read the tax context, so every assumption reaches its draws
+
+
+def stages_to_recompute(changed: Iterable[str], withdrawal_type: str) -> List[str]:
+    #Stages invalidated by the changed assumption keys, plus everything downstream of them
+    stages = set()
+    for key in changed:
+        if key in UNUSED_ASSUMPTIONS:
+            continue
+        direct = {stage for stage, keys in STAGE_ASSUMPTIONS.items() if key in keys}
+        if (
+            not direct
+            or withdrawal_type not in BALANCE_ONLY_STRATEGIES | INFLATION_INDEXED_STRATEGIES
+            or (key == "inflation" and withdrawal_type in INFLATION_INDEXED_STRATEGIES)
+        ):
+            direct = {"balances"}
+        stages |= direct
+
+    for stage in STAGES:
+        if any(dep in stages for dep in STAGE_DEPENDS[stage]):
+            stages.add(stage)
+    return [stage for stage in STAGES if stage in stages]
+
+
+class IncrementalProjection:
+    """
+    projection_engine that keeps its last run. run(scenario) diffs the new
+    assumptions against the previous run's and recomputes only the stages
+    they invalidate; every other column (and the income ledger, when the
+    income stage is clean) is reused. Deterministic projection only: the
+    monte_carlo / sensitivity sections of a scenario are ignored.
+    """
+
+    def __init__(self, inputs: Inputs):
+        self.inputs = inputs
+        self.assumptions: Optional[Dict] = None
+        self.outputs: Dict[str, Dict] = {}
+        self.frame: Optional[pd.DataFrame] = None
+        self.plan: Optional[Dict] = None
+        self.recomputed: tuple = ()
+
+    def run(self, scenario: Optional[Dict] = None) -> Result:
+        #scenario: config overrides on top of the loaded config, as run_projection.run
+        cfg = {**self.inputs.cfg, **(scenario or {})}
+        assumptions = parse_assumptions(cfg) if scenario else self.inputs.assumptions
+
+        if self.assumptions is None or assumptions["horizon"] != self.assumptions["horizon"]:
+            stages = list(STAGES)
+        else:
+            changed = [
+                key for key in assumptions.keys() | self.assumptions.keys()
+                if assumptions.get(key) != self.assumptions.get(key)
+            ]
+            stages = stages_to_recompute(changed, assumptions["withdrawal_type"])
+
+        for stage in stages:
+            getattr(self, f"_{stage}")(assumptions)
+        self.assumptions = assumptions
+        self.recomputed = tuple(stages)
+
+        projection = self.frame.copy()
+        for stage in ("real", "income", "tax"):
+            for column in STAGE_COLUMNS[stage]:
+                projection[column] = self.outputs[stage][column]
+        return Result(cfg=cfg, assumptions=assumptions, projection=projection, ledger=self.outputs["income"]["ledger"])
+
+    def _balances(self, assumptions: Dict) -> None:
+        inputs = self.inputs
+        months = inputs.months
+        if assumptions["horizon"] != inputs.assumptions["horizon"]:
+            months = pd.date_range(inputs.months[0], assumptions["horizon"], freq="MS")
+
+        self.plan = compile_projection(
+            inputs.account_tax_map, inputs.rmd_table, inputs.start_bal, inputs.cf, months, assumptions,
+            balances_actuals=inputs.balances_actuals, config_sources=inputs.config_sources,
+        )
+        trace = []
+        self.frame = projection_engine(
+            inputs.account_tax_map,
+            inputs.rmd_table,
+            inputs.start_bal,
+            inputs.cf,
+            months,
+            assumptions,
+            balances_actuals=inputs.balances_actuals,
+            trace=trace,
+            config_sources=inputs.config_sources,
+        )
+        accounts = self.plan["accounts"]
+        self.outputs["balances"] = {
+            "draws": np.array([[draws.get(acct, 0.0) for acct in accounts] for draws, _, _ in trace]).reshape(len(months), len(accounts)),
+            "brokerage_balance": np.array([balance for _, balance, _ in trace], dtype=float),
+            "brokerage_marked": np.array([marked for _, _, marked in trace], dtype=float),
+            "RMD Extra": self.frame["RMD Extra"].to_numpy(dtype=float),
+            "balances": self.frame[accounts].to_numpy(dtype=float),
+            "Withdrawal": self.frame["Withdrawal"].to_numpy(dtype=float),
+            "ROTH Conversion": self.frame["ROTH Conversion"].to_numpy(dtype=float),
+        }
+
+    def _real(self, assumptions: Dict) -> None:
+        balances = self.outputs["balances"]
+        price_index = constant_price_index(self.plan["months"], assumptions["basis"], assumptions["inflation"])
+        price_level = price_index.levels[0]
+        deflator = 1.0 / price_level
+
+        pension_real = assumptions["pension"]
+        pension_start = assumptions.get("pension_start", PENSION_START)
+        pension = np.where(
+            self.plan["months"] >= pension_start,
+            pension_real*(price_level / price_index.at(month_ordinal(pension_start))[0]),
+            0.0,
+        )
+        self.outputs["real"] = {
+            "price_level": price_level,
+            "deflator": deflator,
+            "Withdrawal_real": balances["Withdrawal"] * deflator,
+            "ROTH Conversion Real": balances["ROTH Conversion"] * deflator,
+            "Pension": pension,
+            "Pension_Real": np.full(len(price_level), pension_real),
+            "Net_Worth_Real": (balances["balances"] * deflator[:, None]).sum(axis=1),
+        }
+
+    def _income(self, assumptions: Dict) -> None:
+        #Books the same monthly_income entries as projection_engine, for every month at once
+        plan = self.plan
+        balances = self.outputs["balances"]
+        real = self.outputs["real"]
+        deflator = real["deflator"]
+        n_months = len(deflator)
+        accounts = plan["accounts"]
+        tsp_idx = plan["tsp_idx"]
+
+        draws_real = balances["draws"] * deflator[:, None]
+        if tsp_idx >= 0:
+            draws_real[:, tsp_idx] += real["ROTH Conversion Real"]
+
+        brokerage_balance = balances["brokerage_balance"]
+        interest_real = brokerage_balance*assumptions["brokerage_interest_yield"]/12
+        qdiv_real = brokerage_balance*assumptions["brokerage_qdiv_yield"]/12
+
+        ssa_benefit = assumptions["ssa_benefit"]
+        spec_annuity = np.where(plan["spec_annuity_window"], ssa_benefit * assumptions["service_length"]/40, 0.0)
+        ssa_window = plan["ssa_window"]
+        ssa_annuity = np.where(ssa_window, ssa_benefit*0.8*real["price_level"], 0.0)
+        ssa_annuity_real = np.where(ssa_window, ssa_benefit*0.8, 0.0)
+
+        entries = [
+            ("Brokerage Interest", INTEREST, "Brokerage", interest_real),
+            ("Brokerage Qualified Dividends", QUALIFIED_DIVIDEND, "Brokerage", qdiv_real),
+        ]
+        for i, acct in enumerate(accounts):
+            type_ids = np.flatnonzero(plan["account_income"][i])
+            if len(type_ids):
+                entries.append((f"{acct} Withdrawal", type_ids[0], acct, draws_real[:, i]))
+        if plan["ssa_type"] != NO_INCOME_TYPE:
+            entries.append(("SSA Annuity Withdrawal", plan["ssa_type"], "SSA Annuity", ssa_annuity_real))
+        entries += [
+            ("FERS", RETIREMENT_DISTRIBUTION, "FERS", np.full(n_months, float(assumptions["pension"]))),
+            ("Social Security", SOCIAL_SECURITY, "SSA", ssa_annuity_real),
+        ]
+        gains = self._lot_gains(assumptions, qdiv_real)
+        for source, (type_id, long_term) in LOT_SALE_SOURCES.items():
+            entries.append((source, type_id, "Brokerage", gains[long_term] * deflator))
+
+        #Only positive amounts are booked; sources that never book anything stay out of the ledger
+        amounts = np.column_stack([amount for _, _, _, amount in entries])
+        booked = amounts > 0
+        used = np.flatnonzero(booked.any(axis=0))
+        entries = [entries[j] for j in used]
+        amounts, booked = amounts[:, used], booked[:, used]
+        type_ids = np.array([type_id for _, type_id, _, _ in entries], dtype=int)
+
+        income_by_type = np.where(booked, amounts, 0.0) @ np.eye(len(INCOME_TYPES))[type_ids]
+
+        ledger_accounts = list(dict.fromkeys(acct for _, _, acct, _ in entries))
+        account_ids = np.array([ledger_accounts.index(acct) for _, _, acct, _ in entries], dtype=int)
+        month, source = np.nonzero(booked)                       #row major, so rows are in month order
+        ledger = IncomeLedger.from_arrays(
+            plan["months"], [name for name, _, _, _ in entries], ledger_accounts,
+            month, source, type_ids[source], account_ids[source], amounts[month, source],
+        )
+
+        pension_real = assumptions["pension"]
+        self.outputs["income"] = {
+            "income_by_type": income_by_type,
+            "ledger": ledger,
+            "qdiv real": qdiv_real,
+            "interest real": interest_real,
+            "Income": real["Pension"] + balances["Withdrawal"] + spec_annuity + ssa_annuity,
+            "Income_Real": pension_real + real["Withdrawal_real"] + ssa_annuity_real + interest_real + qdiv_real,
+        }
+
+    def _lot_gains(self, assumptions: Dict, qdiv) -> Dict[bool, np.ndarray]:
+        #Replays projection_engine's Brokerage lot events; nominal realized gain per month, by long term
+        plan = self.plan
+        balances = self.outputs["balances"]
+        n_months = len(qdiv)
+        gains = {True: np.zeros(n_months), False: np.zeros(n_months)}
+        b_idx = plan["brokerage_idx"]
+        if b_idx < 0:
+            return gains
+
+        opening = float(self.inputs.start_bal.get("Brokerage", 0.0))
+        lots = TaxLots.opening(
+            opening,
+            opening_brokerage_cost(opening, assumptions["brokerage_ltcg_realization_ratio"]),
+            check_lot_method(assumptions.get("brokerage_lot_method", "fifo")),
+        )
+        rmd_bought = balances["RMD Extra"] if plan["reinvest_idx"] == b_idx else np.zeros(n_months)
+        flows = balances["balances"][:, b_idx] - balances["brokerage_balance"]
+        for t in range(n_months):
+            m_ord = plan["month_ord"][t]
+            lots.mark(balances["brokerage_marked"][t])
+            sale = lots.sell(balances["draws"][t, b_idx], m_ord)
+            lots.buy(rmd_bought[t], m_ord)
+            lots.reinvest(qdiv[t], m_ord)
+            if flows[t] > 0:
+                lots.buy(flows[t], m_ord)
+            elif flows[t] < 0:
+                sale = sale + lots.sell(-flows[t], m_ord)
+            gains[True][t] = sale.gain_long
+            gains[False][t] = sale.gain_short
+        return gains
+
+    def _tax(self, assumptions: Dict) -> None:
+        #YTD tax per tax year: cumulative nominal buckets through tax_engine_vec, one row per month
+        deflator = self.outputs["real"]["deflator"]
+        income = self.outputs["income"]
+        years = self.plan["tax_year"]
+        n_months = len(years)
+        schedule = compile_tax_schedule(int(years[0]), int(years[-1]), float(assumptions["inflation"]), **self.plan["config_sources"])
+        nominal = (income["income_by_type"] @ INCOME_TYPE_BUCKETS) / deflator[:, None]
+
+        fed_tax, va_tax, medicare_tax = np.empty(n_months), np.empty(n_months), np.empty(n_months)
+        starts = np.flatnonzero(np.r_[True, years[1:] != years[:-1]])
+        for start, stop in zip(starts, np.r_[starts[1:], n_months]):
+            ytd_buckets = np.cumsum(nominal[start:stop], axis=0)
+            _, ytd_tax, _, va_ytd_tax, _, ytd_medicare_tax = tax_engine_vec(
+                ytd_buckets, 0.0, 0.0, 0.0,
+                assumptions.get("filing_status", "mfs"),
+                tax_tables_for_year(schedule, years[start]),
+            )
+            fed_tax[start:stop] = np.diff(ytd_tax, prepend=0.0)
+            va_tax[start:stop] = np.diff(va_ytd_tax, prepend=0.0)
+            medicare_tax[start:stop] = np.diff(ytd_medicare_tax, prepend=0.0)
+
+        total_tax = fed_tax + va_tax + medicare_tax
+        self.outputs["tax"] = {
+            "Fed Tax": fed_tax,
+            "Medicare Tax": medicare_tax,
+            "VA Tax": va_tax,
+            "Total Tax": total_tax,
+            "Net_Income_Real": income["Income_Real"] - total_tax * deflator,
+        }
@@ -0,0 +1,823 @@
+from dataclasses import dataclass, field
+from statistics import NormalDist
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from income_types import (
+    INCOME_TYPES,
+    INCOME_TYPE_BUCKETS,
+    NO_INCOME_TYPE,
+    TAX_BUCKETS,
+    compile_account_classification,
+)
+from projection_engine import (
+    INTEREST,
+    LTCG,
+    PENSION_START,
+    QUALIFIED_DIVIDEND,
+    RETIREMENT_DISTRIBUTION,
+    SOCIAL_SECURITY,
+    STCG,
+    UNCLASSIFIED_INCOME_SOURCES,
+    account_tax_shares,
+    opening_brokerage_cost,
+    projection_engine,
+)
+from price_index import PriceIndex, constant_price_index, stochastic_price_index
+from roth_engine import calc_roth_conv_payment
+from streaming_stats import FailureCounter, MomentAccumulator, QuantileSketch
+from tax_engine import compile_tax_schedule, tax_engine_vec, tax_tables_for_year
+from tax_lots import BatchTaxLots, check_lot_method
+from withdraw_engine import (
+    apply_rmd_topup,
+    calc_monthly_rmds,
+    rmd_divisor_schedule,
+    rmd_eligibility_mask,
+    withdrawal_waterfall_vec,
+)
+from withdrawal_strategies import get_strategy, load_strategy_plugins
+
+# Batch version of projection_engine: the same monthly steps, written over a
+# leading path axis so a chunk of Monte Carlo paths runs in one pass.
+
+MC_METRICS = (
+    "Net_Worth",
+    "Net_Worth_Real",
+    "Income",
+    "Income_Real",
+    "Net_Income_Real",
+    "Withdrawal",
+    "Withdrawal_real",
+    "RMD Extra",
+    "ROTH Conversion",
+    "Fed Tax",
+    "VA Tax",
+    "Medicare Tax",
+    "Total Tax",
+)
+
+FAN_METRICS = ("Net_Worth_Real", "Income_Real", "Net_Income_Real")
+
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def _month_ordinal(dates) -> np.ndarray:
+    dates = pd.DatetimeIndex(np.atleast_1d(dates))
+    return np.asarray(dates.year * 12 + dates.month - 1)
+
+
+def _path_param(assumptions, key, n_paths, default=None) -> np.ndarray:
+    #Scalar assumption, or one value per path (e.g. a sensitivity sample)
+    value = assumptions.get(key, default)
+    return np.broadcast_to(np.asarray(value, dtype=float), (n_paths,))
+
+
+def _path_dates(value, n_paths) -> pd.DatetimeIndex:
+    dates = pd.DatetimeIndex(np.atleast_1d(pd.to_datetime(value)))
+    return dates if len(dates) == n_paths else dates.repeat(n_paths)
+
+
+def cashflow_matrix(cf, months, accounts) -> np.ndarray:
+    #(months x accounts) scheduled contributions, the same rows apply_flows picks each month
+    flows = np.zeros((len(months), len(accounts)))
+    month_values = months.values
+    col = {acct: i for i, acct in enumerate(accounts)}
+    for start, end, acct, amount in cf[["start_date", "end_date", "account", "monthly_amount"]].itertuples(index=False):
+        active = month_values >= np.datetime64(start)
+        if not pd.isna(end):
+            active &= month_values <= np.datetime64(end)
+        flows[active, col[acct]] += amount
+    return flows
+
+
+def compile_projection(account_tax_map, rmd_table, start_bal, cf, months, assumptions, balances_actuals=None, config_sources=None) -> Dict:
+    """
+    Everything simulate_paths needs that does not depend on the return path:
+    account layout, cashflow matrix, RMD schedule, income classification and
+    tax bracket schedule. Built once per run and reused for every chunk of paths.
+    config_sources says where the tax config lives (see Inputs.config_sources)
+    and is kept on the plan for anything that compiles tax tables from it later.
+    """
+    config_sources = dict(config_sources or {})
+    months = pd.DatetimeIndex(months)
+    accounts = list(start_bal.index) + [a for a in pd.unique(cf["account"]) if a not in start_bal.index]
+    start_balances = start_bal.reindex(accounts).fillna(0.0).to_numpy(dtype=float)
+    birthday = assumptions["birthday"]
+    order = assumptions["withdrawal_order"]
+
+    account_income_types = compile_account_classification(account_tax_map)
+    account_income = np.zeros((len(accounts), len(INCOME_TYPES)))
+    for i, acct in enumerate(accounts):
+        type_id = account_income_types.get(acct, NO_INCOME_TYPE)
+        #projection_engine books the SSA benefit under "SSA Annuity" in place of any draw from that account
+        if acct not in UNCLASSIFIED_INCOME_SOURCES and acct != "SSA Annuity" and type_id != NO_INCOME_TYPE:
+            account_income[i, type_id] = 1.0
+    ssa_type = NO_INCOME_TYPE if "SSA Annuity" in UNCLASSIFIED_INCOME_SOURCES else account_income_types.get("SSA Annuity", NO_INCOME_TYPE)
+
+    index = {acct: i for i, acct in enumerate(accounts)}
+    pension_start = assumptions.get("pension_start", PENSION_START)
+
+    return {
+        "months": months,
+        "month_ns": months.as_unit("ns").asi8,
+        "month_ord": _month_ordinal(months),
+        "calendar_month": np.asarray(months.month),
+        "tax_year": np.asarray(months.year),
+        "ages": np.asarray((months - birthday).days) / 365.2425,
+        "accounts": accounts,
+        "start_balances": start_balances,
+        "flows": cashflow_matrix(cf, months, accounts),
+        "order": list(order),
+        "order_idx": np.array([index[acct] for acct in order]),
+        "rmd_table": rmd_table,
+        "rmd_mask": rmd_eligibility_mask(accounts, account_tax_map),
+        "rmd_divisors": rmd_divisor_schedule(months, birthday, rmd_table, assumptions.get("rmd_start_age", 73)),
+        "reinvest_idx": index.get(assumptions.get("rmd_reinvest_account", "Brokerage"), -1),
+        "account_income_types": account_income_types,
+        "account_income": account_income,
+        "ssa_type": ssa_type,
+        "config_sources": config_sources,
+        "tax_schedule": compile_tax_schedule(months[0].year, months[-1].year, float(assumptions["inflation"]), **config_sources),
+        "spec_annuity_window": np.asarray((months >= birthday + pd.DateOffset(years=57)) & (months <= birthday + pd.DateOffset(years=62))),
+        "ssa_window": np.asarray(months > birthday + pd.DateOffset(years=62)),
+        "birthday_ord": _month_ordinal(birthday)[0],
+        "pension_start_ns": pension_start.as_unit("ns").value,
+        "pension_start_ord": _month_ordinal(pension_start)[0],
+        "brokerage_idx": index.get("Brokerage", -1),
+        "tsp_idx": index.get("TSP", -1),
+        "roth_idx": index.get("ROTH IRA", -1),
+        "balances_actuals": balances_actuals,
+    }
+
+
+#Shock streams of a path: returns use the path's own key, other risk factors a sub-stream of it
+INFLATION_STREAM = 1
+
+
+def path_seed_sequence(seed: int, path_index: int, stream: int | None = None) -> np.random.SeedSequence:
+    #Every path has its own stream, so a path's returns don't depend on chunking or worker count
+    spawn_key = (int(path_index),) if stream is None else (int(path_index), int(stream))
+    return np.random.SeedSequence(seed, spawn_key=spawn_key)
+
+
+def generate_shocks(seed: int, path_start: int, path_stop: int, n_months: int, stream: int | None = None) -> np.ndarray:
+    #(paths x months) standard normal return shocks for paths [path_start, path_stop)
+    return np.stack([
+        np.random.default_rng(path_seed_sequence(seed, i, stream)).standard_normal(n_months)
+        for i in range(path_start, path_stop)
+    ]) if path_stop > path_start else np.zeros((0, n_months))
+
+
+def inflation_options(assumptions) -> Dict:
+    #"inflation_volatility" > 0 turns on stochastic inflation (see price_index.stochastic_price_index)
+    return {
+        "volatility": float(assumptions.get("inflation_volatility", 0.0)),
+        "persistence": float(assumptions.get("inflation_persistence", 0.9)),
+        "correlation": float(assumptions.get("inflation_return_correlation", 0.0)),
+    }
+
+
+def generate_price_index(seed: int, path_start: int, path_stop: int, months, assumptions, return_shocks, options: Dict) -> PriceIndex | None:
+    """
+    Stochastic price index for paths [path_start, path_stop), or None when
+    inflation is not stochastic. Each path's inflation shocks come from its
+    own sub-stream, mixed with its return shocks to the requested correlation.
+    """
+    if options["volatility"] <= 0:
+        return None
+    own = generate_shocks(seed, path_start, path_stop, len(months), INFLATION_STREAM)
+    return price_index_from_shocks(months, assumptions, return_shocks, own, options)
+
+
+def price_index_from_shocks(months, assumptions, return_shocks, own_shocks, options: Dict) -> PriceIndex:
+    #Stochastic price index from the paths' own inflation shocks, mixed with their return shocks to the requested correlation
+    rho = options["correlation"]
+    shocks = rho * np.asarray(return_shocks) + np.sqrt(1 - rho**2) * np.asarray(own_shocks)
+    return stochastic_price_index(
+        months, assumptions["basis"], assumptions["inflation"], shocks, options["volatility"], options["persistence"]
+    )
+
+
+def growth_from_shocks(shocks, annual_return, annual_volatility) -> np.ndarray:
+    #Monthly growth factors; lognormal around the deterministic (1+r)**(1/12), exactly equal to it with zero volatility
+    annual_return = np.reshape(np.asarray(annual_return, dtype=float), (-1, 1))
+    sigma = np.reshape(np.asarray(annual_volatility, dtype=float), (-1, 1)) / np.sqrt(12)
+    return (1 + annual_return)**(1/12) * np.exp(sigma * shocks - sigma**2 / 2)
+
+
+def simulate_paths(plan, assumptions, growth, keep_balances: bool = False, price_index: PriceIndex | None = None) -> Dict:
+    """
+    Run projection_engine's monthly steps for every row of `growth`
+    ((paths x months) monthly growth factors) at once.
+
+    Assumptions may be scalars or one value per path. price_index: prices
+    per path over the plan's months (e.g. generate_price_index); by default
+    they compound at each path's `inflation`. Returns
+    {"metrics": {name: (paths x months)}, "failed_month": (paths,), ...};
+    failed_month is the first month a path could not fund its withdrawal
+    (or ran out of money), -1 if it never did.
+    """
+    growth = np.atleast_2d(growth)
+    n_paths, n_months = growth.shape
+    n_accounts = len(plan["accounts"])
+    load_strategy_plugins(assumptions.get("withdrawal_plugins"))
+    strategy = get_strategy(assumptions["withdrawal_type"])
+    filing_status = assumptions.get("filing_status", "mfs")
+
+    inflation = _path_param(assumptions, "inflation", n_paths)
+    #Brackets are indexed with the plan's inflation; paths with their own rate or prices rescale them
+    tax_index = price_index
+    if price_index is None:
+        price_index = constant_price_index(plan["months"], assumptions["basis"], inflation)
+        if np.any(inflation != plan["tax_schedule"]["inflation"]):
+            tax_index = price_index
+    price_levels = np.broadcast_to(price_index.levels, (n_paths, n_months))
+    deflators = 1.0 / price_levels
+    annual_return = _path_param(assumptions, "annual_return", n_paths)
+    withdrawal_rate = _path_param(assumptions, "withdrawal_rate", n_paths)
+    pension_real = _path_param(assumptions, "pension", n_paths)
+    ssa_benefit = _path_param(assumptions, "ssa_benefit", n_paths)
+    service_length = _path_param(assumptions, "service_length", n_paths)
+    interest_yield = _path_param(assumptions, "brokerage_interest_yield", n_paths)
+    qdiv_yield = _path_param(assumptions, "brokerage_qdiv_yield", n_paths)
+    ltcg_realization = _path_param(assumptions, "brokerage_ltcg_realization_ratio", n_paths)
+
+    retirement = _path_dates(assumptions["retirement"], n_paths)
+    retire_ns = retirement.as_unit("ns").asi8
+    retire_ord = _month_ordinal(retirement)
+    roth_end_ord = plan["birthday_ord"] + np.round(12*_path_param(assumptions, "roth_end_age", n_paths, 75))
+    roth_window = roth_end_ord - retire_ord
+    retire_level = np.broadcast_to(price_index.at(retire_ord), (n_paths,))
+    pension_level = np.broadcast_to(price_index.at(plan["pension_start_ord"]), (n_paths,))
+
+    #Starting balance for strategies sized off the withdrawal start date (actuals when that month is history)
+    start_total_hist = np.full(n_paths, np.nan)
+    actuals = plan["balances_actuals"]
+    if actuals is not None:
+        for date in retirement.unique():
+            if date in actuals.index:
+                start_total_hist[retirement == date] = float(actuals.loc[date].reindex(plan["accounts"]).fillna(0.0).astype(float).sum())
+
+    ordinary_share, brokerage_share = account_tax_shares(plan["order"], plan["account_income_types"], 1.0)
+
+    b_idx, tsp_idx, roth_idx = plan["brokerage_idx"], plan["tsp_idx"], plan["roth_idx"]
+    balances = np.tile(plan["start_balances"], (n_paths, 1))
+    opening_brokerage = balances[:, b_idx] if b_idx >= 0 else np.zeros(n_paths)
+    lots = BatchTaxLots(
+        opening_brokerage,
+        opening_brokerage_cost(opening_brokerage, ltcg_realization),
+        plan["month_ord"][0],
+        n_months,
+        check_lot_method(assumptions.get("brokerage_lot_method", "fifo")),
+    )
+    rmd_to_brokerage = b_idx >= 0 and plan["reinvest_idx"] == b_idx
+    prior_year_end = balances.copy()
+    withdrawal_state = {"start_total": np.full(n_paths, np.nan)}
+    roth_monthly = np.full(n_paths, np.nan)
+    failed_month = np.full(n_paths, -1)
+
+    ytd_buckets = np.zeros((n_paths, len(TAX_BUCKETS)))
+    ytd_tax = np.zeros(n_paths)
+    va_ytd_tax = np.zeros(n_paths)
+    ytd_medicare_tax = np.zeros(n_paths)
+
+    out = {name: np.empty((n_paths, n_months)) for name in MC_METRICS}
+    balance_history = np.empty((n_paths, n_months, n_accounts)) if keep_balances else None
+    zeros = np.zeros(n_paths)
+
+    for t in range(n_months):
+        m_ns = plan["month_ns"][t]
+        m_ord = plan["month_ord"][t]
+
+        if t == 0 or plan["calendar_month"][t] == 1:
+            tax_tables = tax_tables_for_year(plan["tax_schedule"], plan["tax_year"][t], price_index=tax_index)
+        if plan["calendar_month"][t] == 1:
+            ytd_buckets[:] = 0.0
+            ytd_tax[:] = 0.0
+            va_ytd_tax[:] = 0.0
+            ytd_medicare_tax[:] = 0.0
+            prior_year_end = balances.copy()
+
+        #1. apply growth to balances
+        balances *= growth[:, t][:, None]
+        if b_idx >= 0:
+            lots.mark(balances[:, b_idx])
+        price_level = price_levels[:, t]
+        deflator = deflators[:, t]
+
+        #2a. Take Retirement withdrawals
+        active = m_ns >= retire_ns
+        draws = np.zeros((n_paths, n_accounts))
+        withdrawal = zeros
+        if active.any():
+            months_since_start = m_ord - retire_ord
+            total = balances.sum(axis=1)
+            start_total = withdrawal_state["start_total"]
+            new = np.isnan(start_total) & active
+            start_total[new] = np.where(np.isnan(start_total_hist), total, start_total_hist)[new]
+            ctx = {
+                "total": total,
+                "start_total": start_total,
+                "ordered_balances": balances[:, plan["order_idx"]],
+                "months_since_start": months_since_start,
+                "active": active,
+                "age": np.full(n_paths, plan["ages"][t]),
+                "withdrawal_rate": withdrawal_rate,
+                "inflation_factor": price_level / retire_level,
+                "assumptions": assumptions,
+                "rmd_table": plan["rmd_table"],
+                "tax_context": {
+                    "tax_tables": tax_tables,
+                    "ytd_ordinary": ytd_buckets[:, TAX_BUCKETS.index("federal_ordinary_income")],
+                    "ytd_pref": ytd_buckets[:, TAX_BUCKETS.index("federal_ltcg_income")] + ytd_buckets[:, TAX_BUCKETS.index("federal_qualified_dividends")],
+                    "ytd_va": ytd_buckets[:, TAX_BUCKETS.index("va_ordinary_income")],
+                    "deflator": deflator,
+                    "ordinary_share": ordinary_share,
+                    "ltcg_share": brokerage_share[None, :] * lots.gain_fraction()[:, None],
+                },
+            }
+            requested = np.where(active, strategy(ctx, withdrawal_state), 0.0)
+            balances, draws, withdrawal = withdrawal_waterfall_vec(balances, requested, plan["order_idx"])
+            short = active & (requested - withdrawal > 0.01) & (failed_month < 0)
+            failed_month[short] = t
+
+        rmd_extra = zeros
+        if not np.isnan(plan["rmd_divisors"][t]):
+            required = calc_monthly_rmds(prior_year_end, plan["rmd_mask"], plan["rmd_divisors"][t])
+            balances, extra, rmd_extra = apply_rmd_topup(balances, draws, required, plan["reinvest_idx"])
+            draws = draws + extra
+        if b_idx >= 0:
+            sale = lots.sell(draws[:, b_idx], m_ord)
+            if rmd_to_brokerage:
+                lots.buy(rmd_extra, m_ord)
+
+        withdrawal_real = withdrawal * deflator
+        draws_real = draws * deflator[:, None]
+
+        brokerage_balance = balances[:, b_idx] if b_idx >= 0 else zeros
+        interest_real = brokerage_balance*interest_yield/12
+        qdiv_real = brokerage_balance*qdiv_yield/12
+        #Dividends are reinvested (the balance's return already includes them)
+        lots.reinvest(qdiv_real, m_ord)
+
+        #2b. Take Roth Conversion
+        roth_conv = zeros
+        if tsp_idx >= 0 and roth_idx >= 0:
+            converting = (m_ns >= retire_ns) & (m_ord <= roth_end_ord)
+            new = converting & np.isnan(roth_monthly)
+            roth_monthly[new] = calc_roth_conv_payment(balances[new, tsp_idx], annual_return[new], roth_window[new])
+            roth_conv = np.where(converting, np.minimum(roth_monthly, balances[:, tsp_idx]), 0.0)
+            balances[:, tsp_idx] -= roth_conv
+            balances[:, roth_idx] += roth_conv
+            draws_real[:, tsp_idx] += roth_conv * deflator
+
+        #2c-2d. Pension, Special Supplemental Annuity, SSA
+        if m_ns >= plan["pension_start_ns"]:
+            pension = pension_real*(price_level / pension_level)
+        else:
+            pension = zeros
+        spec_annuity = ssa_benefit * service_length/40 if plan["spec_annuity_window"][t] else zeros
+        if plan["ssa_window"][t]:
+            ssa_annuity = ssa_benefit*0.8*price_level
+            ssa_annuity_real = ssa_benefit*0.8
+        else:
+            ssa_annuity = ssa_annuity_real = zeros
+
+        #2e. Sum Total Income
+        income = pension + withdrawal + spec_annuity + ssa_annuity
+        income_real = pension_real + withdrawal_real + ssa_annuity_real + interest_real + qdiv_real
+
+        #3. add cashflows to new balances
+        balances += plan["flows"][t]
+        if b_idx >= 0:
+            brokerage_flow = plan["flows"][t][b_idx]
+            if brokerage_flow > 0:
+                lots.buy(np.full(n_paths, brokerage_flow), m_ord)
+            elif brokerage_flow < 0:
+                sale = sale + lots.sell(np.full(n_paths, -brokerage_flow), m_ord)
+
+        #Taxable income by type, booked the same way as projection_engine's monthly_income
+        income_by_type = np.maximum(draws_real, 0.0) @ plan["account_income"]
+        income_by_type[:, INTEREST] += np.maximum(interest_real, 0.0)
+        income_by_type[:, QUALIFIED_DIVIDEND] += np.maximum(qdiv_real, 0.0)
+        if b_idx >= 0:
+            income_by_type[:, LTCG] += np.maximum(sale.gain_long, 0.0) * deflator
+            income_by_type[:, STCG] += np.maximum(sale.gain_short, 0.0) * deflator
+        income_by_type[:, RETIREMENT_DISTRIBUTION] += np.maximum(pension_real, 0.0)
+        income_by_type[:, SOCIAL_SECURITY] += np.maximum(ssa_annuity_real, 0.0)
+        if plan["ssa_type"] != NO_INCOME_TYPE:
+            income_by_type[:, plan["ssa_type"]] += np.maximum(ssa_annuity_real, 0.0)
+        ytd_buckets += (income_by_type @ INCOME_TYPE_BUCKETS) / deflator[:, None]
+
+        #4 sum net worth
+        net_worth = balances.sum(axis=1)
+        net_worth_real = (balances * deflator[:, None]).sum(axis=1)
+        broke = active & (net_worth <= 0) & (failed_month < 0)
+        failed_month[broke] = t
+
+        #6. Calculate Taxes
+        tax, ytd_tax, va_tax, va_ytd_tax, medicare_tax, ytd_medicare_tax = tax_engine_vec(
+            ytd_buckets, ytd_tax, va_ytd_tax, ytd_medicare_tax, filing_status, tax_tables
+        )
+        total_tax = tax + va_tax + medicare_tax
+
+        out["Net_Worth"][:, t] = net_worth
+        out["Net_Worth_Real"][:, t] = net_worth_real
+        out["Income"][:, t] = income
+        out["Income_Real"][:, t] = income_real
+        out["Net_Income_Real"][:, t] = income_real - total_tax * deflator
+        out["Withdrawal"][:, t] = withdrawal
+        out["Withdrawal_real"][:, t] = withdrawal_real
+        out["RMD Extra"][:, t] = rmd_extra
+        out["ROTH Conversion"][:, t] = roth_conv
+        out["Fed Tax"][:, t] = tax
+        out["VA Tax"][:, t] = va_tax
+        out["Medicare Tax"][:, t] = medicare_tax
+        out["Total Tax"][:, t] = total_tax
+        if keep_balances:
+            balance_history[:, t] = balances
+
+    return {
+        "metrics": out,
+        "failed_month": failed_month,
+        "balances": balance_history,
+        "accounts": plan["accounts"],
+    }
+
+
+@dataclass
+class MonteCarloSummary:
+    months: pd.DatetimeIndex
+    quantile_levels: Sequence[float]
+    sketches: Dict[str, QuantileSketch]
+    moments: Dict[str, MomentAccumulator]
+    failures: FailureCounter
+    path_summary: pd.DataFrame = field(default_factory=pd.DataFrame)
+    seed: int = 0
+    annual_volatility: float = 0.0
+    convergence: Dict = field(default_factory=dict)
+
+    @property
+    def n_paths(self) -> int:
+        return self.failures.count
+
+    @property
+    def success_rate(self) -> float:
+        return self.failures.success_rate
+
+    def quantile_frame(self, metric: str, quantile_levels=None) -> pd.DataFrame:
+        levels = list(quantile_levels or self.quantile_levels)
+        return pd.DataFrame(self.sketches[metric].quantiles(levels), index=self.months, columns=levels)
+
+    def mean_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({metric: acc.mean for metric, acc in self.moments.items()}, index=self.months)
+
+    def survival(self) -> pd.Series:
+        return pd.Series(1.0 - self.failures.failed_by_month / max(self.n_paths, 1), index=self.months, name="survival")
+
+    def select_path(self, column: str = "ending_real", quantile: float = 0.05) -> int:
+        #Path whose summary value sits at `quantile` of all paths, e.g. the 5th percentile ending balance
+        values = self.path_summary[column].to_numpy()
+        rank = int(round(quantile * (len(values) - 1)))
+        order = np.argsort(values, kind="stable")
+        return int(self.path_summary["path"].iloc[order[rank]])
+
+
+def summarise_paths(result, path_start: int) -> pd.DataFrame:
+    #A few numbers per path, enough to pick paths to replay in detail.
+    #"path" is the path's spawn key: with the run seed it regenerates the path exactly
+    net_worth_real = result["metrics"]["Net_Worth_Real"]
+    return pd.DataFrame({
+        "path": np.arange(path_start, path_start + len(net_worth_real)),
+        "ending_real": net_worth_real[:, -1],
+        "min_real": net_worth_real.min(axis=1),
+        "failed_month": result["failed_month"],
+    })
+
+
+@dataclass(frozen=True)
+class Chunk:
+    index: int
+    path_start: int
+    path_stop: int
+
+
+def plan_chunks(n_paths: int, chunk_size: int) -> List[Chunk]:
+    #Fixed-size path ranges; the schedule depends only on n_paths and chunk_size, never on worker count
+    return [
+        Chunk(i, start, min(start + chunk_size, n_paths))
+        for i, start in enumerate(range(0, n_paths, chunk_size))
+    ]
+
+
+@dataclass
+class ChunkAggregate:
+    #Partial statistics of one or more consecutive chunks
+    sketches: Dict[str, QuantileSketch]
+    moments: Dict[str, MomentAccumulator]
+    failures: FailureCounter
+    path_summary: pd.DataFrame
+
+    @classmethod
+    def from_result(cls, result, path_start: int, metrics, compression: float = 200.0, exact: bool = False) -> "ChunkAggregate":
+        n_months = len(next(iter(result["metrics"].values()))[0])
+        return cls(
+            sketches={m: QuantileSketch.from_values(result["metrics"][m], compression, exact) for m in metrics},
+            moments={m: MomentAccumulator.from_values(result["metrics"][m]) for m in metrics},
+            failures=FailureCounter.from_failed_month(result["failed_month"], n_months),
+            path_summary=summarise_paths(result, path_start),
+        )
+
+    def merge(self, other: "ChunkAggregate") -> "ChunkAggregate":
+        return ChunkAggregate(
+            sketches={m: sketch.merge(other.sketches[m]) for m, sketch in self.sketches.items()},
+            moments={m: acc.merge(other.moments[m]) for m, acc in self.moments.items()},
+            failures=self.failures.merge(other.failures),
+            path_summary=pd.concat([self.path_summary, other.path_summary], ignore_index=True),
+        )
+
+
+class OrderedReducer:
+    """
+    Folds chunk aggregates strictly in chunk index order, holding back any
+    that finish early. Floating point sums and sketch merges then happen in
+    the same order however many workers produced the chunks.
+    """
+
+    def __init__(self):
+        self.total = None
+        self.next_index = 0
+        self.pending: Dict[int, ChunkAggregate] = {}
+
+    def add(self, index: int, partial: ChunkAggregate) -> None:
+        self.pending[index] = partial
+        while self.next_index in self.pending:
+            partial = self.pending.pop(self.next_index)
+            self.total = partial if self.total is None else self.total.merge(partial)
+            self.next_index += 1
+
+
+def run_chunk(plan, assumptions, chunk: Chunk, options: Dict, store=None, scenario=0) -> ChunkAggregate:
+    #Simulate one chunk; its return paths come from the per-path spawn keys, so any process can run any chunk
+    n_months = len(plan["months"])
+    shocks = generate_shocks(options["seed"], chunk.path_start, chunk.path_stop, n_months)
+    growth = growth_from_shocks(shocks, assumptions["annual_return"], options["annual_volatility"])
+    price_index = generate_price_index(
+        options["seed"], chunk.path_start, chunk.path_stop, plan["months"], assumptions, shocks, options["inflation"]
+    )
+    result = simulate_paths(
+        plan, assumptions, growth, keep_balances=store is not None and store.balances is not None, price_index=price_index
+    )
+    if store is not None:
+        store.write(scenario, chunk.path_start, result)
+        store.flush()
+    return ChunkAggregate.from_result(result, chunk.path_start, options["metrics"], options["compression"], options["exact"])
+
+
+def run_chunk_task(context, task) -> ChunkAggregate:
+    #Executor task: context = {"plan", "assumptions", "options"}, task = (chunk, store root or None, scenario)
+    chunk, store_root, scenario = task
+    store = None
+    if store_root is not None:
+        from results_store import ResultsStore
+        store = ResultsStore.open(store_root, "r+")
+    return run_chunk(context["plan"], context["assumptions"], chunk, context["options"], store, scenario)
+
+
+def run_monte_carlo(
+    plan,
+    assumptions,
+    n_paths: int,
+    seed: int = 0,
+    chunk_size: int = 1000,
+    annual_volatility: float | None = None,
+    quantile_levels: Sequence[float] = DEFAULT_QUANTILES,
+    metrics: Sequence[str] = FAN_METRICS,
+    exact: bool = False,
+    compression: float = 200.0,
+    store=None,
+    scenario=0,
+    workers: int = 1,
+    executor=None,
+) -> MonteCarloSummary:
+    """
+    Simulate n_paths return paths chunk by chunk, folding each chunk into
+    streaming per-month quantile sketches, means and failure counts. Peak
+    memory follows chunk_size, not n_paths.
+
+    Chunks run on `executor` (see executors.py: in-process, process pool or a
+    spool directory served by several nodes); workers > 1 is shorthand for a
+    local pool. Results depend only on seed and chunk_size: chunks are merged
+    in chunk order, so any executor and worker count give identical statistics.
+
+    store: optional ResultsStore; every chunk's paths are also written to its
+    `scenario` slice on disk (by whichever worker ran the chunk).
+    """
+    from executors import PoolExecutor, get_executor
+
+    if annual_volatility is None:
+        annual_volatility = assumptions.get("annual_volatility", 0.15)
+    if executor is None:
+        executor = PoolExecutor(workers) if workers > 1 else get_executor()
+    options = {
+        "seed": seed,
+        "annual_volatility": annual_volatility,
+        "inflation": inflation_options(assumptions),
+        "metrics": tuple(metrics),
+        "compression": compression,
+        "exact": exact,
+    }
+    chunks = plan_chunks(n_paths, chunk_size)
+    reducer = OrderedReducer()
+
+    context = {"plan": plan, "assumptions": assumptions, "options": options}
+    store_root = str(store.root) if store is not None else None
+    tasks = [(chunk, store_root, scenario) for chunk in chunks]
+    for i, partial in executor.map(run_chunk_task, context, tasks):
+        reducer.add(chunks[i].index, partial)
+
+    return _summary_from(reducer.total, plan, options, quantile_levels)
+
+
+def _summary_from(total, plan, options, quantile_levels, convergence=None) -> MonteCarloSummary:
+    n_months = len(plan["months"])
+    metrics, compression, exact = options["metrics"], options["compression"], options["exact"]
+    return MonteCarloSummary(
+        months=plan["months"],
+        quantile_levels=tuple(quantile_levels),
+        sketches=total.sketches if total else {m: QuantileSketch(n_months, compression, exact) for m in metrics},
+        moments=total.moments if total else {m: MomentAccumulator(n_months) for m in metrics},
+        failures=total.failures if total else FailureCounter(n_months),
+        path_summary=total.path_summary if total else pd.DataFrame(),
+        seed=options["seed"],
+        annual_volatility=options["annual_volatility"],
+        convergence=convergence or {},
+    )
+
+
+def _z_score(confidence: float) -> float:
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def wilson_interval(successes: int, n: int, confidence: float = 0.95) -> Tuple[float, float]:
+    #Wilson score interval for a success probability; sensible even when every path succeeds
+    if n == 0:
+        return 0.0, 1.0
+    z = _z_score(confidence)
+    p = successes / n
+    denom = 1 + z**2 / n
+    centre = (p + z**2 / (2 * n)) / denom
+    half = z / denom * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2))
+    return float(max(0.0, centre - half)), float(min(1.0, centre + half))
+
+
+def quantile_interval(values, q: float, confidence: float = 0.95) -> Tuple[float, float]:
+    #Distribution-free interval for the q quantile from the order statistics around rank n*q
+    values = np.sort(np.asarray(values, dtype=float))
+    n = len(values)
+    if n == 0:
+        return -np.inf, np.inf
+    z = _z_score(confidence)
+    spread = z * np.sqrt(n * q * (1 - q))
+    lo = int(np.clip(np.floor(n * q - spread), 0, n - 1))
+    hi = int(np.clip(np.ceil(n * q + spread), 0, n - 1))
+    return float(values[lo]), float(values[hi])
+
+
+def run_adaptive_monte_carlo(
+    plan,
+    assumptions,
+    tolerance: float = 0.01,
+    confidence: float = 0.95,
+    min_paths: int = 1000,
+    max_paths: int = 100000,
+    percentiles: Sequence[float] = (),
+    percentile_tolerance: float = 0.05,
+    seed: int = 0,
+    chunk_size: int = 500,
+    chunks_per_round: int | None = None,
+    annual_volatility: float | None = None,
+    quantile_levels: Sequence[float] = DEFAULT_QUANTILES,
+    metrics: Sequence[str] = FAN_METRICS,
+    compression: float = 200.0,
+    executor=None,
+) -> MonteCarloSummary:
+    """
+    Add rounds of chunks until the success-rate confidence interval is within
+    +/- tolerance and, for each of `percentiles` of ending real net worth,
+    the interval's half width is within percentile_tolerance of the estimate
+    (relative), or max_paths is reached.
+
+    The rule is checked only between rounds of fixed size, so the stopping
+    point (and every statistic) is as reproducible as run_monte_carlo's.
+    summary.convergence records the intervals and whether they converged.
+    """
+    from executors import get_executor
+
+    #Every round adds paths, so the loop below always sees at least one
+    if not 1 <= min_paths <= max_paths:
+        raise ValueError(f"Need max_paths >= min_paths >= 1, got min_paths={min_paths}, max_paths={max_paths}")
+    if chunk_size < 1 or (chunks_per_round is not None and chunks_per_round < 1):
+        raise ValueError(f"chunk_size and chunks_per_round must be at least 1, got {chunk_size} and {chunks_per_round}")
+
+    if annual_volatility is None:
+        annual_volatility = assumptions.get("annual_volatility", 0.15)
+    executor = get_executor(executor)
+    options = {
+        "seed": seed,
+        "annual_volatility": annual_volatility,
+        "inflation": inflation_options(assumptions),
+        "metrics": tuple(metrics),
+        "compression": compression,
+        "exact": False,
+    }
+    context = {"plan": plan, "assumptions": assumptions, "options": options}
+    chunks = plan_chunks(max_paths, chunk_size)
+    if chunks_per_round is None:
+        chunks_per_round = max(1, -(-min_paths // chunk_size))
+    first_round = max(chunks_per_round, -(-min_paths // chunk_size))
+
+    reducer = OrderedReducer()
+    next_chunk = 0
+    rounds = 0
+    while next_chunk < len(chunks):
+        stop = min(len(chunks), next_chunk + (first_round if rounds == 0 else chunks_per_round))
+        batch = chunks[next_chunk:stop]
+        for i, partial in executor.map(run_chunk_task, context, [(chunk, None, 0) for chunk in batch]):
+            reducer.add(batch[i].index, partial)
+        next_chunk = stop
+        rounds += 1
+
+        total = reducer.total
+        n = total.failures.count
+        success_lo, success_hi = wilson_interval(n - total.failures.failures, n, confidence)
+        converged = (success_hi - success_lo) / 2 <= tolerance
+
+        ending = total.path_summary["ending_real"].to_numpy()
+        percentile_intervals = {}
+        for q in percentiles:
+            lo, hi = quantile_interval(ending, q, confidence)
+            estimate = np.quantile(ending, q)
+            percentile_intervals[q] = (lo, hi)
+            converged &= (hi - lo) / 2 <= percentile_tolerance * max(abs(estimate), 1.0)
+
+        if converged:
+            break
+
+    convergence = {
+        "converged": bool(converged),
+        "n_paths": int(n),
+        "rounds": rounds,
+        "confidence": confidence,
+        "success_interval": (success_lo, success_hi),
+        "percentile_intervals": percentile_intervals,
+    }
+    return _summary_from(reducer.total, plan, options, quantile_levels, convergence)
+
+
+def replay_growth(seed: int, path_index: int, n_months: int, annual_return, annual_volatility) -> np.ndarray:
+    #The monthly growth factors path `path_index` of a run saw, regenerated from its spawn key
+    shocks = generate_shocks(seed, path_index, path_index + 1, n_months)
+    return growth_from_shocks(shocks, annual_return, annual_volatility)[0]
+
+
+def replay_path(
+    account_tax_map,
+    rmd_table,
+    start_bal,
+    cf,
+    months,
+    assumptions,
+    seed: int,
+    path_index: int,
+    annual_volatility: float | None = None,
+    balances_actuals=None,
+    ledger=None,
+    config_sources=None,
+) -> pd.DataFrame:
+    """
+    Full projection_engine output (per-account balances, taxes, Roth
+    conversions, ...) for one Monte Carlo path. Only the run seed and the
+    path index are needed, so a run never has to keep detailed rows.
+    With stochastic inflation the path's price index is regenerated too.
+    """
+    if annual_volatility is None:
+        annual_volatility = assumptions.get("annual_volatility", 0.15)
+    shocks = generate_shocks(seed, path_index, path_index + 1, len(months))
+    monthly_growth = growth_from_shocks(shocks, assumptions["annual_return"], annual_volatility)[0]
+    price_index = generate_price_index(seed, path_index, path_index + 1, months, assumptions, shocks, inflation_options(assumptions))
+    return projection_engine(
+        account_tax_map,
+        rmd_table,
+        start_bal,
+        cf,
+        months,
+        assumptions,
+        balances_actuals=balances_actuals,
+        ledger=ledger,
+        monthly_growth=monthly_growth,
+        price_index=price_index,
+        config_sources=config_sources,
+    )
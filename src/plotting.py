@@ -1,13 +1,17 @@
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import matplotlib.ticker as ticker
 
+from balances_store import load_balances
+from chart_renderer import agg_figure
+
 
 def plot_networth(df, ax, BALANCES_CSV):
     
-    #read BALANCES.CSV
-    df_bal = pd.read_csv(BALANCES_CSV, parse_dates=["Date"])       
+    #read BALANCES.CSV (or the balances store)
+    df_bal = load_balances(BALANCES_CSV)
 
     #identify balance columns (everything except date)
     balance_cols = [c for c in df_bal.columns if c != "Date"]
@@ -16,7 +20,6 @@ def plot_networth(df, ax, BALANCES_CSV):
     df_bal["net_worth"] = df_bal[balance_cols].sum(axis=1)
 
     #plot Net Worth Actuals
-    df_bal['Date'] = pd.to_datetime(df_bal['Date'])
     ax.plot(df_bal['Date'],df_bal['net_worth'], label='Actual Balances', linestyle='-', color='b')
 
     #plot Prjected Net Worth Nominals
@@ -82,7 +85,7 @@ def plot_tax(df, ax):
     ax.plot(df['Date'],df['VA Tax'], label='VA')
     
     # Format Chart Title and Axises
-    ax.set_title('Taxes- Real (2025)')
+    ax.set_title('Taxes- Nominal')
     ax.set_xlabel('Date')
     ax.set_ylabel('($)')
     ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
@@ -112,4 +115,97 @@ def plotting(df, order, BALANCES_CSV):
     plt.show()
 
     return fig
-    
\ No newline at end of file
+    
+def plot_fan(summary, metric, ax, scale=1e6, unit="M"):
+
+    #plot Monte Carlo percentile bands, outermost first so inner bands draw on top
+    bands = summary.quantile_frame(metric)
+    levels = list(bands.columns)
+    dates = bands.index
+    for lo, hi in zip(levels[:len(levels)//2], levels[::-1][:len(levels)//2]):
+        ax.fill_between(dates, bands[lo], bands[hi], alpha=0.25, color='b', label=f"{lo:.0%}-{hi:.0%}")
+    if len(levels) % 2:
+        mid = levels[len(levels)//2]
+        ax.plot(dates, bands[mid], color='b', label=f"{mid:.0%}")
+
+    # Format Chart Title and Axises
+    ax.set_title(f"{metric} ({summary.n_paths} paths)")
+    ax.set_xlabel('Date')
+    ax.set_ylabel('($)')
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
+    ax.yaxis.set_major_formatter(ticker.FuncFormatter(lambda v, _: f"${v/scale:.2f}{unit}"))
+    ax.tick_params(axis="x", rotation=45)
+    ax.grid(True)
+    ax.legend()
+
+def plot_survival(summary, ax):
+
+    #plot share of paths still funding their withdrawals
+    survival = summary.survival()
+    ax.plot(survival.index, survival.values, color='g')
+
+    # Format Chart Title and Axises
+    ax.set_title(f"Success Rate {summary.success_rate:.1%}")
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Paths Funded')
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
+    ax.yaxis.set_major_formatter(ticker.PercentFormatter(1.0))
+    ax.tick_params(axis="x", rotation=45)
+    ax.grid(True)
+
+def plotting_monte_carlo(summary):
+    #Drawn off-screen (Agg); save with chart_renderer.save_figure, or use chart_renderer.render_charts for batches
+    fig, ax = agg_figure(2, 2, figsize=(14, 8), sharex=True)
+
+    plot_fan(summary, "Net_Worth_Real", ax[0,0])
+    plot_fan(summary, "Income_Real", ax[0,1], scale=1e3, unit="k")
+    plot_fan(summary, "Net_Income_Real", ax[1,0], scale=1e3, unit="k")
+    plot_survival(summary, ax[1,1])
+
+    fig.tight_layout()
+
+    return fig
+
+def plot_tornado(swings, ax, title="Ending Real Net Worth", scale=1e6, unit="M"):
+
+    #plot one bar per parameter from its low to high end result, biggest swing on top
+    swings = swings.iloc[::-1]
+    baseline = swings["baseline"].iloc[0]
+    y = range(len(swings))
+    ax.barh(y, swings["low"] - baseline, left=baseline, color='r', alpha=0.7, label='Low end')
+    ax.barh(y, swings["high"] - baseline, left=baseline, color='g', alpha=0.7, label='High end')
+    ax.axvline(baseline, color='k', linewidth=1)
+
+    # Format Chart Title and Axises
+    ax.set_yticks(list(y))
+    ax.set_yticklabels(swings.index)
+    ax.set_title(f"Sensitivity: {title}")
+    ax.xaxis.set_major_formatter(ticker.FuncFormatter(lambda v, _: f"${v/scale:.2f}{unit}"))
+    ax.grid(True, axis='x')
+    ax.legend()
+
+def plot_sobol(indices, ax, title="Ending Real Net Worth"):
+
+    #plot first order and total Sobol indices per parameter
+    y = np.arange(len(indices))
+    ax.barh(y - 0.2, indices["S1"], height=0.4, label='First order')
+    ax.barh(y + 0.2, indices["ST"], height=0.4, label='Total')
+
+    # Format Chart Title and Axises
+    ax.set_yticks(y)
+    ax.set_yticklabels(indices.index)
+    ax.set_title(f"Sobol Indices: {title}")
+    ax.set_xlim(0, 1)
+    ax.grid(True, axis='x')
+    ax.legend()
+
+def plotting_sensitivity(swings, indices):
+    #Drawn off-screen (Agg); save with chart_renderer.save_figure
+    fig, ax = agg_figure(1, 2, figsize=(14, 5))
+
+    plot_tornado(swings, ax[0])
+    plot_sobol(indices, ax[1])
+
+    fig.tight_layout()
+
+    return fig
@@ -0,0 +1,90 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Price level paths. Every inflation-indexed amount in the engines (nominal <->
+# real conversions, pension and Social Security COLAs, inflation-indexed
+# withdrawals, tax bracket indexing) reads price levels from a PriceIndex,
+# built once per path, instead of compounding a rate each month.
+#
+# levels is (paths x months) over the projection months, 1.0 at the basis
+# month. Months outside them (history before the projection, a basis or
+# pension start date in the past) move at the path's assumed `inflation`.
+
+
+def month_ordinal(dates):
+    #Months since year 0 (year*12 + month - 1), for a date or an array of dates
+    if isinstance(dates, (pd.Timestamp, str)) or np.ndim(dates) == 0:
+        date = pd.Timestamp(dates)
+        return date.year * 12 + date.month - 1
+    dates = pd.DatetimeIndex(dates)
+    return np.asarray(dates.year * 12 + dates.month - 1)
+
+
+@dataclass
+class PriceIndex:
+    first_ord: int              #month ordinal of column 0
+    levels: np.ndarray          #(paths x months) price level, 1.0 at the basis month
+    inflation: np.ndarray       #(paths,) annual rate outside the covered months
+
+    @property
+    def n_paths(self) -> int:
+        return self.levels.shape[0]
+
+    def at(self, ords) -> np.ndarray:
+        #Per path price level of a month ordinal, or of one month ordinal per path
+        ords = np.asarray(ords)
+        offset = ords - self.first_ord
+        inside = np.clip(offset, 0, self.levels.shape[1] - 1)
+        if ords.ndim:
+            rows = np.arange(len(ords)) if self.n_paths > 1 else np.zeros(len(ords), dtype=int)
+            level = self.levels[rows, inside]
+        else:
+            level = self.levels[:, inside]
+        return level * (1 + self.inflation) ** ((offset - inside) / 12)
+
+    def path(self, i: int) -> "PriceIndex":
+        return PriceIndex(self.first_ord, self.levels[i:i + 1], self.inflation[i:i + 1])
+
+
+def constant_price_index(months, basis, inflation) -> PriceIndex:
+    #Prices compounding at `inflation` (a rate, or one rate per path)
+    ords = month_ordinal(months)
+    inflation = np.atleast_1d(np.asarray(inflation, dtype=float))
+    levels = (1 + inflation[:, None]) ** ((ords - month_ordinal(basis)) / 12)
+    return PriceIndex(int(ords[0]), levels, inflation)
+
+
+def stochastic_price_index(months, basis, inflation, shocks, volatility: float, persistence: float = 0.9) -> PriceIndex:
+    """
+    Prices whose annual inflation rate wanders around `inflation`. The
+    deviation of the (log) rate follows an AR(1) from month to month:
+
+        x[t] = persistence * x[t-1] + sqrt(1 - persistence**2) * volatility * shocks[t]
+
+    so its long run standard deviation is `volatility` and high persistence
+    gives multi-year regimes (0.9-0.97 looks like 1970s / 2022 style runs).
+    It starts at zero: the first projected month's price level is known, and
+    the median path compounds at `inflation`.
+
+    shocks: (paths x months) standard normal innovations (see
+    monte_carlo.generate_price_index for shocks correlated with returns).
+    """
+    base = constant_price_index(months, basis, inflation)
+    shocks = np.atleast_2d(np.asarray(shocks, dtype=float))
+    n_paths, n_months = shocks.shape
+
+    innovation = np.sqrt(1 - persistence**2) * volatility * shocks
+    deviation = np.zeros((n_paths, n_months))
+    for t in range(1, n_months):
+        deviation[:, t] = persistence * deviation[:, t - 1] + innovation[:, t]
+
+    levels = np.broadcast_to(base.levels, (n_paths, n_months)) * np.exp(np.cumsum(deviation, axis=1) / 12)
+    index = PriceIndex(base.first_ord, levels, np.broadcast_to(base.inflation, (n_paths,)).copy())
+
+    #Keep 1.0 at the basis month when the basis is a projected month
+    basis_offset = month_ordinal(basis) - index.first_ord
+    if 0 < basis_offset < n_months:
+        index.levels = levels / levels[:, basis_offset][:, None]
+    return index
@@ -2,28 +2,55 @@ import pandas as pd
 import numpy as np
 from typing import Dict, List, Tuple
 
-from tax_engine import tax_engine
+from tax_engine import tax_engine, compile_tax_schedule, tax_tables_for_year
+from price_index import constant_price_index, month_ordinal
 from roth_engine import convert_to_roth
-from withdraw_engine import calc_withdrawal
+from tax_lots import TaxLots, check_lot_method
+from withdraw_engine import calc_withdrawal, rmd_divisor_schedule, rmd_eligibility_mask
+from withdrawal_strategies import load_strategy_plugins
 
 from income_types import (
     TaxResult,
+    TAX_BUCKETS,
     IncomeEvent,
     IncomeSource,
-    EarnedIncome,
+    INCOME_TYPES,
+    INCOME_TYPE_BUCKETS,
+    NO_INCOME_TYPE,
     RetirementDistributionIncome,
     InterestIncome,
     QualifiedDividendIncome,
     ShortTermCapitalGainIncome,
     LongTermCapitalGainIncome,
-    RothDistributionIncome,
-    SocialSecurityIncome
+    CapitalAssetSaleIncome,
+    SocialSecurityIncome,
+    compile_account_classification,
+    income_type_id,
 )
 
-def calc_pension(pension_real, retirement, inflation, m):
+INTEREST = income_type_id(InterestIncome)
+QUALIFIED_DIVIDEND = income_type_id(QualifiedDividendIncome)
+LTCG = income_type_id(LongTermCapitalGainIncome)
+STCG = income_type_id(ShortTermCapitalGainIncome)
+RETIREMENT_DISTRIBUTION = income_type_id(RetirementDistributionIncome)
+SOCIAL_SECURITY = income_type_id(SocialSecurityIncome)
+
+#Income sources that are never booked as withdrawals from their own account
+UNCLASSIFIED_INCOME_SOURCES = {"Brokerage", "FERS", "SERS", "pension", "Pension", "Special Annuity", "SSA"}
+
+#Realized Brokerage gains by holding period: ledger source -> (income type ID, long term)
+LOT_SALE_SOURCES = {
+    "Brokerage Long Term Gain": (LTCG, True),
+    "Brokerage Short Term Gain": (STCG, False),
+}
+
+PENSION_START = pd.Timestamp("2025-10-01")
+
+def calc_pension(pension_real, retirement, cola, m):
+    #cola: price growth since the pension start
     pension = 0.0
     if m >= retirement:
-        pension= pension_real*(1+inflation)**((m.to_period("M")-retirement.to_period("M")).n/12)
+        pension= pension_real*cola
     return pension
 
 def growth(balances, annual_return):                                   
@@ -49,37 +76,60 @@ def calc_spec_annuity(m, birthday, ssa_benefit, service_length):
         spec_annuity = 0
     return spec_annuity
 
-def calc_ssa(m, birthday, ssa_benefit, inflation, basis):
+def calc_ssa(m, birthday, ssa_benefit, price_level):
+    #price_level: this month's prices relative to the basis month
     if m > birthday + pd.DateOffset(years=62):
-        ssa_annuity = ssa_benefit*0.8*(1+inflation)**(((m.to_period("M") - basis.to_period("M")).n)/12)
+        ssa_annuity = ssa_benefit*0.8*price_level
         ssa_annuity_real = ssa_benefit*0.8
     else:
         ssa_annuity = 0
         ssa_annuity_real = 0
     return ssa_annuity, ssa_annuity_real
 
-def calc_real(m, basis, amount, inflation):
-    delta_months = (basis.to_period("M") - m.to_period("M")).n          #months since basis is negative
-    amount_real = amount*(1+inflation)**(delta_months/12)
-    return amount_real
-
-def income_type_from_account(acct: str, account_tax_map, event_kind:str | None=None):
-    account_type = account_tax_map.loc[acct, "account_type"]
-
-    if account_type in {"401k", "403b", "457b", "traditional_ira", "annuity", "pension", "tsp"}:
-        return RetirementDistributionIncome()
-
-    if account_type in {"roth_conv", "salary"}:
-        return EarnedIncome()
-
-    if account_type in {"roth_ira", "roth_401k", "roth_tsp"}:
-        return RothDistributionIncome()
-    
-    if account_type == "brokerage":
-        return None
- 
-    raise ValueError(f"Unknown account_type: {account_type}")
-
+def calc_real(amount, price_level):
+    #Nominal amount in basis month dollars
+    return amount / price_level
+
+def account_tax_shares(order, account_income_types, ltcg_ratio):
+    #Fraction of a withdrawal from each account (in withdrawal order) that is ordinary income / LTCG
+    #ltcg_ratio: realized gain per dollar sold from Brokerage (the next lot's, see tax_lots.py)
+    ordinary_col = TAX_BUCKETS.index("federal_ordinary_income")
+    ordinary_share = np.zeros(len(order))
+    ltcg_share = np.zeros(len(order))
+    for i, acct in enumerate(order):
+        type_id = account_income_types[acct]
+        if acct == "Brokerage":
+            ltcg_share[i] = ltcg_ratio
+        elif type_id != NO_INCOME_TYPE:
+            ordinary_share[i] = INCOME_TYPE_BUCKETS[type_id, ordinary_col]
+    return ordinary_share, ltcg_share
+
+def opening_brokerage_cost(value, realization_ratio):
+    #Cost basis of the opening Brokerage position: brokerage_ltcg_realization_ratio of it is unrealized gain
+    return value * (1 - realization_ratio)
+
+def book_lot_sale(sale, price_level, monthly_income):
+    #Realized gains of a Brokerage sale (nominal lot amounts) as real income, one entry per holding period
+    for source, (type_id, long_term) in LOT_SALE_SOURCES.items():
+        gain = sale.gain_long if long_term else sale.gain_short
+        if gain > 0:
+            monthly_income.append((source, type_id, "Brokerage", calc_real(gain, price_level)))
+
+def lot_sale_events(m, sale, price_level):
+    #The sale as CapitalAssetSaleIncome events with real basis and proceeds, for the audit trail
+    events = []
+    for source, (_, long_term) in LOT_SALE_SOURCES.items():
+        basis, proceeds = (sale.basis_long, sale.proceeds_long) if long_term else (sale.basis_short, sale.proceeds_short)
+        if proceeds > 0:
+            events.append(IncomeEvent(
+                date=m,
+                source=IncomeSource(name=source, income_type=INCOME_TYPES[income_type_id(CapitalAssetSaleIncome)], account="Brokerage"),
+                gross_amount=calc_real(proceeds, price_level),
+                basis=calc_real(basis, price_level),
+                proceeds=calc_real(proceeds, price_level),
+                metadata={"long_term": long_term},
+            ))
+    return events
 
 
 def projection_engine(
@@ -89,10 +139,24 @@ def projection_engine(
     cf, 
     months, 
     assumptions, 
-    balances_actuals = None
+    balances_actuals = None,
+    audit_events = None,
+    ledger = None,
+    monthly_growth = None,
+    trace = None,
+    price_index = None,
+    config_sources = None,
     ):
+    #audit_events: pass a list to collect every month's IncomeEvent objects
+    #ledger: pass an IncomeLedger to record every month's taxable income by source
+    #monthly_growth: one growth factor per month (e.g. a replayed Monte Carlo path) in place of annual_return
+    #trace: pass a list to collect every month's (nominal draws by account, Brokerage balance, Brokerage balance before draws), see incremental.py
+    #price_index: a one path PriceIndex over `months` (e.g. a replayed Monte Carlo path) in place of a constant inflation
+    #config_sources: where the tax config lives, e.g. {"config_dir": "Config"} (Inputs.config_sources); the default is ./Config
     
-    balances = start_bal.copy()
+    #Fixed account order: the RMD mask and prior year end balances are positional
+    accounts = list(start_bal.index) + [a for a in pd.unique(cf["account"]) if a not in start_bal.index]
+    balances = start_bal.reindex(accounts).fillna(0.0)
     rows =[]
     withdrawal = 0.0
     roth_state = {"monthly_conv": None}
@@ -104,114 +168,133 @@ def projection_engine(
     birthday = assumptions["birthday"]
     inflation = assumptions["inflation"]
     basis = assumptions["basis"]
-    retirement = pd.Timestamp("2025-10-01")
+    retirement = assumptions.get("pension_start", PENSION_START)
     pension_real = assumptions["pension"]
     annual_return = assumptions["annual_return"]
     service_length = assumptions["service_length"]
     ssa_benefit = assumptions["ssa_benefit"]
     filing_status = assumptions["filing_status"]
+    tax_schedule = compile_tax_schedule(months[0].year, months[-1].year, float(inflation), **(config_sources or {}))
+    #Brackets follow a given index; a constant one moves them exactly as the schedule does
+    tax_index = price_index
+    if price_index is None:
+        price_index = constant_price_index(months, basis, inflation)
+    price_levels = price_index.levels[0]
+    pension_level = price_index.at(month_ordinal(retirement))[0]
+    withdrawal_start_level = price_index.at(month_ordinal(withdrawal_start_date))[0]
+    account_income_types = compile_account_classification(account_tax_map)
+    ordinary_share, brokerage_share = account_tax_shares(order, account_income_types, 1.0)
+    has_brokerage = "Brokerage" in balances.index
+    lots = TaxLots.opening(
+        balances.get("Brokerage", 0.0),
+        opening_brokerage_cost(balances.get("Brokerage", 0.0), assumptions["brokerage_ltcg_realization_ratio"]),
+        check_lot_method(assumptions.get("brokerage_lot_method", "fifo")),
+    )
+    rmd_to_brokerage = has_brokerage and assumptions.get("rmd_reinvest_account", "Brokerage") == "Brokerage"
     
-    annual_w0 = None
-    t0 = None
+    withdrawal_state = {}
+    rmd_divisors = rmd_divisor_schedule(months, birthday, rmd_table, assumptions.get("rmd_start_age", 73))
+    rmd_state = {
+        "mask": rmd_eligibility_mask(balances.index, account_tax_map),
+        "prior_year_end": balances.to_numpy(dtype=float)[None, :],
+        "reinvest_idx": balances.index.get_indexer([assumptions.get("rmd_reinvest_account", "Brokerage")])[0],
+    }
+    load_strategy_plugins(assumptions.get("withdrawal_plugins"))
     
     ytd_tax = 0.0
     va_ytd_tax = 0.0
     ytd_income_sources= {}
     ytd_tax_buckets = TaxResult.zero()
+    ytd_bucket_values = np.zeros(len(TAX_BUCKETS))
     ytd_medicare_tax = 0.0
 
     #For each month apply: 
-    for m in months:
+    for i, m in enumerate(months):
         row = {"Date": m}
         age = (m-birthday).days / 365.2425
         row["Age"] = age
-        monthly_events = []
+        monthly_income = []                     #(source, income type ID, account, real amount)
+        price_level = price_levels[i]
+        deflator = calc_real(1.0, price_level)
         
         
 
+        if i == 0 or m.month == 1:
+            tax_tables = tax_tables_for_year(tax_schedule, m.year, price_index=tax_index)
         if m.month == 1:
             ytd_tax = 0.0
             va_ytd_tax = 0.0
             ytd_income_sources = {}
             ytd_medicare_tax = 0.0
             ytd_tax_buckets = TaxResult.zero()
-
+            ytd_bucket_values = np.zeros(len(TAX_BUCKETS))
+            rmd_state["prior_year_end"] = balances.to_numpy(dtype=float)[None, :]
             
 
         #1.apply growth to balances
-        balances = growth(balances, annual_return)
+        if monthly_growth is None:
+            balances = growth(balances, annual_return)
+        else:
+            balances = balances * monthly_growth[i]
+        m_ord = month_ordinal(m)
+        brokerage_marked = balances.get("Brokerage", 0.0)
+        if has_brokerage:
+            lots.mark(brokerage_marked)
 
         #2. Calculate Income
         #2a. Take Retirement withdrawals
 
-        balances, income_sources, withdrawal,  annual_w0, t0 = calc_withdrawal(
+        balances, income_sources, withdrawal, rmd_extra = calc_withdrawal(
             m=m, 
             rmd_table=rmd_table,
-            account_tax_map=account_tax_map,
             age=age,
             withdrawal_start_date= withdrawal_start_date, 
             withdrawal_type= withdrawal_type, 
             balances=balances, 
             withdrawal_rate=withdrawal_rate, 
             order=order, 
-            inflation=inflation, 
-            annual_w0=annual_w0,
-            t0=t0,
-            balances_actuals=balances_actuals
+            inflation_factor=price_level / withdrawal_start_level,
+            withdrawal_state=withdrawal_state,
+            rmd_state=rmd_state,
+            rmd_divisor=rmd_divisors[i],
+            assumptions=assumptions,
+            balances_actuals=balances_actuals,
+            tax_context={
+                "tax_tables": tax_tables,
+                "ytd_ordinary": ytd_tax_buckets.federal_ordinary_income,
+                "ytd_pref": ytd_tax_buckets.federal_ltcg_income + ytd_tax_buckets.federal_qualified_dividends,
+                "ytd_va": ytd_tax_buckets.va_ordinary_income,
+                "deflator": deflator,
+                "ordinary_share": ordinary_share,
+                "ltcg_share": brokerage_share * lots.gain_fraction(),
+            },
             )
+        sale = lots.sell(income_sources.get("Brokerage", 0.0), m_ord)
+        if rmd_to_brokerage:
+            lots.buy(rmd_extra, m_ord)
 
         
         row["Withdrawal"] = withdrawal
-        withdrawal_real = calc_real(m, basis, withdrawal, inflation)
+        row["Withdrawal Shortfall"] = withdrawal_state["requested"] - withdrawal
+        withdrawal_real = calc_real(withdrawal, price_level)
         row["Withdrawal_real"] = withdrawal_real
+        row["RMD Extra"] = rmd_extra
+        if trace is not None:
+            trace.append((dict(income_sources), balances.get("Brokerage", 0.0), brokerage_marked))
 
         for key in income_sources:
-            income_sources[key] = calc_real(m, basis, income_sources[key], inflation)
+            income_sources[key] = calc_real(income_sources[key], price_level)
         
         brokerage_balance = balances.get("Brokerage", 0.0)
         interest_real= brokerage_balance*assumptions["brokerage_interest_yield"]/12
         qdiv_real=brokerage_balance*assumptions["brokerage_qdiv_yield"]/12
         row["qdiv real"] = qdiv_real
         if interest_real>0:
-            monthly_events.append(
-                IncomeEvent(
-                    date=m,
-                    source=IncomeSource(
-                        name="Brokerage Interest",
-                        income_type=InterestIncome(),
-                        account="Brokerage"
-                    ),
-                    gross_amount=interest_real
-                )
-            )
+            monthly_income.append(("Brokerage Interest", INTEREST, "Brokerage", interest_real))
         if qdiv_real>0:
-            monthly_events.append(
-                IncomeEvent(
-                    date=m,
-                    source=IncomeSource(
-                        name="Brokerage Qualified Dividends",
-                        income_type=QualifiedDividendIncome(),
-                        account="Brokerage"
-                    ),
-                    gross_amount=qdiv_real
-                )
-            )
-        brokerage_withdrawal=income_sources.get("Brokerage", 0.0)
-        if brokerage_withdrawal>0:
-            ltcg_ratio=assumptions["brokerage_ltcg_realization_ratio"]
-            ltcg_amount=brokerage_withdrawal*ltcg_ratio
-            if ltcg_amount>0:
-                monthly_events.append(
-                    IncomeEvent(
-                        date=m,
-                        source=IncomeSource(
-                            name="Brokerage LTCG",
-                            income_type=LongTermCapitalGainIncome(),
-                            account="Brokerage"
-                        ),
-                        gross_amount=ltcg_amount
-                    )
-                )
+            monthly_income.append(("Brokerage Qualified Dividends", QUALIFIED_DIVIDEND, "Brokerage", qdiv_real))
+        #Dividends are reinvested (the balance's return already includes them)
+        lots.reinvest(qdiv_real, m_ord)
 
         #2b. Take Roth Conversion
         roth_conv = convert_to_roth(
@@ -222,20 +305,20 @@ def projection_engine(
         )
    
         row["ROTH Conversion"] = roth_conv    
-        roth_conv_real = calc_real(m, basis, roth_conv, inflation)
+        roth_conv_real = calc_real(roth_conv, price_level)
 
         row["ROTH Conversion Real"] = roth_conv_real
         income_sources["TSP"] = income_sources.get("TSP", 0.0) + roth_conv_real
 
         #2c. Take Pension
-        pension = calc_pension(pension_real, retirement, inflation, m)
+        pension = calc_pension(pension_real, retirement, price_level / pension_level, m)
         row["Pension"] = pension
         row["Pension_Real"] = pension_real
         income_sources["pension"] = pension_real
 
         #2d. Take Special Supplemental Annuity/SSA Annuity
         spec_annuity = calc_spec_annuity(m, birthday, ssa_benefit, service_length)
-        ssa_annuity, ssa_annuity_real = calc_ssa(m, birthday, ssa_benefit, inflation, basis)
+        ssa_annuity, ssa_annuity_real = calc_ssa(m, birthday, ssa_benefit, price_level)
         income_sources["Special Annuity"] = spec_annuity
         income_sources["SSA Annuity"] = ssa_annuity_real
         
@@ -253,80 +336,54 @@ def projection_engine(
             if amount <= 0:
                 continue
 
-            if acct in {"Brokerage", "FERS", "SERS", "pension", "Pension", "Special Annuity", "SSA"}:
+            if acct in UNCLASSIFIED_INCOME_SOURCES:
                 continue
             
-            income_type = income_type_from_account(acct, account_tax_map)
-            if income_type is None:
+            type_id = account_income_types[acct]
+            if type_id == NO_INCOME_TYPE:
                 continue
 
-            source = IncomeSource(
-                name=f"{acct} Withdrawal",
-                income_type=income_type,
-                account=acct
-            )
+            monthly_income.append((f"{acct} Withdrawal", type_id, acct, amount))
 
-            monthly_events.append(
-                IncomeEvent(
-                    date=m,
-                    source=source,
-                    gross_amount=amount
-                )
-            )
         if pension_real > 0 :
-            monthly_events.append(
-                IncomeEvent(
-                    date=m,
-                    source=IncomeSource(
-                        name="FERS",
-                        income_type=RetirementDistributionIncome(),
-                        account="FERS"
-                    ),
-                    gross_amount = pension_real
-                )
-            )
+            monthly_income.append(("FERS", RETIREMENT_DISTRIBUTION, "FERS", pension_real))
         
-        brokerage_withdrawal = income_sources.get("Brokerage", 0.0)
-
-        if brokerage_withdrawal > 0:
-            ltcg_ratio= assumptions.get("brokerage_ltcg_ratio", 0.30)
-            ltcg_amount= brokerage_withdrawal*ltcg_ratio
-            if ltcg_amount>0:
-                brokerage_ltcg_source = IncomeSource(
-                    name="Brokerage LTCG Withdrawal", 
-                    income_type=LongTermCapitalGainIncome(), 
-                    account="Brokerage"
-                )
-                monthly_events.append(
-                    IncomeEvent(
-                        date=m,
-                        source=brokerage_ltcg_source,
-                        gross_amount=ltcg_amount
-                    )
-                )
         if ssa_annuity_real>0:
-            monthly_events.append(
-                IncomeEvent(
-                    date=m,
-                    source=IncomeSource(
-                        name="Social Security",
-                        income_type=SocialSecurityIncome(),
-                        account="SSA"
-                    ),
-                    gross_amount=ssa_annuity_real
-                )
-            )
+            monthly_income.append(("Social Security", SOCIAL_SECURITY, "SSA", ssa_annuity_real))
         
         row["interest real"] = interest_real
-        monthly_tax_buckets = TaxResult.zero()
-        for event in monthly_events: monthly_tax_buckets.add(event.tax_result())
-        ytd_tax_buckets.add(monthly_tax_buckets)
 
-        
         #3. add cashflows to new balances
-        balances = apply_flows(balances, cf, m)
+        new_balances = apply_flows(balances, cf, m).reindex(accounts)
+        if has_brokerage:
+            brokerage_flow = new_balances["Brokerage"] - balances["Brokerage"]
+            if brokerage_flow > 0:
+                lots.buy(brokerage_flow, m_ord)
+            elif brokerage_flow < 0:
+                sale = sale + lots.sell(-brokerage_flow, m_ord)
+        balances = new_balances
         row.update(balances.to_dict())
-        balances_real = calc_real(m, basis, balances, inflation)
+
+        book_lot_sale(sale, price_level, monthly_income)
+        income_by_type = np.zeros(len(INCOME_TYPES))
+        for source, type_id, acct, amount in monthly_income:
+            income_by_type[type_id] += amount
+            if audit_events is not None and source not in LOT_SALE_SOURCES:
+                audit_events.append(
+                    IncomeEvent(
+                        date=m,
+                        source=IncomeSource(name=source, income_type=INCOME_TYPES[type_id], account=acct),
+                        gross_amount=amount
+                    )
+                )
+        if audit_events is not None:
+            audit_events.extend(lot_sale_events(m, sale, price_level))
+        if ledger is not None:
+            ledger.record(i, monthly_income)
+        #Taxes are figured on nominal YTD income against this tax year's brackets
+        ytd_bucket_values += (income_by_type @ INCOME_TYPE_BUCKETS) / deflator
+        ytd_tax_buckets = TaxResult.from_array(ytd_bucket_values)
+        balances_real = calc_real(balances, price_level)
 
         #4 sum net worth  
         row["Net_Worth"] = balances.sum() 
@@ -342,13 +399,14 @@ def projection_engine(
             va_ytd_tax = va_ytd_tax,
             ytd_medicare_tax=ytd_medicare_tax,
             filing_status = assumptions.get("filing_status", "mfs"),
+            tax_tables = tax_tables,
         )
         row["Fed Tax"] = tax 
         row["Medicare Tax"] = medicare_tax
         row["VA Tax"] = va_tax
         total_tax = tax + va_tax + medicare_tax
         row["Total Tax"] = total_tax
-        net_income_real = income_real - total_tax
+        net_income_real = income_real - total_tax * deflator
         row["Net_Income_Real"] = net_income_real
 
         
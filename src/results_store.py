@@ -0,0 +1,147 @@
+import json
+from pathlib import Path
+from typing import Dict, Iterator, Sequence
+
+import numpy as np
+import pandas as pd
+
+from monte_carlo import DEFAULT_QUANTILES, FAN_METRICS, MC_METRICS, MonteCarloSummary
+from streaming_stats import FailureCounter, MomentAccumulator, QuantileSketch
+
+# On-disk results for batch runs: one scenario x path x month x metric cube in
+# cube.dat, an optional scenario x path x month x account balance cube in
+# balances.dat, the failure month of every path in failed_month.dat, and a
+# meta.json sidecar naming every axis. All arrays are np.memmap, so workers
+# can each open the store and write disjoint path slices concurrently, and
+# readers only page in the slices they touch.
+
+META_FILE = "meta.json"
+CUBE_FILE = "cube.dat"
+BALANCES_FILE = "balances.dat"
+FAILED_FILE = "failed_month.dat"
+
+
+class ResultsStore:
+
+    def __init__(self, root, meta: Dict, mode: str = "r"):
+        self.root = Path(root)
+        self.meta = meta
+        self.mode = mode
+        self.scenarios = list(meta["scenarios"])
+        self.metrics = list(meta["metrics"])
+        self.accounts = list(meta["accounts"])
+        self.months = pd.DatetimeIndex(meta["months"])
+        self.n_paths = int(meta["n_paths"])
+        self.dtype = np.dtype(meta["dtype"])
+        self._scenario_idx = {name: i for i, name in enumerate(self.scenarios)}
+        self._metric_idx = {name: i for i, name in enumerate(self.metrics)}
+
+        n_scenarios, n_months = len(self.scenarios), len(self.months)
+        self.cube = np.memmap(self.root / CUBE_FILE, self.dtype, mode, shape=(n_scenarios, self.n_paths, n_months, len(self.metrics)))
+        self.failed_month = np.memmap(self.root / FAILED_FILE, np.int32, mode, shape=(n_scenarios, self.n_paths))
+        self.balances = None
+        if self.accounts:
+            self.balances = np.memmap(self.root / BALANCES_FILE, self.dtype, mode, shape=(n_scenarios, self.n_paths, n_months, len(self.accounts)))
+
+    @classmethod
+    def create(
+        cls,
+        root,
+        scenarios: Sequence[str],
+        n_paths: int,
+        months,
+        metrics: Sequence[str] = MC_METRICS,
+        accounts: Sequence[str] = (),
+        dtype: str = "float32",
+    ) -> "ResultsStore":
+        #Lay out the files once (before starting workers); they are sparse until written
+        root = Path(root)
+        root.mkdir(parents=True, exist_ok=True)
+        meta = {
+            "scenarios": [str(s) for s in scenarios],
+            "n_paths": int(n_paths),
+            "months": [m.strftime("%Y-%m-%d") for m in pd.DatetimeIndex(months)],
+            "metrics": list(metrics),
+            "accounts": list(accounts),
+            "dtype": np.dtype(dtype).name,
+            "layout": "scenario x path x month x metric",
+        }
+        (root / META_FILE).write_text(json.dumps(meta, indent=2), encoding="utf-8")
+        store = cls(root, meta, mode="w+")
+        store.failed_month[:] = -1
+        store.flush()
+        return cls(root, meta, mode="r+")
+
+    @classmethod
+    def open(cls, root, mode: str = "r") -> "ResultsStore":
+        #mode="r+" for a worker that writes its slice, "r" for readers
+        meta = json.loads((Path(root) / META_FILE).read_text(encoding="utf-8"))
+        return cls(root, meta, mode)
+
+    def scenario_index(self, scenario) -> int:
+        return scenario if isinstance(scenario, (int, np.integer)) else self._scenario_idx[scenario]
+
+    def write(self, scenario, path_start: int, result) -> None:
+        #result: simulate_paths output for paths [path_start, path_start + chunk)
+        s = self.scenario_index(scenario)
+        failed = np.asarray(result["failed_month"])
+        stop = path_start + len(failed)
+        for name, values in result["metrics"].items():
+            if name in self._metric_idx:
+                self.cube[s, path_start:stop, :, self._metric_idx[name]] = values
+        self.failed_month[s, path_start:stop] = failed
+        if self.balances is not None and result.get("balances") is not None:
+            self.balances[s, path_start:stop] = result["balances"]
+
+    def flush(self) -> None:
+        self.cube.flush()
+        self.failed_month.flush()
+        if self.balances is not None:
+            self.balances.flush()
+
+    def metric(self, scenario, metric: str, paths=slice(None)) -> np.ndarray:
+        #(paths x months) view; nothing is read until the values are used
+        return self.cube[self.scenario_index(scenario), paths, :, self._metric_idx[metric]]
+
+    def account_balances(self, scenario, account: str, paths=slice(None)) -> np.ndarray:
+        return self.balances[self.scenario_index(scenario), paths, :, self.accounts.index(account)]
+
+    def path_frame(self, scenario, path: int) -> pd.DataFrame:
+        #Every metric (and account balance) of one stored path
+        s = self.scenario_index(scenario)
+        frame = pd.DataFrame(np.asarray(self.cube[s, path]), index=self.months, columns=self.metrics)
+        if self.balances is not None:
+            frame[self.accounts] = np.asarray(self.balances[s, path])
+        return frame
+
+    def iter_chunks(self, scenario, metric: str, chunk_size: int = 1000) -> Iterator[np.ndarray]:
+        #(chunk x months) blocks, read from disk one block at a time
+        for start in range(0, self.n_paths, chunk_size):
+            yield np.asarray(self.metric(scenario, metric, slice(start, start + chunk_size)), dtype=float)
+
+    def summary(
+        self,
+        scenario,
+        metrics: Sequence[str] = FAN_METRICS,
+        quantile_levels: Sequence[float] = DEFAULT_QUANTILES,
+        chunk_size: int = 1000,
+        compression: float = 200.0,
+    ) -> MonteCarloSummary:
+        #Rebuild the streaming summary (fan charts, success rate) of one scenario from disk
+        n_months = len(self.months)
+        sketches = {}
+        moments = {}
+        for metric in metrics:
+            sketches[metric] = QuantileSketch(n_months, compression)
+            moments[metric] = MomentAccumulator(n_months)
+            for block in self.iter_chunks(scenario, metric, chunk_size):
+                sketches[metric].update(block)
+                moments[metric].update(block)
+        failures = FailureCounter.from_failed_month(self.failed_month[self.scenario_index(scenario)], n_months)
+        return MonteCarloSummary(
+            months=self.months,
+            quantile_levels=tuple(quantile_levels),
+            sketches=sketches,
+            moments=moments,
+            failures=failures,
+        )
@@ -1,5 +1,16 @@
+import numpy as np
 import pandas as pd
 
+def calc_roth_conv_payment(balance, annual_return, conv_window):
+    #Level monthly conversion that empties `balance` over conv_window months; works on arrays of paths
+    r = (1 + annual_return)**(1/12) - 1
+    conv_window = np.asarray(conv_window)
+    safe_window = np.where(conv_window > 0, conv_window, 1)
+
+    roth_conv = balance *r/(1-(1+r)**(-safe_window))
+
+    return np.where(conv_window > 0, roth_conv, 0.0)
+
 def calc_roth_conv(balance, annual_return, start_date, end_date):
     
     conv_window = (end_date.to_period("M") - start_date.to_period("M")).n
@@ -7,17 +18,14 @@ def calc_roth_conv(balance, annual_return, start_date, end_date):
     if conv_window <= 0:
         return 0.0
 
-    r = (1 + annual_return)**(1/12) - 1
-    
-    roth_conv = balance *r/(1-(1+r)**(-conv_window))
-
-    return roth_conv 
+    return float(calc_roth_conv_payment(balance, annual_return, conv_window))
 
 
 def convert_to_roth(m, balances, assumptions, roth_state):
     
     start_date = assumptions["retirement"]
-    end_date = assumptions["birthday"] + pd.DateOffset(years=75)
+    #conversions run from retirement to roth_end_age (whole months)
+    end_date = assumptions["birthday"] + pd.DateOffset(months=int(round(12*assumptions.get("roth_end_age", 75))))
     annual_return = assumptions["annual_return"]
 
     tsp = balances["TSP"]
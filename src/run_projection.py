@@ -1,126 +1,381 @@
 import json
 import sys
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Dict, Optional
+
 import pandas as pd
-import numpy as np
-import os
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-import matplotlib.ticker as ticker
 
-from dataclasses import dataclass
-from typing import Dict, Optional, List
+from projection_engine import PENSION_START, projection_engine
+from income_ledger import IncomeLedger
+from balances_store import load_balances
+from config_bundle import load_bundle
 
-from projection_engine import projection_engine
-from plotting import plotting
+# Library entry point:
+#   inputs = load_inputs("Config/base.json", paths)    #read every input file once
+#   result = run(inputs, {"withdrawal_rate": 0.05})     #scenario overrides on top of the config
+#   save_result(result, inputs, "Output")               #CSVs, plus charts when asked for
+# Nothing is read at import time and matplotlib is only imported to draw charts,
+# so workers and services can import this module cheaply.
 
+#Input paths default to the repo's data/ and Config/ wherever the run starts
+#(data/ as Balances_update.get_csv_path); "paths" in a scenario overrides them
+REPO_ROOT = Path(__file__).resolve().parents[1]
 
 
-#read config file
-#1. load config JSON
-scenario_path = Path(sys.argv[1]) if len(sys.argv) >1 else Path("Config/base.json")
-cfg = json.loads(scenario_path.read_text(encoding="utf-8"))
+@dataclass
+class InputPaths:
+    #balances_csv may also be a balances store (.sqlite), see balances_store.py
+    #config_dir: tax_system.json and its brackets, compiled with account_meta / RMD table into one bundle (config_bundle.py)
+    balances_csv: Path = REPO_ROOT / "data" / "Balances.csv"
+    cashflow_csv: Path = REPO_ROOT / "data" / "cashflow_schedule.csv"
+    account_meta_csv: Path = REPO_ROOT / "Config" / "account_meta.csv"
+    rmd_table_csv: Path = REPO_ROOT / "Config" / "uniform_lifetime_table.csv"
+    config_dir: Path = REPO_ROOT / "Config"
 
-#2. Convert config values to proper Python types
-assumptions = {
-    "birthday": pd.Timestamp(cfg["birthday"]),
-    "annual_return" : cfg["annual_return"],
-    "inflation": cfg["inflation"],
-    "horizon": pd.Timestamp(cfg["horizon"]).to_period("M").to_timestamp(),
-    "basis": pd.Timestamp(cfg["basis"]),
-    "retirement": pd.Timestamp(cfg["retirement"]),
-    "withdrawal_rate": cfg["withdrawal_rate"],
-    "withdrawal_type": cfg["withdrawal_type"],
-    "withdrawal_order": cfg["withdrawal_order"],
-    "pension": cfg["pension"],
-    "service_length": cfg["service_length"],
-    "mra": cfg["mra"],
-    "high_3": cfg["high_3"],
-    "ssa_benefit": cfg["ssa_benefit"],
-    "brokerage_interest_yield": cfg["brokerage_interest_yield"],
-    "brokerage_qdiv_yield": cfg["brokerage_qdiv_yield"],
-    "brokerage_ltcg_realization_ratio": cfg["brokerage_ltcg_realization_ratio"],
-    "filing_status": cfg["filing_status"]
+    @classmethod
+    def from_config(cls, cfg: Dict, base: Optional["InputPaths"] = None) -> "InputPaths":
+        #"paths": {"balances_csv": ..., ...} in the scenario JSON overrides the defaults
+        base = base or cls()
+        overrides = {key: Path(value) for key, value in cfg.get("paths", {}).items()}
+        return cls(**{**base.__dict__, **overrides})
 
-}
+    def config_sources(self) -> Dict:
+        #compile_tax_schedule / compile_tax_tables / load_bundle keywords; absolute, so a run from
+        #another directory reads the same files, and the tax path reuses the bundle load_inputs validated
+        return {
+            "config_dir": str(Path(self.config_dir).resolve()),
+            "account_meta_csv": str(Path(self.account_meta_csv).resolve()),
+            "rmd_table_csv": str(Path(self.rmd_table_csv).resolve()),
+        }
 
 
+@dataclass
+class Inputs:
+    cfg: Dict
+    assumptions: Dict
+    paths: InputPaths
+    balances_actuals: pd.DataFrame
+    start_bal: pd.Series
+    cf: pd.DataFrame
+    months: pd.DatetimeIndex
+    account_tax_map: pd.DataFrame
+    rmd_table: Dict[int, float]
 
+    @property
+    def config_sources(self) -> Dict:
+        #passed to every projection so its tax tables come from paths.config_dir, not ./Config
+        return self.paths.config_sources()
 
-#read Balances.csv
-BALANCES_CSV = Path("/content/drive/MyDrive/Finances/FIRE/Balances.csv")
-bal = pd.read_csv(BALANCES_CSV)
-bal["Date"] = pd.to_datetime(bal["Date"])
-bal = bal.sort_values("Date")              #sort on Date so last month's balances are the last row
-latest = bal.iloc[-1] #take the last row (last month)
-#select last months balances
-start_month = latest["Date"].to_period("M").to_timestamp() + pd.DateOffset(months=1)  #start month is the last month plus 1.
 
-bal = bal.set_index("Date")
-                      
+@dataclass
+class Result:
+    cfg: Dict
+    assumptions: Dict
+    projection: pd.DataFrame
+    ledger: IncomeLedger
+    monte_carlo: object = None
+    replays: Dict[float, pd.DataFrame] = field(default_factory=dict)
+    sensitivity: Optional[Dict] = None
+    failure_estimates: Optional[pd.DataFrame] = None
 
 
-accounts = [c for c in bal.columns if c != "Date"]
-start_bal = latest[accounts].fillna(0).astype(float)        #last month's balances
+def parse_assumptions(cfg: Dict) -> Dict:
+    #Convert config values to proper Python types
+    return {
+        "birthday": pd.Timestamp(cfg["birthday"]),
+        "annual_return" : cfg["annual_return"],
+        "inflation": cfg["inflation"],
+        "horizon": pd.Timestamp(cfg["horizon"]).to_period("M").to_timestamp(),
+        "basis": pd.Timestamp(cfg["basis"]),
+        "retirement": pd.Timestamp(cfg["retirement"]),
+        "withdrawal_rate": cfg["withdrawal_rate"],
+        "withdrawal_type": cfg["withdrawal_type"],
+        "withdrawal_order": cfg["withdrawal_order"],
+        "pension": cfg["pension"],
+        "pension_start": pd.Timestamp(cfg.get("pension_start", PENSION_START)),
+        "service_length": cfg["service_length"],
+        "mra": cfg["mra"],
+        "high_3": cfg["high_3"],
+        "ssa_benefit": cfg["ssa_benefit"],
+        "brokerage_interest_yield": cfg["brokerage_interest_yield"],
+        "brokerage_qdiv_yield": cfg["brokerage_qdiv_yield"],
+        "brokerage_ltcg_realization_ratio": cfg["brokerage_ltcg_realization_ratio"],
+        "brokerage_lot_method": cfg.get("brokerage_lot_method", "fifo"),
+        "filing_status": cfg["filing_status"],
+        "net_spending_real": cfg.get("net_spending_real"),
+        "withdrawal_plugins": cfg.get("withdrawal_plugins", []),
+        "rmd_start_age": cfg.get("rmd_start_age", 73),
+        "roth_end_age": cfg.get("roth_end_age", 75),
+        "rmd_reinvest_account": cfg.get("rmd_reinvest_account", "Brokerage"),
+        "annual_volatility": cfg.get("annual_volatility", 0.15),
+        "inflation_volatility": cfg.get("inflation_volatility", 0.0),
+        "inflation_persistence": cfg.get("inflation_persistence", 0.9),
+        "inflation_return_correlation": cfg.get("inflation_return_correlation", 0.0),
+    }
 
 
-#read cashflow_schedule.csv
-CASHFLOW_CSV = Path("/content/drive/MyDrive/Finances/FIRE/cashflow_schedule.csv")
-cf = pd.read_csv(CASHFLOW_CSV)
-cf["start_date"]= pd.to_datetime(cf["start_date"]).dt.to_period("M").dt.to_timestamp() + pd.DateOffset(months=1)     #convert start dates to beginning of next month
-cf["end_date"]= pd.to_datetime(cf["end_date"], errors="coerce").dt.to_period("M").dt.to_timestamp()  #convert end dates to beginning of month, if no end date, convert to NaT
-cf["monthly_amount"]= pd.to_numeric(cf["monthly_amount"]).fillna(0.0)
-cf["account"]= cf["account"].astype(str).str.strip()                        #remove spaces before or after account names
+def load_config(scenario) -> Dict:
+    #scenario: path to a scenario JSON or an already parsed dict
+    if isinstance(scenario, dict):
+        return dict(scenario)
+    return json.loads(Path(scenario).read_text(encoding="utf-8"))
 
-if cf["end_date"].notna().any():
-    last_sched_end = cf["end_date"].dropna().max()
-else:
-    last_sched_end = pd.NaT 
 
-end_month= assumptions["horizon"]
+def read_balances(balances_csv):
+    #Balances.csv or balances store -> (actuals indexed by Date, last month's balances, first projected month)
+    bal = load_balances(balances_csv)          #sorted on Date so last month's balances are the last row
+    latest = bal.iloc[-1] #take the last row (last month)
+    #start month is the last month plus 1.
+    start_month = latest["Date"].to_period("M").to_timestamp() + pd.DateOffset(months=1)
 
-months = pd.date_range(start_month, end_month, freq="MS")
+    bal = bal.set_index("Date")
+    accounts = [c for c in bal.columns if c != "Date"]
+    start_bal = latest[accounts].fillna(0).astype(float)        #last month's balances
+    return bal, start_bal, start_month
 
-#read account_meta.csv
-ACCOUNT_META_CSV = Path("/content/FIRE/Config/account_meta.csv")
-acct_meta = pd.read_csv(ACCOUNT_META_CSV)
-acct_meta["account"] = acct_meta["account"].str.strip()
-account_tax_map = acct_meta.set_index("account")
 
-UNIFORM_LIFETIME_TABLE_CSV = Path("/content/FIRE/Config/uniform_lifetime_table.csv")
-rmd_df = pd.read_csv(UNIFORM_LIFETIME_TABLE_CSV)
-rmd_table = dict(zip(rmd_df["age"].astype(int), rmd_df["divisor"].astype(float)))
+def read_cashflows(cashflow_csv) -> pd.DataFrame:
+    cf = pd.read_csv(cashflow_csv)
+    cf["start_date"]= pd.to_datetime(cf["start_date"]).dt.to_period("M").dt.to_timestamp() + pd.DateOffset(months=1)     #convert start dates to beginning of next month
+    cf["end_date"]= pd.to_datetime(cf["end_date"], errors="coerce").dt.to_period("M").dt.to_timestamp()  #convert end dates to beginning of month, if no end date, convert to NaT
+    cf["monthly_amount"]= pd.to_numeric(cf["monthly_amount"]).fillna(0.0)
+    cf["account"]= cf["account"].astype(str).str.strip()                        #remove spaces before or after account names
+    return cf
 
-def main():
 
+def load_inputs(scenario=REPO_ROOT / "Config" / "base.json", paths: Optional[InputPaths] = None) -> Inputs:
+    cfg = load_config(scenario)
+    paths = InputPaths.from_config(cfg, paths)
+    assumptions = parse_assumptions(cfg)
+
+    #Validates every config file before anything runs; a stale bundle is recompiled
+    bundle = load_bundle(**paths.config_sources())
+    bal, start_bal, start_month = read_balances(paths.balances_csv)
+    months = pd.date_range(start_month, assumptions["horizon"], freq="MS")
+
+    return Inputs(
+        cfg=cfg,
+        assumptions=assumptions,
+        paths=paths,
+        balances_actuals=bal,
+        start_bal=start_bal,
+        cf=read_cashflows(paths.cashflow_csv),
+        months=months,
+        account_tax_map=bundle.account_tax_map,
+        rmd_table=bundle.rmd_table,
+    )
+
+
+def run_monte_carlo_section(inputs: Inputs, cfg: Dict, assumptions: Dict, progress=None):
+    #"monte_carlo": {"paths": 10000, "seed": 1, "chunk_size": 1000}
+    #"executor": "pool:8" or "spool:/shared/dir" runs the chunks on a local pool or on worker nodes
+    #"store": "Output/mc_store" also writes every path to a ResultsStore there ("store_balances": true adds
+    #account balances), see results_store.py; fixed path counts only
+    #"failure_estimates": {"methods": ["plain", "antithetic+control_variate"], "paths": 20000, "importance_shift": -0.1}
+    #also estimates the failure probability with each variance reduction method, see variance_reduction.py
+    from executors import get_executor
+    from monte_carlo import compile_projection, replay_path, run_adaptive_monte_carlo, run_monte_carlo
+
+    mc_cfg = cfg["monte_carlo"]
+    plan = compile_projection(
+        inputs.account_tax_map, inputs.rmd_table, inputs.start_bal, inputs.cf, inputs.months, assumptions,
+        balances_actuals=inputs.balances_actuals, config_sources=inputs.config_sources,
+    )
+    executor = get_executor(mc_cfg.get("executor"), progress=progress)
+    quantile_levels = mc_cfg.get("quantiles", [0.05, 0.25, 0.5, 0.75, 0.95])
+    if "store" in mc_cfg and "tolerance" in mc_cfg:
+        raise ValueError("monte_carlo: a results store needs a fixed path count, not a tolerance")
+    if "tolerance" in mc_cfg:
+        #adaptive: add paths until the success rate is known to +/- tolerance (capped at "paths")
+        summary = run_adaptive_monte_carlo(
+            plan,
+            assumptions,
+            tolerance=mc_cfg["tolerance"],
+            confidence=mc_cfg.get("confidence", 0.95),
+            min_paths=mc_cfg.get("min_paths", min(1000, mc_cfg.get("paths", 100000))),
+            max_paths=mc_cfg.get("paths", 100000),
+            percentiles=mc_cfg.get("converge_percentiles", []),
+            percentile_tolerance=mc_cfg.get("percentile_tolerance", 0.05),
+            seed=mc_cfg.get("seed", 0),
+            chunk_size=mc_cfg.get("chunk_size", 500),
+            quantile_levels=quantile_levels,
+            executor=executor,
+        )
+    else:
+        store = None
+        if "store" in mc_cfg:
+            from results_store import ResultsStore
+
+            store = ResultsStore.create(
+                mc_cfg["store"],
+                scenarios=["base"],
+                n_paths=mc_cfg.get("paths", 10000),
+                months=plan["months"],
+                accounts=plan["accounts"] if mc_cfg.get("store_balances", False) else (),
+            )
+        summary = run_monte_carlo(
+            plan,
+            assumptions,
+            n_paths=mc_cfg.get("paths", 10000),
+            seed=mc_cfg.get("seed", 0),
+            chunk_size=mc_cfg.get("chunk_size", 1000),
+            quantile_levels=quantile_levels,
+            store=store,
+            executor=executor,
+        )
+
+    estimates = None
+    if "failure_estimates" in mc_cfg:
+        from variance_reduction import failure_estimates
+
+        fe_cfg = mc_cfg["failure_estimates"]
+        estimates = failure_estimates(
+            plan,
+            assumptions,
+            methods=fe_cfg.get("methods", ["plain", "antithetic", "control_variate"]),
+            importance_shift=fe_cfg.get("importance_shift", -0.1),
+            n_paths=fe_cfg.get("paths", mc_cfg.get("paths", 10000)),
+            seed=mc_cfg.get("seed", 0),
+            control_years=fe_cfg.get("control_years", 10.0),
+            chunk_size=mc_cfg.get("chunk_size", 1000),
+        )
+
+    #replay selected percentile paths in full detail, e.g. "replay_quantiles": [0.05, 0.5]
+    replays = {}
+    for q in mc_cfg.get("replay_quantiles", []):
+        replays[q] = replay_path(
+            inputs.account_tax_map, inputs.rmd_table, inputs.start_bal, inputs.cf, inputs.months, assumptions,
+            seed=summary.seed, path_index=summary.select_path("ending_real", q),
+            annual_volatility=summary.annual_volatility, balances_actuals=inputs.balances_actuals,
+            config_sources=inputs.config_sources,
+        )
+    return summary, replays, estimates
+
+
+def run_sensitivity_section(inputs: Inputs, cfg: Dict, assumptions: Dict) -> Dict:
+    #"sensitivity": {"parameters": {...}}, see sensitivity.py
+    from monte_carlo import compile_projection
+    from sensitivity import ParameterSpace, sobol_indices, tornado
+
+    sens_cfg = cfg["sensitivity"]
+    space = ParameterSpace.from_config(sens_cfg["parameters"])
+    plan = compile_projection(
+        inputs.account_tax_map, inputs.rmd_table, inputs.start_bal, inputs.cf, inputs.months, assumptions,
+        balances_actuals=inputs.balances_actuals, config_sources=inputs.config_sources,
+    )
+    eval_kwargs = {"annual_volatility": sens_cfg.get("annual_volatility", 0.0), "seed": sens_cfg.get("seed", 0)}
+    return {
+        "tornado": tornado(plan, assumptions, space, **eval_kwargs),
+        "sobol": sobol_indices(
+            plan,
+            assumptions,
+            space,
+            n=sens_cfg.get("samples", 1024),
+            method=sens_cfg.get("method", "lhs"),
+            **eval_kwargs,
+        ),
+    }
+
+
+def run(inputs: Inputs, scenario: Optional[Dict] = None, progress=None) -> Result:
+    """
+    Project one scenario. `scenario` holds config overrides (any scenario
+    JSON key, e.g. {"withdrawal_rate": 0.05, "monte_carlo": {...}}) applied
+    on top of the loaded config; the input files are not read again.
+    """
+    cfg = {**inputs.cfg, **(scenario or {})}
+    assumptions = parse_assumptions(cfg) if scenario else inputs.assumptions
+    months = inputs.months
+    if assumptions["horizon"] != inputs.assumptions["horizon"]:
+        months = pd.date_range(inputs.months[0], assumptions["horizon"], freq="MS")
+        inputs = Inputs(**{**inputs.__dict__, "months": months})
+
+    ledger = IncomeLedger(months)
     projection = projection_engine(
-        account_tax_map,
-        rmd_table,
-        start_bal, 
-        cf, 
-        months, 
+        inputs.account_tax_map,
+        inputs.rmd_table,
+        inputs.start_bal,
+        inputs.cf,
+        months,
         assumptions,
-        balances_actuals = bal
+        balances_actuals = inputs.balances_actuals,
+        ledger = ledger,
+        config_sources = inputs.config_sources,
     )
-    
-    print(json.dumps(cfg, indent=2, sort_keys=True))
+    result = Result(cfg=cfg, assumptions=assumptions, projection=projection, ledger=ledger)
 
-    fig = plotting(projection, assumptions["withdrawal_order"], BALANCES_CSV)
+    if cfg.get("monte_carlo"):
+        result.monte_carlo, result.replays, result.failure_estimates = run_monte_carlo_section(inputs, cfg, assumptions, progress)
+    if cfg.get("sensitivity"):
+        result.sensitivity = run_sensitivity_section(inputs, cfg, assumptions)
+    return result
 
-    scenario_path = Path(sys.argv[1]).resolve()
 
-    # assuming config is in ClientFolder/Config/base.json
-    client_root = scenario_path.parent.parent
-    output_dir = client_root / "Output"
+def save_result(result: Result, inputs: Inputs, output_dir, charts: bool = True) -> None:
+    output_dir = Path(output_dir)
     charts_dir = output_dir / "charts"
-
     output_dir.mkdir(parents=True, exist_ok=True)
-    charts_dir.mkdir(parents=True, exist_ok=True)
 
-    projection.to_csv(output_dir / "projection.csv", index=False)
+    result.projection.to_csv(output_dir / "projection.csv", index=False)
+    result.ledger.save(output_dir / "income_ledger.npz")
+
+    summary = result.monte_carlo
+    if summary is not None:
+        pd.concat(
+            {metric: summary.quantile_frame(metric) for metric in summary.sketches}, axis=1
+        ).to_csv(output_dir / "monte_carlo_percentiles.csv", index_label="Date")
+        summary.path_summary.to_csv(output_dir / "monte_carlo_paths.csv", index=False)
+        for q, detail in result.replays.items():
+            detail.to_csv(output_dir / f"monte_carlo_path_p{round(q*100)}.csv", index=False)
+    if result.failure_estimates is not None:
+        result.failure_estimates.to_csv(output_dir / "monte_carlo_failure_estimates.csv")
+
+    if result.sensitivity is not None:
+        result.sensitivity["tornado"].to_csv(output_dir / "sensitivity_tornado.csv")
+        pd.concat(result.sensitivity["sobol"], names=["output"]).to_csv(output_dir / "sensitivity_sobol.csv")
+
+    if not charts:
+        return
+
+    #matplotlib is only imported when charts are drawn
+    from balances_store import load_balances
+    from chart_renderer import render_charts, save_figure
 
-    networth_path = charts_dir / "net_worth.png"
-    fig.savefig(networth_path, dpi=300, bbox_inches="tight")
+    job = {
+        "projection": result.projection,
+        "order": result.assumptions["withdrawal_order"],
+        "monte_carlo": summary,
+        "output_dir": charts_dir,
+    }
+    render_charts({"scenario": job}, charts_dir, actuals=load_balances(inputs.paths.balances_csv), dpi=300)
+    if result.sensitivity is not None:
+        from plotting import plotting_sensitivity
+
+        sens_fig = plotting_sensitivity(result.sensitivity["tornado"], result.sensitivity["sobol"]["ending_real"])
+        save_figure(sens_fig, charts_dir / "sensitivity.png", dpi=300)
+
+
+def main():
+    from executors import print_progress
+
+    #read config file
+    scenario_path = Path(sys.argv[1]) if len(sys.argv) >1 else Path("Config/base.json")
+    inputs = load_inputs(scenario_path)
+    result = run(inputs, progress=print_progress)
+
+    print(json.dumps(inputs.cfg, indent=2, sort_keys=True))
+    if result.monte_carlo is not None:
+        summary = result.monte_carlo
+        if summary.convergence:
+            print(f"Monte Carlo {'converged' if summary.convergence['converged'] else 'hit the path cap'}: {summary.convergence}")
+        print(f"Monte Carlo success rate: {summary.success_rate:.1%} over {summary.n_paths} paths")
+    if result.failure_estimates is not None:
+        print(result.failure_estimates[["probability", "std_error", "variance_reduction", "effective_paths"]].to_string())
+
+    # assuming config is in ClientFolder/Config/base.json
+    client_root = scenario_path.resolve().parent.parent
+    save_result(result, inputs, client_root / "Output")
 
 if __name__ == "__main__":
-     main()
\ No newline at end of file
+     main()
@@ -0,0 +1,189 @@
+from dataclasses import dataclass
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+from monte_carlo import generate_price_index, generate_shocks, growth_from_shocks, inflation_options, simulate_paths
+
+# Global sensitivity of projection outcomes to the scenario assumptions.
+#
+# Parameter ranges come from the scenario JSON:
+#   "sensitivity": {
+#       "samples": 1024, "method": "sobol" | "lhs", "seed": 0,
+#       "parameters": {"annual_return": [0.04, 0.08], "retirement": ["2034-01-01", "2038-01-01"], ...}
+#   }
+# Every sample is one row of the path axis of simulate_paths (assumptions
+# accept one value per path), so a whole sample set is a single batched run.
+
+#Assumptions simulate_paths reads per path
+SAMPLEABLE = (
+    "annual_return",
+    "inflation",
+    "withdrawal_rate",
+    "retirement",
+    "roth_end_age",
+    "pension",
+    "ssa_benefit",
+    "service_length",
+    "brokerage_interest_yield",
+    "brokerage_qdiv_yield",
+    "brokerage_ltcg_realization_ratio",
+)
+
+OUTPUTS = ("ending_real", "min_real", "net_income_real", "failed")
+
+
+@dataclass
+class ParameterSpace:
+    names: List[str]
+    lows: np.ndarray
+    highs: np.ndarray
+    dates: List[bool]
+
+    @classmethod
+    def from_config(cls, parameters: Dict[str, Sequence]) -> "ParameterSpace":
+        names, lows, highs, dates = [], [], [], []
+        for name, (low, high) in parameters.items():
+            if name not in SAMPLEABLE:
+                raise ValueError(f"Cannot sample {name!r}; sensitivity parameters must be one of {SAMPLEABLE}")
+            is_date = name == "retirement"
+            if is_date:
+                low, high = pd.Timestamp(low).value, pd.Timestamp(high).value
+            names.append(name)
+            lows.append(float(low))
+            highs.append(float(high))
+            dates.append(is_date)
+        return cls(names, np.array(lows), np.array(highs), dates)
+
+    @property
+    def dimension(self) -> int:
+        return len(self.names)
+
+    def scale(self, unit) -> pd.DataFrame:
+        #Map unit-cube samples to parameter values; dates land on the first of a month
+        values = self.lows + np.asarray(unit) * (self.highs - self.lows)
+        frame = pd.DataFrame(values, columns=self.names)
+        for name, is_date in zip(self.names, self.dates):
+            if is_date:
+                frame[name] = pd.to_datetime(frame[name].astype("int64")).dt.to_period("M").dt.to_timestamp()
+        return frame
+
+    def midpoint(self) -> pd.DataFrame:
+        return self.scale(np.full((1, self.dimension), 0.5))
+
+
+def latin_hypercube(n: int, d: int, seed: int = 0) -> np.ndarray:
+    #One sample in each of n equal strata per dimension, strata shuffled independently
+    rng = np.random.default_rng(seed)
+    strata = np.argsort(rng.random((d, n)), axis=1).T
+    return (strata + rng.random((n, d))) / n
+
+
+def sobol_sequence(n: int, d: int, seed: int = 0) -> np.ndarray:
+    try:
+        from scipy.stats import qmc
+    except ImportError:
+        raise ImportError("Sobol sampling needs scipy; install it or use method='lhs'") from None
+    return qmc.Sobol(d, scramble=True, seed=seed).random(n)
+
+
+def unit_samples(n: int, d: int, method: str = "sobol", seed: int = 0) -> np.ndarray:
+    if method == "sobol":
+        return sobol_sequence(n, d, seed)
+    if method == "lhs":
+        return latin_hypercube(n, d, seed)
+    raise ValueError(f"Unknown sampling method: {method}")
+
+
+def evaluate_samples(
+    plan,
+    assumptions,
+    samples: pd.DataFrame,
+    annual_volatility: float = 0.0,
+    seed: int = 0,
+    chunk_size: int = 2000,
+) -> pd.DataFrame:
+    """
+    Run every row of `samples` (parameter values) as one path, chunk_size
+    rows per batched simulate_paths call. With annual_volatility > 0 every
+    sample sees the return shocks of the same path index (common random numbers);
+    with stochastic inflation ("inflation_volatility" > 0) it also gets that
+    path's price index, built as run_monte_carlo builds it.
+    """
+    n_months = len(plan["months"])
+    inflation = inflation_options(assumptions)
+    stochastic = annual_volatility > 0 or inflation["volatility"] > 0
+    outputs = []
+    for start in range(0, len(samples), chunk_size):
+        batch = samples.iloc[start:start + chunk_size]
+        batch_assumptions = dict(assumptions)
+        for name in batch.columns:
+            values = batch[name]
+            batch_assumptions[name] = pd.DatetimeIndex(values) if name == "retirement" else values.to_numpy(dtype=float)
+
+        shocks = generate_shocks(seed, start, start + len(batch), n_months) if stochastic else np.zeros((len(batch), n_months))
+        growth = growth_from_shocks(shocks, batch_assumptions["annual_return"], annual_volatility)
+        price_index = generate_price_index(seed, start, start + len(batch), plan["months"], batch_assumptions, shocks, inflation)
+        result = simulate_paths(plan, batch_assumptions, growth, price_index=price_index)
+
+        metrics = result["metrics"]
+        outputs.append(pd.DataFrame({
+            "ending_real": metrics["Net_Worth_Real"][:, -1],
+            "min_real": metrics["Net_Worth_Real"].min(axis=1),
+            "net_income_real": metrics["Net_Income_Real"].sum(axis=1),
+            "failed": (result["failed_month"] >= 0).astype(float),
+        }, index=batch.index))
+    return pd.concat(outputs)
+
+
+def sobol_indices(plan, assumptions, space: ParameterSpace, n: int = 1024, method: str = "sobol", seed: int = 0, **evaluate_kwargs) -> Dict[str, pd.DataFrame]:
+    """
+    First-order (Saltelli 2010) and total (Jansen) Sobol indices of every
+    output, from n * (d + 2) runs: matrices A and B plus A with column i
+    taken from B for each parameter, all evaluated as one sample set.
+    `seed` drives both the sampling and the return shocks.
+
+    Returns {output: DataFrame(index=parameters, columns=[S1, ST])}.
+    """
+    d = space.dimension
+    unit = unit_samples(n, 2 * d, method, seed)
+    a, b = unit[:, :d], unit[:, d:]
+    blocks = [a, b] + [np.where(np.arange(d) == i, b, a) for i in range(d)]
+    samples = space.scale(np.vstack(blocks))
+    values = evaluate_samples(plan, assumptions, samples, seed=seed, **evaluate_kwargs)
+
+    indices = {}
+    for output in values.columns:
+        y = values[output].to_numpy().reshape(d + 2, n)
+        f_a, f_b, f_ab = y[0], y[1], y[2:]
+        variance = np.var(np.concatenate([f_a, f_b]))
+        if variance == 0:
+            s1 = st = np.zeros(d)
+        else:
+            s1 = (f_b * (f_ab - f_a)).mean(axis=1) / variance
+            st = 0.5 * ((f_a - f_ab) ** 2).mean(axis=1) / variance
+        indices[output] = pd.DataFrame({"S1": s1, "ST": st}, index=pd.Index(space.names, name="parameter"))
+    return indices
+
+
+def tornado(plan, assumptions, space: ParameterSpace, output: str = "ending_real", **evaluate_kwargs) -> pd.DataFrame:
+    """
+    One-at-a-time swings: every parameter at its low and high end with the
+    rest at the range midpoint, all 2d + 1 runs in one batch. Sorted by swing.
+    """
+    d = space.dimension
+    unit = np.full((2 * d + 1, d), 0.5)
+    for i in range(d):
+        unit[2 * i, i] = 0.0
+        unit[2 * i + 1, i] = 1.0
+    values = evaluate_samples(plan, assumptions, space.scale(unit), **evaluate_kwargs)[output].to_numpy()
+
+    low, high = values[0:2 * d:2], values[1:2 * d:2]
+    frame = pd.DataFrame({
+        "low": low,
+        "high": high,
+        "baseline": values[-1],
+        "swing": np.abs(high - low),
+    }, index=pd.Index(space.names, name="parameter"))
+    return frame.sort_values("swing", ascending=False)
@@ -0,0 +1,118 @@
+from multiprocessing import shared_memory
+from typing import Dict
+
+import numpy as np
+
+# Read-only data plane for process-pool workers. The owner copies every NumPy
+# array of a nested structure (an executor context: the compiled plan with its
+# tax bracket arrays, ...) into one shared memory block once.
+# Workers receive a small picklable handle (block name + layout + the
+# non-array parts) and attach to zero-copy views instead of unpickling their
+# own copies. PoolExecutor (executors.py) publishes every map's context so.
+
+_ALIGN = 64
+
+
+class _SharedRef:
+    #Placeholder for an array inside the pickled skeleton
+
+    def __init__(self, key: int):
+        self.key = key
+
+
+def _split(obj, arrays):
+    #Replace every ndarray in dicts/lists/tuples with a _SharedRef, collecting the arrays
+    if isinstance(obj, np.ndarray) and obj.dtype != object:
+        arrays.append(np.ascontiguousarray(obj))
+        return _SharedRef(len(arrays) - 1)
+    if isinstance(obj, dict):
+        return {key: _split(value, arrays) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_split(value, arrays) for value in obj)
+    return obj
+
+
+def _join(obj, views):
+    if isinstance(obj, _SharedRef):
+        return views[obj.key]
+    if isinstance(obj, dict):
+        return {key: _join(value, views) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_join(value, views) for value in obj)
+    return obj
+
+
+class SharedData:
+    """
+    A nested dict of arrays living in one shared memory block.
+
+    SharedData.publish(data) in the parent copies the arrays in; pass
+    `.handle` to workers and call SharedData.attach(handle) there. Views are
+    read-only. The parent calls close() when the pool is done (which also
+    unlinks the block); workers only detach.
+    """
+
+    def __init__(self, shm, handle: Dict, owner: bool):
+        self.shm = shm
+        self.handle = handle
+        self.owner = owner
+        views = []
+        for offset, shape, dtype in handle["layout"]:
+            view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            view.flags.writeable = False
+            views.append(view)
+        self._views = views
+        self.data = _join(handle["skeleton"], views)
+
+    @classmethod
+    def publish(cls, data) -> "SharedData":
+        arrays = []
+        skeleton = _split(data, arrays)
+
+        layout = []
+        offset = 0
+        for array in arrays:
+            offset = -(-offset // _ALIGN) * _ALIGN
+            layout.append((offset, array.shape, array.dtype.str))
+            offset += array.nbytes
+
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for (start, _, _), array in zip(layout, arrays):
+            np.ndarray(array.shape, array.dtype, buffer=shm.buf, offset=start)[...] = array
+
+        handle = {"name": shm.name, "layout": layout, "skeleton": skeleton}
+        return cls(shm, handle, owner=True)
+
+    @classmethod
+    def attach(cls, handle: Dict) -> "SharedData":
+        return cls(shared_memory.SharedMemory(name=handle["name"]), handle, owner=False)
+
+    @property
+    def nbytes(self) -> int:
+        return self.shm.size
+
+    def close(self) -> None:
+        #Views must not be used after this
+        self._views = []
+        self.data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_ATTACHED: Dict[str, SharedData] = {}
+
+
+def attached(handle: Dict) -> Dict:
+    #Worker side: attach once per process and reuse the views for every task
+    name = handle["name"]
+    if name not in _ATTACHED:
+        _ATTACHED[name] = SharedData.attach(handle)
+    return _ATTACHED[name].data
+
@@ -0,0 +1,174 @@
+import numpy as np
+
+# Reducers for Monte Carlo output fed one chunk of paths at a time.
+#
+# Every reducer keeps one statistic per month, takes (paths x months) arrays in
+# update() and can merge() with a reducer built from another chunk. update() is
+# always "build a reducer from the chunk, then merge", so feeding chunks one by
+# one and merging per-chunk reducers in the same order give identical results.
+
+
+class QuantileSketch:
+    """
+    Per-month t-digest: each month's distribution is summarised by at most
+    about compression/2 centroids (mean, weight), sized by the k1 scale function
+    so the tails keep small centroids. Memory is (months x centroids) no matter
+    how many paths are added.
+
+    exact=True keeps every value instead (memory grows with path count).
+    """
+
+    def __init__(self, n_months: int, compression: float = 200.0, exact: bool = False):
+        self.n_months = n_months
+        self.compression = float(compression)
+        self.exact = exact
+        self.count = 0
+        self.means = np.zeros((n_months, 0))
+        self.weights = np.zeros((n_months, 0))
+        self.min = np.full(n_months, np.inf)
+        self.max = np.full(n_months, -np.inf)
+
+    def _empty_like(self) -> "QuantileSketch":
+        return QuantileSketch(self.n_months, self.compression, self.exact)
+
+    def _compress(self, means, weights):
+        #Merge sorted centroids whose k1 scale positions fall in the same unit bin
+        order = np.argsort(means, axis=1, kind="stable")
+        means = np.take_along_axis(means, order, axis=1)
+        weights = np.take_along_axis(weights, order, axis=1)
+
+        totals = weights.sum(axis=1, keepdims=True)
+        q_mid = (np.cumsum(weights, axis=1) - weights / 2) / np.where(totals > 0, totals, 1.0)
+        k = self.compression / (2 * np.pi) * np.arcsin(np.clip(2 * q_mid - 1, -1.0, 1.0)) + self.compression / 4
+        n_bins = int(np.ceil(self.compression / 2)) + 1
+        bins = np.clip(k.astype(int), 0, n_bins - 1)
+
+        flat = (np.arange(self.n_months)[:, None] * n_bins + bins).ravel()
+        size = self.n_months * n_bins
+        new_weights = np.bincount(flat, weights.ravel(), size).reshape(self.n_months, n_bins)
+        sums = np.bincount(flat, (weights * means).ravel(), size).reshape(self.n_months, n_bins)
+        new_means = np.divide(sums, new_weights, out=np.zeros_like(sums), where=new_weights > 0)
+        return new_means, new_weights
+
+    @classmethod
+    def from_values(cls, values, compression: float = 200.0, exact: bool = False) -> "QuantileSketch":
+        #values: (paths x months)
+        values = np.asarray(values, dtype=float)
+        sketch = cls(values.shape[1], compression, exact)
+        sketch.count = values.shape[0]
+        sketch.min = values.min(axis=0)
+        sketch.max = values.max(axis=0)
+        if exact:
+            sketch.means = values.T.copy()
+            sketch.weights = np.ones_like(sketch.means)
+        else:
+            sketch.means, sketch.weights = sketch._compress(values.T, np.ones((values.shape[1], values.shape[0])))
+        return sketch
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        merged = self._empty_like()
+        merged.count = self.count + other.count
+        merged.min = np.minimum(self.min, other.min)
+        merged.max = np.maximum(self.max, other.max)
+        means = np.concatenate([self.means, other.means], axis=1)
+        weights = np.concatenate([self.weights, other.weights], axis=1)
+        if self.exact:
+            merged.means, merged.weights = means, weights
+        else:
+            merged.means, merged.weights = merged._compress(means, weights)
+        return merged
+
+    def update(self, values) -> None:
+        merged = self.merge(QuantileSketch.from_values(values, self.compression, self.exact))
+        self.__dict__.update(merged.__dict__)
+
+    def quantiles(self, qs) -> np.ndarray:
+        #(months x len(qs)) estimates
+        qs = np.asarray(qs, dtype=float)
+        if self.exact:
+            return np.quantile(self.means, qs, axis=1).T
+
+        out = np.empty((self.n_months, len(qs)))
+        for t in range(self.n_months):
+            keep = self.weights[t] > 0
+            means = self.means[t, keep]
+            weights = self.weights[t, keep]
+            total = weights.sum()
+            #Centroid centres on the cumulative weight axis, pinned to the observed min/max
+            centres = np.cumsum(weights) - weights / 2
+            xs = np.concatenate([[0.0], centres, [total]])
+            ys = np.concatenate([[self.min[t]], means, [self.max[t]]])
+            out[t] = np.interp(qs * total, xs, ys)
+        return out
+
+
+class MomentAccumulator:
+    #Per-month count, mean and variance of the values added so far
+
+    def __init__(self, n_months: int):
+        self.count = 0
+        self.sum = np.zeros(n_months)
+        self.sum_sq = np.zeros(n_months)
+
+    @classmethod
+    def from_values(cls, values) -> "MomentAccumulator":
+        values = np.asarray(values, dtype=float)
+        acc = cls(values.shape[1])
+        acc.count = values.shape[0]
+        acc.sum = values.sum(axis=0)
+        acc.sum_sq = (values * values).sum(axis=0)
+        return acc
+
+    def merge(self, other: "MomentAccumulator") -> "MomentAccumulator":
+        merged = MomentAccumulator(len(self.sum))
+        merged.count = self.count + other.count
+        merged.sum = self.sum + other.sum
+        merged.sum_sq = self.sum_sq + other.sum_sq
+        return merged
+
+    def update(self, values) -> None:
+        self.__dict__.update(self.merge(MomentAccumulator.from_values(values)).__dict__)
+
+    @property
+    def mean(self) -> np.ndarray:
+        return self.sum / max(self.count, 1)
+
+    @property
+    def variance(self) -> np.ndarray:
+        n = max(self.count, 1)
+        return np.maximum(0.0, self.sum_sq / n - self.mean ** 2) * n / max(n - 1, 1)
+
+
+class FailureCounter:
+    #Paths that have failed by each month; failed_month is -1 for paths that never fail
+
+    def __init__(self, n_months: int):
+        self.count = 0
+        self.failed_by_month = np.zeros(n_months, dtype=np.int64)
+
+    @classmethod
+    def from_failed_month(cls, failed_month, n_months: int) -> "FailureCounter":
+        failed_month = np.asarray(failed_month)
+        counter = cls(n_months)
+        counter.count = len(failed_month)
+        first = np.bincount(failed_month[failed_month >= 0], minlength=n_months)
+        counter.failed_by_month = np.cumsum(first)
+        return counter
+
+    def merge(self, other: "FailureCounter") -> "FailureCounter":
+        merged = FailureCounter(len(self.failed_by_month))
+        merged.count = self.count + other.count
+        merged.failed_by_month = self.failed_by_month + other.failed_by_month
+        return merged
+
+    def update(self, failed_month) -> None:
+        other = FailureCounter.from_failed_month(failed_month, len(self.failed_by_month))
+        self.__dict__.update(self.merge(other).__dict__)
+
+    @property
+    def failures(self) -> int:
+        return int(self.failed_by_month[-1]) if len(self.failed_by_month) else 0
+
+    @property
+    def success_rate(self) -> float:
+        return 1.0 - self.failures / max(self.count, 1)
@@ -1,10 +1,18 @@
 import json
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, Tuple
 
 import numpy as np
 import pandas as pd
 
+from income_types import TAX_BUCKETS
+
+TAX_SYSTEMS = ("federal", "ltcg", "virginia")
+
+#Tax year of tables in tax_system.json without a "year"
+BASE_TAX_YEAR = 2025
+
 def load_brackets(csv_path: str | Path) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
     df = pd.read_csv(csv_path)
 
@@ -33,16 +41,163 @@ def load_tax_systems(config_path: str | Path) -> Dict[str, dict]:
     for name, system in cfg.items():
         brackets_path = config_path.parent / system["brackets_file"]
         lowers, uppers, rates, fees = load_brackets(brackets_path)
+        standard_deduction = float(system.get("standard_deduction", 0.0))
+
+        #Explicit tables by tax year: the base table plus any "tables": {"2026": {...}}
+        tables = {int(system.get("year", BASE_TAX_YEAR)): (standard_deduction, (lowers, uppers, rates, fees))}
+        for year, table in system.get("tables", {}).items():
+            tables[int(year)] = (
+                float(table.get("standard_deduction", standard_deduction)),
+                load_brackets(config_path.parent / table["brackets_file"]),
+            )
+
         systems[name] = {
             "method": system["method"],
-            "standard_deduction": float(system["standard_deduction"]),
+            "standard_deduction": standard_deduction,
             "round_tax": bool(system.get("round_tax", False)),
             "bracket": (lowers, uppers, rates, fees),
+            "indexed": bool(system.get("indexed", True)),
+            "tables": dict(sorted(tables.items())),
         }
 
     return systems
 
 
+def _tax_bundle(config_dir, account_meta_csv=None, rmd_table_csv=None):
+    #The validated config bundle (recompiled when a source file changes)
+    #account_meta_csv / rmd_table_csv pick the same bundle load_inputs validated, see config_bundle.bundle_path
+    from config_bundle import load_bundle
+
+    return load_bundle(Path(config_dir), account_meta_csv, rmd_table_csv)
+
+
+def compile_tax_tables(config_dir: str = "Config", account_meta_csv: str = None, rmd_table_csv: str = None) -> Dict[str, dict]:
+    #Base year tables only, see compile_tax_schedule for later years
+    return _compile_tax_tables(_tax_bundle(config_dir, account_meta_csv, rmd_table_csv))
+
+
+@lru_cache(maxsize=None)
+def _compile_tax_tables(bundle) -> Dict[str, dict]:
+    #Cached per bundle; bundles compare equal only while their source files hash the same, so an edit recompiles
+    tax_systems = bundle.tax_systems
+
+    return {
+        name: {
+            "standard_deduction": tax_systems[name]["standard_deduction"],
+            "bracket": tax_systems[name]["bracket"],
+        }
+        for name in TAX_SYSTEMS
+    }
+
+
+def _pad_bracket(bracket, width: int):
+    #Extra brackets start at inf, so they never hold income
+    lowers, uppers, rates, fees = bracket
+    pad = width - len(lowers)
+    return (
+        np.concatenate([lowers, np.full(pad, np.inf)]),
+        np.concatenate([uppers, np.full(pad, np.inf)]),
+        np.concatenate([rates, np.zeros(pad)]),
+        np.concatenate([fees, np.zeros(pad)]),
+    )
+
+
+def compile_tax_schedule(
+    first_year: int,
+    last_year: int,
+    inflation: float,
+    config_dir: str = "Config",
+    account_meta_csv: str = None,
+    rmd_table_csv: str = None,
+) -> Dict[str, dict]:
+    """
+    Tax tables for every tax year first_year..last_year, stacked as
+    (years x brackets) arrays. A year with an explicit table uses it; any
+    other year takes the nearest earlier explicit table (the earliest one for
+    years before it) with every dollar amount moved by `inflation` per year,
+    for systems marked "indexed" in tax_system.json.
+
+    {"first_year": int, "inflation": float,
+     system: {"standard_deduction": (years,), "bracket": 4 x (years x brackets),
+              "cpi_years": (years,) years of CPI indexing applied}}
+    """
+    bundle = _tax_bundle(config_dir, account_meta_csv, rmd_table_csv)
+    return _compile_tax_schedule(int(first_year), int(last_year), float(inflation), bundle)
+
+
+@lru_cache(maxsize=None)
+def _compile_tax_schedule(first_year: int, last_year: int, inflation: float, bundle) -> Dict[str, dict]:
+    #Cached per bundle, like _compile_tax_tables
+    tax_systems = bundle.tax_systems
+    years = np.arange(first_year, last_year + 1)
+
+    schedule = {"first_year": int(first_year), "inflation": float(inflation)}
+    for name in TAX_SYSTEMS:
+        system = tax_systems[name]
+        explicit = np.array(list(system["tables"]))
+        anchor = explicit[np.maximum(np.searchsorted(explicit, years, side="right") - 1, 0)]
+        cpi_years = (years - anchor) if system["indexed"] else np.zeros(len(years), dtype=int)
+        index = (1 + inflation) ** cpi_years
+
+        width = max(len(bracket[0]) for _, bracket in system["tables"].values())
+        deductions, rows = [], []
+        for year, factor in zip(anchor, index):
+            deduction, bracket = system["tables"][int(year)]
+            lowers, uppers, rates, fees = _pad_bracket(bracket, width)
+            deductions.append(deduction * factor)
+            rows.append((lowers * factor, uppers * factor, rates, fees * factor))
+
+        schedule[name] = {
+            "standard_deduction": np.array(deductions),
+            "bracket": tuple(np.vstack(column) for column in zip(*rows)),
+            "cpi_years": cpi_years.astype(float),
+        }
+    return schedule
+
+
+def tax_tables_for_year(schedule: Dict[str, dict], year: int, inflation=None, price_index=None) -> Dict[str, dict]:
+    """
+    One year of a compiled schedule in the compile_tax_tables layout (row
+    views, no copies). Years outside the schedule use its first/last year.
+
+    inflation: per path rates when they differ from the schedule's; each system
+    then carries a per path "scale" (CPI index relative to the schedule) that the
+    *_vec functions apply to every dollar amount of its brackets.
+    price_index: a PriceIndex (price_index.py) the brackets follow instead: the
+    scale is the price growth each path saw from January of the table's anchor
+    year to January of this year, relative to the schedule's.
+    """
+    n_years = len(schedule["federal"]["standard_deduction"])
+    row = min(max(int(year) - schedule["first_year"], 0), n_years - 1)
+    january = (schedule["first_year"] + row) * 12
+
+    tables = {}
+    for name in TAX_SYSTEMS:
+        system = schedule[name]
+        tables[name] = {
+            "standard_deduction": system["standard_deduction"][row],
+            "bracket": tuple(column[row] for column in system["bracket"]),
+        }
+        cpi_years = system["cpi_years"][row]
+        if price_index is not None:
+            realized = price_index.at(january) / price_index.at(january - int(round(12 * cpi_years)))
+            tables[name]["scale"] = realized / (1 + schedule["inflation"]) ** cpi_years
+        elif inflation is not None:
+            tables[name]["scale"] = ((1 + np.asarray(inflation, dtype=float)) / (1 + schedule["inflation"])) ** cpi_years
+    return tables
+
+
+def scaled_tax_table(table: dict) -> dict:
+    #A single path table with its "scale" folded into the dollar amounts (for the scalar functions)
+    if "scale" not in table:
+        return table
+    scale = float(np.asarray(table["scale"]).reshape(-1)[0])
+    lowers, uppers, rates, fees = table["bracket"]
+    return {
+        "standard_deduction": table["standard_deduction"] * scale,
+        "bracket": (lowers * scale, uppers * scale, rates, fees * scale),
+    }
+
 
 def calc_tax(bracket, taxable_income: float) -> float:
     #Bracket
@@ -57,6 +212,48 @@ def calc_tax(bracket, taxable_income: float) -> float:
     return tax_by_bracket.sum()
 
 
+def calc_tax_vec(bracket, taxable_income, scale=1.0) -> np.ndarray:
+    #calc_tax for an array of taxable incomes (e.g. one per Monte Carlo path)
+    #scale: CPI index applied to the bracket's dollar amounts (per path); tax is homogeneous in it
+    lowers, uppers, rates, fees = bracket
+    taxable_income = np.asarray(taxable_income, dtype=float) / scale
+
+    taxable_by_bracket = np.maximum(0.0, np.minimum(taxable_income[..., None], uppers) - lowers)
+
+    return scale * (taxable_by_bracket @ rates)
+
+
+def calc_ltcg_tax_vec(ordinary_taxable_income, pref_income, ltcg_brackets, scale=1.0) -> np.ndarray:
+    #Preferential income is stacked on top of ordinary income, so its tax is the
+    #bracket tax of the stack minus the bracket tax of the ordinary part alone
+    ordinary_taxable_income = np.asarray(ordinary_taxable_income, dtype=float)
+    pref_income = np.maximum(0.0, np.asarray(pref_income, dtype=float))
+
+    return (
+        calc_tax_vec(ltcg_brackets, ordinary_taxable_income + pref_income, scale)
+        - calc_tax_vec(ltcg_brackets, ordinary_taxable_income, scale)
+    )
+
+
+def calc_va_tax_vec(bracket, taxable_income, scale=1.0) -> np.ndarray:
+    lowers, uppers, rates, fees = bracket
+    taxable_income = np.asarray(taxable_income, dtype=float) / scale
+
+    idx = np.maximum(np.searchsorted(lowers, taxable_income, side="right") - 1, 0)
+
+    return scale * (fees[idx] + rates[idx] * (taxable_income - lowers[idx]))
+
+
+def marginal_rate(bracket, taxable_income, scale=1.0) -> np.ndarray:
+    #Rate of the bracket each taxable income currently sits in
+    lowers, uppers, rates, fees = bracket
+    taxable_income = np.asarray(taxable_income, dtype=float) / scale
+
+    idx = np.clip(np.searchsorted(lowers, taxable_income, side="right") - 1, 0, len(rates) - 1)
+
+    return rates[idx]
+
+
 def calc_federal_ytd_tax_from_buckets(tax_buckets, std_deduct, ordinary_bracket, ltcg_brackets, ytd_tax: float):
     ordinary_income = tax_buckets.federal_ordinary_income
     pref_income=(
@@ -223,16 +420,18 @@ def tax_engine(
     va_ytd_tax: float,
     ytd_medicare_tax: float,
     filing_status: str = "mfs",
+    tax_tables: Dict[str, dict] | None = None,
 ):
-    tax_systems = load_tax_systems("Config/tax_system.json")
+    if tax_tables is None:
+        tax_tables = compile_tax_tables()
+    tax_tables = {name: scaled_tax_table(table) for name, table in tax_tables.items()}
 
-    
-    ltcg_brackets = load_brackets("Config/ltcg_brackets.csv")    
+    ltcg_brackets = tax_tables["ltcg"]["bracket"]
     
     #Federal Taxes
-    fed_bracket = load_brackets("Config/federal_tax_2025.csv")
+    fed_bracket = tax_tables["federal"]["bracket"]
 
-    std_deduct = tax_systems["federal"]["standard_deduction"]
+    std_deduct = tax_tables["federal"]["standard_deduction"]
     
     monthly_tax, new_ytd_tax = calc_federal_ytd_tax_from_buckets(
         tax_buckets, 
@@ -250,9 +449,9 @@ def tax_engine(
 
 
     #Virginia Taxes
-    va_bracket = load_brackets("Config/virginia_tax_2025.csv")
+    va_bracket = tax_tables["virginia"]["bracket"]
 
-    va_std_deduct = tax_systems["virginia"]["standard_deduction"]
+    va_std_deduct = tax_tables["virginia"]["standard_deduction"]
 
     va_monthly_tax, va_new_ytd_tax = calc_va_ytd_tax(
         va_bracket,
@@ -263,4 +462,115 @@ def tax_engine(
 
     return monthly_tax, new_ytd_tax, va_monthly_tax, va_new_ytd_tax, medicare_tax, new_ytd_medicare_tax
     
-    
\ No newline at end of file
+    
+
+
+def calc_taxable_social_security_vec(
+    ordinary_income,
+    pref_income,
+    tax_exempt_interest,
+    social_security_income,
+    filing_status: str = "single"
+) -> np.ndarray:
+    if filing_status == "mfj":
+        base1 = 32000.0
+        base2 = 44000.0
+    elif filing_status == "single":
+        base1 = 25000.0
+        base2 = 34000.0
+    elif filing_status == "mfs":
+        base1 = 0.0
+        base2 = 0.0
+    else:
+        raise ValueError(f"Unsupported filing status: {filing_status}")
+
+    provisional_income = ordinary_income + pref_income + tax_exempt_interest + 0.5 * social_security_income
+
+    lower_tier = np.minimum(
+        0.5 * social_security_income,
+        0.5 * (provisional_income - base1))
+    upper_tier = np.minimum(
+        0.85 * social_security_income,
+        0.85 * (provisional_income - base2) + np.minimum(0.5 * social_security_income, 0.5 * (base2 - base1)))
+
+    taxable_ss = np.where(
+        provisional_income <= base1, 0.0,
+        np.where(provisional_income <= base2, lower_tier, upper_tier))
+    return np.where(social_security_income <= 0, 0.0, np.maximum(0.0, taxable_ss))
+
+
+def calc_federal_ytd_tax_vec(ordinary_income, pref_income, social_security_income, tax_exempt_interest, std_deduct, ordinary_bracket, ltcg_brackets, ordinary_scale=1.0, ltcg_scale=1.0) -> np.ndarray:
+    #calc_federal_ytd_tax_from_buckets for arrays of YTD incomes
+    taxable_ss = calc_taxable_social_security_vec(
+        ordinary_income=ordinary_income,
+        pref_income=pref_income,
+        tax_exempt_interest=tax_exempt_interest,
+        social_security_income=social_security_income,
+        filing_status="single"
+    )
+    federal_ordinary_income_total = ordinary_income + taxable_ss
+
+    ordinary_taxable_income = np.maximum(0.0, federal_ordinary_income_total - std_deduct)
+    deduction_left_for_pref = np.maximum(0.0, std_deduct - federal_ordinary_income_total)
+    pref_taxable_income = np.maximum(0.0, pref_income - deduction_left_for_pref)
+
+    return (
+        calc_tax_vec(ordinary_bracket, ordinary_taxable_income, ordinary_scale)
+        + calc_ltcg_tax_vec(ordinary_taxable_income, pref_taxable_income, ltcg_brackets, ltcg_scale)
+    )
+
+
+def calc_medicare_ytd_tax_vec(medicare_wages_ytd, filing_status: str = "mfs") -> np.ndarray:
+    if filing_status == "mfj":
+        addl_threshold = 250000.0
+    elif filing_status == "single":
+        addl_threshold = 200000.0
+    elif filing_status == "mfs":
+        addl_threshold = 125000.0
+    else:
+        raise ValueError(f"Unsupported filing status: {filing_status}")
+
+    return 0.0145 * medicare_wages_ytd + 0.009 * np.maximum(0.0, medicare_wages_ytd - addl_threshold)
+
+
+def tax_engine_vec(
+    ytd_buckets,
+    ytd_tax,
+    va_ytd_tax,
+    ytd_medicare_tax,
+    filing_status: str = "mfs",
+    tax_tables: Dict[str, dict] | None = None,
+):
+    """
+    tax_engine for a batch of paths. ytd_buckets is a (paths x TAX_BUCKETS)
+    array of YTD income; the other YTD inputs and every output are per path.
+    tax_tables may carry a per path "scale" per system (see tax_tables_for_year).
+    """
+    if tax_tables is None:
+        tax_tables = compile_tax_tables()
+    bucket = {name: ytd_buckets[:, i] for i, name in enumerate(TAX_BUCKETS)}
+    fed_scale = tax_tables["federal"].get("scale", 1.0)
+    va_scale = tax_tables["virginia"].get("scale", 1.0)
+
+    new_ytd_tax = calc_federal_ytd_tax_vec(
+        bucket["federal_ordinary_income"],
+        bucket["federal_ltcg_income"] + bucket["federal_qualified_dividends"],
+        bucket["social_security_income"],
+        bucket["tax_exempt_interest"],
+        tax_tables["federal"]["standard_deduction"] * fed_scale,
+        tax_tables["federal"]["bracket"],
+        tax_tables["ltcg"]["bracket"],
+        fed_scale,
+        tax_tables["ltcg"].get("scale", 1.0),
+    )
+
+    new_ytd_medicare_tax = calc_medicare_ytd_tax_vec(bucket["payroll_medicare_wages"], filing_status)
+
+    va_taxable = np.maximum(0.0, bucket["va_ordinary_income"] - tax_tables["virginia"]["standard_deduction"] * va_scale)
+    va_new_ytd_tax = calc_va_tax_vec(tax_tables["virginia"]["bracket"], va_taxable, va_scale)
+
+    return (
+        new_ytd_tax - ytd_tax, new_ytd_tax,
+        va_new_ytd_tax - va_ytd_tax, va_new_ytd_tax,
+        new_ytd_medicare_tax - ytd_medicare_tax, new_ytd_medicare_tax,
+    )
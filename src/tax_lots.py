@@ -0,0 +1,406 @@
+import heapq
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Cost basis lots of the Brokerage account.
+#
+# Every lot shares the account's price, so a lot is (units, remaining cost) and
+# the account's balance is total units x price. Each month the engines:
+#   mark(balance after growth) -> sell(withdrawal) -> buy(reinvested RMD)
+#   -> reinvest(dividends) -> buy(contribution) or sell(negative cashflow)
+# Purchases within a month become one lot (acquired that month). The opening
+# position is a single long term lot whose cost is the balance less its
+# embedded gain.
+#
+# Lots are sold by method:
+#   fifo  oldest lot first
+#   hifo  highest cost per unit first (smallest gain / largest loss)
+# TaxLots.sell also takes specific lot IDs, sold before the method's order.
+
+LOT_METHODS = ("fifo", "hifo")
+
+#Held more than this many months: long term
+LONG_TERM_MONTHS = 12
+
+#A sale leaving less than this fraction of a lot's units sells the whole lot (rounding dust)
+LOT_DUST = 1e-9
+
+#Acquisition month ordinal of the opening position (always long term)
+OPENING_LOT_ACQUIRED = -(10**9)
+
+
+def check_lot_method(method: str) -> str:
+    method = str(method).lower()
+    if method not in LOT_METHODS:
+        raise ValueError(f"Unknown brokerage_lot_method {method!r} (expected one of {LOT_METHODS})")
+    return method
+
+
+@dataclass
+class LotSale:
+    #Nominal cost and proceeds of the lots a sale consumed, by holding period (floats, or arrays per path)
+    basis_long: float = 0.0
+    proceeds_long: float = 0.0
+    basis_short: float = 0.0
+    proceeds_short: float = 0.0
+
+    @property
+    def gain_long(self):
+        return self.proceeds_long - self.basis_long
+
+    @property
+    def gain_short(self):
+        return self.proceeds_short - self.basis_short
+
+    def __add__(self, other: "LotSale") -> "LotSale":
+        return LotSale(
+            self.basis_long + other.basis_long,
+            self.proceeds_long + other.proceeds_long,
+            self.basis_short + other.basis_short,
+            self.proceeds_short + other.proceeds_short,
+        )
+
+
+class TaxLots:
+    """
+    One path's lots. Open lots live in a dict by lot ID; a heap ordered by
+    the selection method finds the next lot to sell in O(log n). Lots sold
+    out of order (specific IDs) are dropped from the heap lazily, when they
+    reach the top.
+    """
+
+    def __init__(self, method: str = "fifo"):
+        self.method = check_lot_method(method)
+        self.price = 1.0
+        self.units = 0.0
+        self._lots = {}         #lot ID -> [acquired month ordinal, units, cost]
+        self._heap = []         #(priority, lot ID)
+        self._pending = None    #this month's purchases, [acquired, units, cost]
+        self._next_id = 0
+
+    @classmethod
+    def opening(cls, value: float, cost: float, method: str = "fifo") -> "TaxLots":
+        lots = cls(method)
+        if value > 0:
+            lots._pending = [OPENING_LOT_ACQUIRED, value, cost]
+            lots.units = value
+            lots._commit()
+        return lots
+
+    @property
+    def value(self) -> float:
+        return self.units * self.price
+
+    def _commit(self) -> None:
+        if self._pending is None:
+            return
+        lot_id = self._next_id
+        self._next_id += 1
+        _, units, cost = self._lots[lot_id] = self._pending
+        priority = lot_id if self.method == "fifo" else -cost / units
+        heapq.heappush(self._heap, (priority, lot_id))
+        self._pending = None
+
+    def _top(self) -> int:
+        while self._heap[0][1] not in self._lots:
+            heapq.heappop(self._heap)
+        return self._heap[0][1]
+
+    def mark(self, value: float) -> None:
+        #Price the lots at the account's balance (growth since the last event)
+        self._commit()
+        if value <= 0:
+            self._lots, self._heap, self.units, self.price = {}, [], 0.0, 1.0
+        elif self.units > 0:
+            self.price = value / self.units
+        else:
+            #A balance no lot explains is bought at its value
+            self.buy(value, OPENING_LOT_ACQUIRED)
+            self._commit()
+
+    def buy(self, amount: float, month_ord: int) -> None:
+        if amount <= 0:
+            return
+        if self._pending is not None and self._pending[0] != month_ord:
+            self._commit()
+        units = amount / self.price
+        if self._pending is None:
+            self._pending = [month_ord, 0.0, 0.0]
+        self._pending[1] += units
+        self._pending[2] += amount
+        self.units += units
+
+    def reinvest(self, amount: float, month_ord: int) -> None:
+        #A dividend paid out of the balance and bought back: price drops by it, then a new lot
+        value = self.value
+        if amount <= 0 or value <= 0:
+            return
+        self.price *= (value - amount) / value
+        self.buy(amount, month_ord)
+
+    def _take(self, lot_id: int, need: float, month_ord: int, sale: LotSale) -> float:
+        lot = self._lots[lot_id]
+        acquired, units, cost = lot
+        if need >= units * (1 - LOT_DUST):
+            taken, basis = units, cost
+            del self._lots[lot_id]
+        else:
+            taken, basis = need, cost * need / units
+            lot[1] -= taken
+            lot[2] -= basis
+        self.units -= taken
+        proceeds = taken * self.price
+        if month_ord - acquired > LONG_TERM_MONTHS:
+            sale.basis_long += basis
+            sale.proceeds_long += proceeds
+        else:
+            sale.basis_short += basis
+            sale.proceeds_short += proceeds
+        return need - taken
+
+    def sell(self, amount: float, month_ord: int, lot_ids=()) -> LotSale:
+        #Sell `amount` (nominal) of lots: `lot_ids` first, in the given order, then by method
+        self._commit()
+        sale = LotSale()
+        need = amount / self.price if amount > 0 else 0.0
+        for lot_id in lot_ids:
+            if need <= 0:
+                break
+            if lot_id not in self._lots:
+                raise KeyError(f"No open lot {lot_id}")
+            need = self._take(lot_id, need, month_ord, sale)
+        while need > 0 and self._lots:
+            need = self._take(self._top(), need, month_ord, sale)
+        if not self._lots:
+            self.units = 0.0
+        return sale
+
+    def gain_fraction(self) -> float:
+        #Share of the next dollar sold that is a realized gain
+        self._commit()
+        if not self._lots:
+            return 0.0
+        _, units, cost = self._lots[self._top()]
+        return max(0.0, 1.0 - cost / (units * self.price))
+
+    def open_lots(self) -> pd.DataFrame:
+        #Open lots by ID (acquired month ordinal, units, cost, market value), e.g. to pick specific IDs
+        self._commit()
+        rows = [(lot_id, acquired, units, cost, units * self.price) for lot_id, (acquired, units, cost) in self._lots.items()]
+        return pd.DataFrame(rows, columns=["lot", "acquired", "units", "cost", "value"]).set_index("lot")
+
+
+class _MaxTree:
+    """
+    A tournament tree per path over lot columns: each node holds the larger of
+    its two children, so changing a lot and finding the largest are both
+    O(log lots), vectorised over paths. Ties go to the lower (older) column.
+    """
+
+    def __init__(self, n_paths: int, n_leaves: int):
+        self.size = 1 << max(0, (n_leaves - 1).bit_length())
+        self.nodes = np.full((2 * self.size, n_paths), -np.inf)     #node-major: a level's nodes of all paths are adjacent
+
+    def update(self, rows, columns, values) -> None:
+        if rows.size == 0:
+            return
+        node = np.asarray(columns) + self.size
+        self.nodes[node, rows] = values
+        while np.any(node > 1):
+            node = node // 2
+            self.nodes[node, rows] = np.maximum(self.nodes[2 * node, rows], self.nodes[2 * node + 1, rows])
+
+    def clear(self, rows) -> None:
+        self.nodes[:, rows] = -np.inf
+
+    def argmax(self, rows) -> np.ndarray:
+        #Column of each row's largest value, -1 when it has none
+        node = np.ones(len(rows), dtype=int)
+        for _ in range(self.size.bit_length() - 1):
+            left = 2 * node
+            node = np.where(self.nodes[left, rows] >= self.nodes[left + 1, rows], left, left + 1)
+        return np.where(np.isfinite(self.nodes[1, rows]), node - self.size, -1)
+
+
+class BatchTaxLots:
+    """
+    TaxLots for a chunk of paths at once. Lots are columns of (paths x lots)
+    arrays: column 0 is the opening position, column 1 + t the purchases of
+    projected month t, which every path makes in the same months.
+
+    Each path keeps a pointer to its next lot to sell, so a sale takes one
+    vectorised step per lot the busiest path consumes. fifo moves the pointer
+    forward over sold out columns (amortised O(1) per lot); hifo reads it off
+    a _MaxTree of cost per unit (O(log lots) per lot bought or sold out).
+    """
+
+    def __init__(self, value, cost, first_ord: int, n_months: int, method: str = "fifo"):
+        value = np.asarray(value, dtype=float)
+        n_paths = len(value)
+        self.method = check_lot_method(method)
+        self.first_ord = first_ord
+        self.acquired = np.concatenate([[OPENING_LOT_ACQUIRED], first_ord + np.arange(n_months)])
+        self.lot_units = np.zeros((n_paths, n_months + 1))
+        self.lot_cost = np.zeros((n_paths, n_months + 1))
+        self.price = np.ones(n_paths)
+        self.units = np.zeros(n_paths)
+        self.n_lots = 1
+        self.next_lot = np.full(n_paths, -1)     #next lot each path sells, -1 when it holds none
+        self._pending_units = np.zeros(n_paths)
+        self._pending_cost = np.zeros(n_paths)
+        self._pending_column = None
+
+        opening = value > 0
+        self.lot_units[opening, 0] = value[opening]
+        self.lot_cost[opening, 0] = np.broadcast_to(np.asarray(cost, dtype=float), (n_paths,))[opening]
+        self.units[opening] = value[opening]
+        self.next_lot[opening] = 0
+        self._tree = None
+        if self.method == "hifo":
+            self._tree = _MaxTree(n_paths, n_months + 1)
+            rows = np.flatnonzero(opening)
+            self._tree.update(rows, 0, self._cost_per_unit(rows, 0))
+
+    @property
+    def value(self) -> np.ndarray:
+        return self.units * self.price
+
+    def _cost_per_unit(self, rows, lots) -> np.ndarray:
+        return self.lot_cost[rows, lots] / self.lot_units[rows, lots]
+
+    def _commit(self) -> None:
+        if self._pending_column is None:
+            return
+        column = self._pending_column
+        bought = np.flatnonzero(self._pending_units > 0)
+        self.lot_units[bought, column] += self._pending_units[bought]
+        self.lot_cost[bought, column] += self._pending_cost[bought]
+        self.n_lots = max(self.n_lots, column + 1)
+        self._pending_units[:] = 0.0
+        self._pending_cost[:] = 0.0
+        self._pending_column = None
+
+        current = self.next_lot[bought]
+        if self._tree is None:
+            self.next_lot[bought[current < 0]] = column
+            return
+        #hifo: the new lot goes first if it cost more per unit than the pointer lot
+        cost_new = self._cost_per_unit(bought, column)
+        self._tree.update(bought, column, cost_new)
+        held = current >= 0
+        ahead = ~held
+        ahead[held] = cost_new[held] > self._cost_per_unit(bought[held], current[held])
+        self.next_lot[bought[ahead]] = column
+        topped_up = bought[current == column]
+        self.next_lot[topped_up] = self._tree.argmax(topped_up)
+
+    def _find_next(self, rows) -> None:
+        #Point `rows` at their next open lot after their pointer lot sold out
+        if rows.size == 0:
+            return
+        lot = self.next_lot[rows]
+        if self._tree is not None:
+            self._tree.update(rows, lot, -np.inf)
+            self.next_lot[rows] = self._tree.argmax(rows)
+            return
+        while True:
+            stale = (lot < self.n_lots) & (self.lot_units[rows, np.minimum(lot, self.n_lots - 1)] <= 0)
+            if not stale.any():
+                break
+            lot[stale] += 1
+        self.next_lot[rows] = np.where(lot < self.n_lots, lot, -1)
+
+    def mark(self, value) -> None:
+        #Price every path's lots at its balance (growth since the last event)
+        self._commit()
+        value = np.asarray(value, dtype=float)
+        empty = value <= 0
+        if empty.any():
+            self.lot_units[empty] = 0.0
+            self.lot_cost[empty] = 0.0
+            self.units[empty] = 0.0
+            self.price[empty] = 1.0
+            self.next_lot[empty] = -1
+            if self._tree is not None:
+                self._tree.clear(empty)
+        held = ~empty & (self.next_lot >= 0) & (self.units > 0)
+        self.price[held] = value[held] / self.units[held]
+        #A balance no lot explains is bought at its value
+        unexplained = ~empty & ~held
+        if unexplained.any():
+            self.lot_units[unexplained] = 0.0
+            self.lot_cost[unexplained] = 0.0
+            self.lot_units[unexplained, 0] = value[unexplained]
+            self.lot_cost[unexplained, 0] = value[unexplained]
+            self.units[unexplained] = value[unexplained]
+            self.price[unexplained] = 1.0
+            self.next_lot[unexplained] = 0
+            if self._tree is not None:
+                rows = np.flatnonzero(unexplained)
+                self._tree.clear(rows)
+                self._tree.update(rows, 0, 1.0)
+
+    def buy(self, amount, month_ord: int) -> None:
+        amount = np.maximum(np.asarray(amount, dtype=float), 0.0)
+        if not amount.any():
+            return
+        column = 1 + month_ord - self.first_ord
+        if self._pending_column is not None and self._pending_column != column:
+            self._commit()
+        self._pending_column = column
+        units = amount / self.price
+        self._pending_units += units
+        self._pending_cost += amount
+        self.units += units
+
+    def reinvest(self, amount, month_ord: int) -> None:
+        amount = np.asarray(amount, dtype=float)
+        value = self.value
+        paid = (amount > 0) & (value > 0)
+        self.price = np.where(paid, self.price * (value - amount) / np.where(paid, value, 1.0), self.price)
+        self.buy(np.where(paid, amount, 0.0), month_ord)
+
+    def sell(self, amount, month_ord: int) -> LotSale:
+        #Sell `amount` (nominal, per path) of lots in method order
+        self._commit()
+        amount = np.asarray(amount, dtype=float)
+        n_paths = len(self.units)
+        sale = LotSale(*(np.zeros(n_paths) for _ in range(4)))
+        need = np.where(amount > 0, amount / self.price, 0.0)
+        while True:
+            rows = np.flatnonzero((need > 0) & (self.next_lot >= 0))
+            if rows.size == 0:
+                break
+            lot = self.next_lot[rows]
+            units = self.lot_units[rows, lot]
+            cost = self.lot_cost[rows, lot]
+            full = need[rows] >= units * (1 - LOT_DUST)
+            taken = np.where(full, units, need[rows])
+            basis = np.where(full, cost, cost * taken / units)
+            self.lot_units[rows, lot] = np.where(full, 0.0, units - taken)
+            self.lot_cost[rows, lot] = np.where(full, 0.0, cost - basis)
+            self.units[rows] -= taken
+            need[rows] -= taken
+
+            proceeds = taken * self.price[rows]
+            long_term = month_ord - self.acquired[lot] > LONG_TERM_MONTHS
+            sale.basis_long[rows] += np.where(long_term, basis, 0.0)
+            sale.proceeds_long[rows] += np.where(long_term, proceeds, 0.0)
+            sale.basis_short[rows] += np.where(long_term, 0.0, basis)
+            sale.proceeds_short[rows] += np.where(long_term, 0.0, proceeds)
+            self._find_next(rows[full])
+        self.units[self.next_lot < 0] = 0.0
+        return sale
+
+    def gain_fraction(self) -> np.ndarray:
+        #Share of the next dollar sold that is a realized gain, per path
+        self._commit()
+        fraction = np.zeros(len(self.units))
+        rows = np.flatnonzero(self.next_lot >= 0)
+        if rows.size:
+            lot = self.next_lot[rows]
+            value = self.lot_units[rows, lot] * self.price[rows]
+            fraction[rows] = np.maximum(0.0, 1.0 - self.lot_cost[rows, lot] / value)
+        return fraction
@@ -0,0 +1,287 @@
+import asyncio
+import json
+import sys
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from monte_carlo import MC_METRICS, compile_projection, growth_from_shocks, simulate_paths
+from run_projection import load_inputs, run
+from sensitivity import SAMPLEABLE
+
+# Local what-if service. Inputs, tax schedule and the compiled plan are loaded
+# once at start and stay warm; each query only runs the monthly loop.
+#
+#   python src/whatif_service.py Config/base.json --port 8765
+#
+#   POST /projection  {"overrides": {"retirement": "2034-01-01", "withdrawal_rate": 0.035,
+#                                    "roth_end_age": 72}, "detail": "summary" | "full"}
+#   POST /batch       {"scenarios": [{...overrides...}, ...], "detail": "summary"}
+#   GET  /assumptions the base assumptions
+#   GET  /health
+#
+# Overrides of assumptions simulate_paths takes per path (BATCHABLE) are
+# answered by the batch engine: requests that arrive within `batch_window`
+# seconds of each other become rows of one simulate_paths call. Any other
+# override (withdrawal_type, withdrawal_order, horizon, ...) re-runs
+# run_projection.run on the warm inputs. Either way a "full" answer carries
+# the MC_METRICS columns. Answers are cached by parsed overrides, so "0.035"
+# and 0.035 share an entry; a value that doesn't parse is a 400.
+#
+# The server binds to 127.0.0.1 only; it has no authentication.
+
+BATCHABLE = set(SAMPLEABLE) | {"rmd_start_age"}
+#Overrides parsed as dates
+DATE_OVERRIDES = {"retirement", "horizon", "basis", "birthday", "pension_start"}
+
+ENDING_METRICS = ("Net_Worth", "Net_Worth_Real")
+TOTAL_METRICS = ("Net_Income_Real", "Total Tax", "ROTH Conversion")
+
+
+def _json_value(value):
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return pd.Timestamp(value).strftime("%Y-%m-%d")
+    if isinstance(value, (np.floating, float)):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+def _series(values) -> List:
+    return [None if np.isnan(v) else float(v) for v in np.asarray(values, dtype=float)]
+
+
+def _failed_month(projection: pd.DataFrame, retirement) -> int:
+    #simulate_paths' rule on a projection_engine frame: first month from the withdrawal start whose
+    #withdrawal could not be funded in full, or that ends with no money left; -1 if none
+    active = projection["Date"] >= pd.Timestamp(retirement)
+    failed = (active & ((projection["Withdrawal Shortfall"] > 0.01) | (projection["Net_Worth"] <= 0))).to_numpy()
+    return int(np.argmax(failed)) if failed.any() else -1
+
+
+class WhatIfEngine:
+
+    def __init__(self, inputs, cache_size: int = 1024):
+        self.inputs = inputs
+        self.assumptions = inputs.assumptions
+        self.plan = compile_projection(
+            inputs.account_tax_map, inputs.rmd_table, inputs.start_bal, inputs.cf, inputs.months,
+            inputs.assumptions, balances_actuals=inputs.balances_actuals, config_sources=inputs.config_sources,
+        )
+        self.dates = [d.strftime("%Y-%m-%d") for d in inputs.months]
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Dict]" = OrderedDict()
+
+    @staticmethod
+    def cache_key(overrides: Dict, detail: str) -> str:
+        return json.dumps([overrides, detail], sort_keys=True, default=str)
+
+    def cached(self, key: str):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        return None
+
+    def remember(self, key: str, answer: Dict) -> None:
+        self._cache[key] = answer
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    @staticmethod
+    def batchable(overrides: Dict) -> bool:
+        return all(key in BATCHABLE for key in overrides)
+
+    @staticmethod
+    def normalize(overrides: Dict) -> Dict:
+        #Parse values up front so a bad value fails its own request, not the whole batch, and
+        #equal overrides written differently (a number as a string, two date formats) cache together
+        values = {}
+        for key, value in overrides.items():
+            if key in DATE_OVERRIDES:
+                values[key] = pd.Timestamp(value)
+            elif key in BATCHABLE:
+                values[key] = float(value)
+            else:
+                values[key] = value
+        return values
+
+    def _answer(self, metrics: Dict[str, np.ndarray], failed_month: int, detail: str, dates: List[str] = None) -> Dict:
+        #failed_month: first month a path could not fund its withdrawal, -1 if none; dates default to the warm months
+        dates = dates or self.dates
+        answer = {
+            "ending": {name: float(metrics[name][-1]) for name in ENDING_METRICS},
+            "min_net_worth_real": float(np.min(metrics["Net_Worth_Real"])),
+            "totals": {name: float(np.sum(metrics[name])) for name in TOTAL_METRICS},
+            "failed": failed_month >= 0,
+            "failed_date": dates[failed_month] if failed_month >= 0 else None,
+        }
+        if detail == "full":
+            answer["projection"] = {"Date": dates, **{name: _series(metrics[name]) for name in MC_METRICS}}
+        return answer
+
+    def evaluate_batch(self, requests: List[Tuple[Dict, str]]) -> List[Dict]:
+        #One simulate_paths call for every request, one path each (returns at the expected rate)
+        n = len(requests)
+        batch = dict(self.assumptions)
+        for key in {key for overrides, _ in requests for key in overrides}:
+            if key == "retirement":
+                batch[key] = pd.DatetimeIndex([o.get(key, self.assumptions[key]) for o, _ in requests])
+            else:
+                batch[key] = np.array([o.get(key, self.assumptions.get(key, np.nan)) for o, _ in requests], dtype=float)
+
+        growth = growth_from_shocks(np.zeros((n, len(self.plan["months"]))), batch["annual_return"], 0.0)
+        result = simulate_paths(self.plan, batch, growth)
+        return [
+            self._answer({name: result["metrics"][name][i] for name in MC_METRICS}, int(result["failed_month"][i]), detail)
+            for i, (_, detail) in enumerate(requests)
+        ]
+
+    def evaluate_full_run(self, overrides: Dict, detail: str) -> Dict:
+        #Overrides the batch engine can't vary per path: scalar projection on the warm inputs
+        result = run(self.inputs, overrides)
+        projection = result.projection
+        metrics = {name: projection[name].to_numpy(dtype=float) for name in MC_METRICS}
+        dates = [d.strftime("%Y-%m-%d") for d in projection["Date"]]      #a horizon override changes the months
+        return self._answer(metrics, _failed_month(projection, result.assumptions["retirement"]), detail, dates)
+
+
+class WhatIfService:
+
+    def __init__(self, engine: WhatIfEngine, batch_window: float = 0.002, max_batch: int = 512):
+        self.engine = engine
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.queue: asyncio.Queue = None
+        self.stats = {"requests": 0, "cache_hits": 0, "batches": 0, "batched_requests": 0, "full_runs": 0}
+
+    async def query(self, overrides: Dict, detail: str = "summary") -> Dict:
+        self.stats["requests"] += 1
+        overrides = self.engine.normalize(overrides)
+        key = self.engine.cache_key(overrides, detail)
+        answer = self.engine.cached(key)
+        if answer is not None:
+            self.stats["cache_hits"] += 1
+            return answer
+
+        if self.engine.batchable(overrides):
+            future = asyncio.get_running_loop().create_future()
+            await self.queue.put((overrides, detail, future))
+            answer = await future
+        else:
+            self.stats["full_runs"] += 1
+            answer = await asyncio.to_thread(self.engine.evaluate_full_run, overrides, detail)
+        self.engine.remember(key, answer)
+        return answer
+
+    async def batcher(self) -> None:
+        #Collect the requests that arrive within batch_window of the first one, run them as one call
+        while True:
+            pending = [await self.queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(pending) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self.stats["batches"] += 1
+            self.stats["batched_requests"] += len(pending)
+            try:
+                answers = await asyncio.to_thread(self.engine.evaluate_batch, [(o, d) for o, d, _ in pending])
+            except Exception as exc:
+                for _, _, future in pending:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            for (_, _, future), answer in zip(pending, answers):
+                if not future.done():
+                    future.set_result(answer)
+
+    async def route(self, method: str, path: str, body: Dict):
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok", **self.stats}
+        if method == "GET" and path == "/assumptions":
+            return 200, {key: _json_value(value) for key, value in self.engine.assumptions.items()}
+        if method == "POST" and path == "/projection":
+            return 200, await self.query(body.get("overrides", {}), body.get("detail", "summary"))
+        if method == "POST" and path == "/batch":
+            detail = body.get("detail", "summary")
+            answers = await asyncio.gather(*(self.query(overrides, detail) for overrides in body.get("scenarios", [])))
+            return 200, {"results": list(answers)}
+        return 404, {"error": f"No route for {method} {path}"}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        #Minimal HTTP/1.1: one JSON request per connection, Content-Length bodies
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", 0))
+            raw = await reader.readexactly(length) if length else b""
+
+            try:
+                method, path = request_line[0], request_line[1]
+                status, payload = await self.route(method, path.split("?")[0], json.loads(raw) if raw else {})
+            except (IndexError, ValueError, KeyError, TypeError) as exc:
+                status, payload = 400, {"error": f"{type(exc).__name__}: {exc}"}
+            except Exception as exc:
+                status, payload = 500, {"error": f"{type(exc).__name__}: {exc}"}
+
+            data = json.dumps(payload).encode()
+            reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}[status]
+            writer.write(
+                f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, port: int = 8765, ready=None) -> None:
+        self.queue = asyncio.Queue()
+        batcher = asyncio.create_task(self.batcher())
+        server = await asyncio.start_server(self.handle, "127.0.0.1", port)
+        if ready is not None:
+            ready(server)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+
+def main(argv: List[str]) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local what-if projection service")
+    parser.add_argument("scenario", nargs="?", default="Config/base.json")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--batch-window", type=float, default=0.002, help="seconds to wait for more requests to batch")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    engine = WhatIfEngine(load_inputs(args.scenario))
+    service = WhatIfService(engine, batch_window=args.batch_window)
+    print(f"Loaded {args.scenario} in {time.perf_counter() - started:.2f}s; serving on http://127.0.0.1:{args.port}")
+    try:
+        asyncio.run(service.serve(args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
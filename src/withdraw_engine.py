@@ -1,146 +1,297 @@
-RMD_ELIGIGIBLE_ACCOUNT_TYPES = {
+import numpy as np
+import pandas as pd
+
+from tax_engine import calc_tax_vec, calc_ltcg_tax_vec, calc_va_tax_vec, marginal_rate
+from withdrawal_strategies import get_strategy, register_strategy
+
+RMD_ELIGIBLE_ACCOUNT_TYPES = {
     "tsp", 
-    "457b"
+    "457b",
     "403b", 
     "traditional_ira", 
     "401k",
 }
 
-def is_rmd_eligible(acct: str, account_tax_map) -> bool:
-    account_type = str(account_tax_map.loc[acct, "account_type"]).strip().lower()
-    return account_type in RMD_ELIGIGIBLE_ACCOUNT_TYPES
-
-def get_rmd_divisor(age: int, rmd_table: dict[float, float]) -> float | None:
-    return rmd_table.get(age)
-
-def calc_annual_rmd(blance: float, divisor: float) -> float:
-    if divisor <= 0:
-        raise ValueError("RMD divisior must be positive")
-    return max(0.0, balance/divisor)
-
-def calc_monthly_rmds(
-    balances,
-    account_tax_map,
-    age: float,
-    rmd_table: dict[float, float],
-    rmd_start_age: int = 73,
-)-> dict[str, float]:
-    age_int = int(age)
-
-    if age_int < rmd_start_age:
-        return {}
-    
-    divisor = get_rmd_divisor(age_int, rmd_table)
-    if divisor is None:
-        return{}
-    rmd_by_account = {}
-    
-    for acct in balances.index:
-        if not is_rmd_eligible(acct, account_tax_map):
-            continue
-        bal = float(balances.get(acct, 0.0))
-        if bal <= 0:
-            continue
-
-        annual_rmd = calc_annual_rmd(bal, divisor)
-        monthly_rmd = annual_rmd / 12.0
-
-        if monthly_rmd > 0:
-            rmd_by_account[acct] = monthly_rmd
-    return rmd_by_account
-
-def classic_withdrawal(m, annual_w0, balances_actuals, withdrawal_start_date, balances, withdrawal_rate, t0, inflation):
-    if annual_w0 is None:
-        if balances_actuals is not None and withdrawal_start_date in balances_actuals.index:
-            b0 = balances_actuals.loc[withdrawal_start_date, balances.index].astype(float)
-        else:
-            b0 = balances.copy()
-
-        annual_w0 = withdrawal_rate * float(b0.sum())
-        t0 = withdrawal_start_date
-
-    #Add inflation to withdrawal basis
-    delta_months = (m.to_period("M") - t0.to_period("M")).n
-    annual_withdrawal = annual_w0*(1+inflation)**(delta_months/12)                  #delta_months is negative
-    withdrawal = annual_withdrawal/12.0
-    return withdrawal, annual_w0, t0
+def rmd_eligibility_mask(accounts, account_tax_map) -> np.ndarray:
+    #One flag per account (in `accounts` order), compiled once per run
+    account_types = account_tax_map["account_type"].reindex(accounts)
+    account_types = account_types.fillna("").astype(str).str.strip().str.lower()
+    return account_types.isin(RMD_ELIGIBLE_ACCOUNT_TYPES).to_numpy()
+
+def rmd_divisor_schedule(months, birthday, rmd_table: dict[float, float], rmd_start_age: int = 73) -> np.ndarray:
+    #Uniform lifetime divisor for each month, NaN in months with no RMD.
+    #The divisor is set by the age reached by the end of that calendar year.
+    ages = np.asarray(months.year) - birthday.year
+    divisors = np.array([rmd_table.get(int(age), np.nan) for age in ages], dtype=float)
+    divisors[ages < rmd_start_age] = np.nan
+    return divisors
+
+def calc_annual_rmd(balance, divisor):
+    if np.any(np.asarray(divisor) <= 0):
+        raise ValueError("RMD divisor must be positive")
+    return np.maximum(0.0, balance/divisor)
+
+def calc_monthly_rmds(prior_year_end, rmd_mask, divisor) -> np.ndarray:
+    #(paths x accounts) RMD due this month from prior year end balances; zero with no divisor
+    prior_year_end = np.atleast_2d(np.asarray(prior_year_end, dtype=float))
+    divisor = np.reshape(np.asarray(divisor, dtype=float), (-1, 1))
+    due = np.where(rmd_mask & ~np.isnan(divisor), 1.0, 0.0)
+    return calc_annual_rmd(prior_year_end, np.where(np.isnan(divisor), 1.0, divisor)) * due / 12.0
+
+def apply_rmd_topup(balances, draws, required, reinvest_idx=None):
+    """
+    Take whatever part of this month's RMD the withdrawal strategy didn't
+    already draw from each account. The extra cash is not spending, so it is
+    moved to the reinvest account (e.g. Brokerage) when one is given.
+
+    balances, draws, required: (paths x accounts) arrays
+    Returns the new balances, the per-account extra draw and the total extra per path.
+    """
+    balances = np.atleast_2d(np.asarray(balances, dtype=float))
+    extra = np.clip(required - draws, 0.0, np.maximum(balances, 0.0))
+    balances = balances - extra
+    extra_total = extra.sum(axis=1)
+    if reinvest_idx is not None and reinvest_idx >= 0:
+        balances[:, reinvest_idx] += extra_total
+    return balances, extra, extra_total
+
+def _waterfall_remaining(ordered, withdrawal):
+    #Withdrawal still owed before/after each account; cumsum over [w, -b1, -b2, ...]
+    #subtracts in the same order as taking the accounts one at a time
+    remaining = np.cumsum(np.concatenate([withdrawal[:, None], -ordered], axis=1), axis=1)
+    #An account is reached while something is still owed on every account before it
+    reached = np.logical_and.accumulate(remaining[:, :-1] > 0, axis=1)
+    return remaining, reached
+
+def withdrawal_waterfall_vec(balances, withdrawal, order_idx):
+    """
+    Take `withdrawal` from each row of a (paths x accounts) balance matrix,
+    emptying accounts in `order_idx` (column positions) in turn.
+
+    Returns the new balances, the (paths x accounts) draw per account and the
+    amount actually withdrawn per path.
+    """
+    balances = np.atleast_2d(np.asarray(balances, dtype=float))
+    withdrawal = np.broadcast_to(np.asarray(withdrawal, dtype=float), (balances.shape[0],))
+    ordered = balances[:, order_idx]
+
+    remaining, reached = _waterfall_remaining(ordered, withdrawal)
+    remaining_before = remaining[:, :-1]
+    covered = reached & (ordered >= remaining_before)
+    ordered_draws = np.where(covered, remaining_before, np.where(reached, ordered, 0.0))
+    ordered_new = np.where(covered, ordered - remaining_before, np.where(reached, 0.0, ordered))
+
+    remaining_after = np.where(covered.any(axis=1), 0.0, np.where(reached[:, 0], remaining[:, -1], withdrawal))
+    actual_withdrawal = withdrawal - remaining_after
+
+    new_balances = balances.copy()
+    new_balances[:, order_idx] = ordered_new
+    draws = np.zeros_like(balances)
+    draws[:, order_idx] = ordered_draws
+    return new_balances, draws, actual_withdrawal
 
 def withdrawal_waterfall(balances, withdrawal, order):
-    remaining_withdrawal = withdrawal
-    row = balances.copy()
-    income_sources = {}
-    for acct in order:
-        if remaining_withdrawal <= 0:
+    order_idx = balances.index.get_indexer(order)
+    values = balances.to_numpy(dtype=float)[None, :]
+    new_balances, draws, actual_withdrawal = withdrawal_waterfall_vec(values, withdrawal, order_idx)
+
+    #Accounts reached are reported even if they had nothing to give
+    reached = _waterfall_remaining(values[:, order_idx], np.array([float(withdrawal)]))[1][0]
+    income_sources = {
+        acct: float(draws[0, i])
+        for acct, i, was_reached in zip(order, order_idx, reached)
+        if was_reached
+    }
+
+    balances = pd.Series(new_balances[0], index=balances.index, name=balances.name)
+    return balances, income_sources, float(actual_withdrawal[0])
+
+
+
+def _scale(tax_tables, system):
+    return tax_tables[system].get("scale", 1.0)
+
+def _ytd_tax_vec(ordinary, pref, va_income, tax_tables):
+    #Federal ordinary + LTCG/qualified dividend + Virginia tax on YTD nominal income, per path
+    std_deduct = tax_tables["federal"]["standard_deduction"] * _scale(tax_tables, "federal")
+    ordinary_taxable = np.maximum(0.0, ordinary - std_deduct)
+    deduction_left_for_pref = np.maximum(0.0, std_deduct - ordinary)
+    pref_taxable = np.maximum(0.0, pref - deduction_left_for_pref)
+
+    fed_tax = (
+        calc_tax_vec(tax_tables["federal"]["bracket"], ordinary_taxable, _scale(tax_tables, "federal"))
+        + calc_ltcg_tax_vec(ordinary_taxable, pref_taxable, tax_tables["ltcg"]["bracket"], _scale(tax_tables, "ltcg"))
+    )
+    va_taxable = np.maximum(0.0, va_income - tax_tables["virginia"]["standard_deduction"] * _scale(tax_tables, "virginia"))
+    va_tax = calc_va_tax_vec(tax_tables["virginia"]["bracket"], va_taxable, _scale(tax_tables, "virginia"))
+
+    return fed_tax + va_tax, ordinary_taxable, pref_taxable, va_taxable
+
+def solve_gross_withdrawal(
+    target_net,
+    ordered_balances,
+    ordinary_share,
+    ltcg_share,
+    ytd_ordinary,
+    ytd_pref,
+    ytd_va,
+    tax_tables,
+    max_iter: int = 6,
+    tol: float = 0.01,
+):
+    """
+    Gross monthly draw (nominal dollars, per path) that leaves `target_net` after the
+    tax it adds on top of the YTD income already booked this year.
+
+    ordered_balances: (paths x accounts) balances in withdrawal order
+    ordinary_share / ltcg_share: fraction of a draw from each account that is
+        ordinary income / long term gains, (accounts,) or (paths x accounts)
+    ytd_*: YTD federal ordinary, federal preferential and Virginia income per path
+    tax_tables: the tax year's tables (tax_tables_for_year)
+
+    The first step uses the marginal rate of the bracket the last dollar lands
+    in; later steps use the secant through the previous guess, so crossing a
+    bracket or account boundary still converges in a couple of iterations.
+    Social Security taxation is left to tax_engine.
+    """
+    ordered_balances = np.atleast_2d(np.asarray(ordered_balances, dtype=float))
+    n_paths = ordered_balances.shape[0]
+    target_net = np.broadcast_to(np.asarray(target_net, dtype=float), (n_paths,))
+    ytd_ordinary = np.broadcast_to(np.asarray(ytd_ordinary, dtype=float), (n_paths,))
+    ytd_pref = np.broadcast_to(np.asarray(ytd_pref, dtype=float), (n_paths,))
+    ytd_va = np.broadcast_to(np.asarray(ytd_va, dtype=float), (n_paths,))
+    ordinary_share = np.broadcast_to(np.asarray(ordinary_share, dtype=float), ordered_balances.shape)
+    ltcg_share = np.broadcast_to(np.asarray(ltcg_share, dtype=float), ordered_balances.shape)
+
+    order_idx = np.arange(ordered_balances.shape[1])
+    available = ordered_balances.sum(axis=1)
+    base_tax = _ytd_tax_vec(ytd_ordinary, ytd_pref, ytd_va, tax_tables)[0]
+    fed_std_deduct = tax_tables["federal"]["standard_deduction"] * _scale(tax_tables, "federal")
+    va_std_deduct = tax_tables["virginia"]["standard_deduction"] * _scale(tax_tables, "virginia")
+
+    gross = np.minimum(target_net, available)
+    prev_gross = prev_net = None
+    for _ in range(max_iter):
+        draws = withdrawal_waterfall_vec(ordered_balances, gross, order_idx)[1]
+        add_ordinary = (draws * ordinary_share).sum(axis=1)
+        add_pref = (draws * ltcg_share).sum(axis=1)
+        tax, ordinary_taxable, pref_taxable, va_taxable = _ytd_tax_vec(
+            ytd_ordinary + add_ordinary,
+            ytd_pref + add_pref,
+            ytd_va + add_ordinary + add_pref,
+            tax_tables,
+        )
+        net = gross - (tax - base_tax)
+        shortfall = target_net - net
+        #Converged paths stop moving, so a path's answer doesn't depend on the rest of its batch
+        done = (np.abs(shortfall) < tol) | ((shortfall > 0) & (gross >= available))
+        if np.all(done):
             break
-        available = row[acct]
 
-        if available >= remaining_withdrawal:
-            taken = remaining_withdrawal
-            row[acct] -= taken
-            remaining_withdrawal = 0.0
-            
-        else:
-            taken = available
-            row[acct] = 0.0
-            remaining_withdrawal -= taken
-        income_sources[acct] = taken
-    actual_withdrawal = withdrawal - remaining_withdrawal
+        #Account the next dollar comes from and the bracket it lands in
+        active = np.minimum((np.cumsum(ordered_balances, axis=1) <= gross[:, None]).sum(axis=1), ordered_balances.shape[1] - 1)[:, None]
+        fed_rate = np.where(ytd_ordinary + add_ordinary > fed_std_deduct, marginal_rate(tax_tables["federal"]["bracket"], ordinary_taxable, _scale(tax_tables, "federal")), 0.0)
+        ltcg_rate = marginal_rate(tax_tables["ltcg"]["bracket"], ordinary_taxable + pref_taxable, _scale(tax_tables, "ltcg"))
+        va_rate = np.where(ytd_va + add_ordinary + add_pref > va_std_deduct, marginal_rate(tax_tables["virginia"]["bracket"], va_taxable, _scale(tax_tables, "virginia")), 0.0)
+        active_ordinary = np.take_along_axis(ordinary_share, active, axis=1)[:, 0]
+        active_ltcg = np.take_along_axis(ltcg_share, active, axis=1)[:, 0]
+        slope = 1.0 - (active_ordinary * (fed_rate + va_rate) + active_ltcg * (ltcg_rate + va_rate))
+
+        #Once the step crosses a bracket or account boundary the secant slope is the better estimate
+        if prev_gross is not None:
+            step = gross - prev_gross
+            secant = np.divide(net - prev_net, step, out=slope.copy(), where=np.abs(step) > tol)
+            slope = np.where(secant > 0.0, secant, slope)
 
-    balances = row
-    return balances, income_sources, actual_withdrawal
+        prev_gross, prev_net = gross, net
+        gross = np.where(done, gross, np.clip(gross + shortfall / slope, 0.0, available))
 
+    return gross
 
+@register_strategy("net")
+def net_target_withdrawal(ctx, state):
+    #Nominal monthly gross draw from the withdrawal order accounts that nets `net_spending_real` after tax
+    net_spending_real = ctx["assumptions"].get("net_spending_real")
+    tax_context = ctx.get("tax_context")
+    if net_spending_real is None or tax_context is None:
+        raise ValueError("Withdrawal type 'net' needs net_spending_real and tax_context")
+
+    #Taxes are nominal (this year's brackets), so solve for this month's nominal net
+    return solve_gross_withdrawal(
+        target_net=net_spending_real / tax_context["deflator"],
+        ordered_balances=ctx["ordered_balances"],
+        ordinary_share=tax_context["ordinary_share"],
+        ltcg_share=tax_context["ltcg_share"],
+        ytd_ordinary=tax_context["ytd_ordinary"],
+        ytd_pref=tax_context["ytd_pref"],
+        ytd_va=tax_context["ytd_va"],
+        tax_tables=tax_context["tax_tables"],
+    )
 
 def calc_withdrawal(
     *, 
     m,
     rmd_table, 
-    account_tax_map,
     age,
     withdrawal_start_date, 
     withdrawal_type, 
     balances, 
     withdrawal_rate, 
     order, 
-    inflation, 
-    annual_w0=None, 
-    t0=None, 
+    inflation_factor, 
+    withdrawal_state,
+    rmd_state,
+    rmd_divisor=np.nan,
+    assumptions=None,
     balances_actuals=None,
-    rmd_start_age=73,
+    tax_context=None,
     ):
     
     withdrawal = 0.0
     income_sources = {}
-    if m < withdrawal_start_date:
-        return balances, income_sources, withdrawal, annual_w0, t0 
-
-    if withdrawal_type== "VPW":
-        withdrawal = float(balances.sum())*float(withdrawal_rate)/12.0
-                
-    elif withdrawal_type == "4pct":
-        withdrawal, annual_w0, t0 = classic_withdrawal(m, annual_w0, balances_actuals, withdrawal_start_date, balances, withdrawal_rate, t0, inflation)
-
-    else:
-        raise ValueError(f"Unknown withdrawal type: {withdrawal_type}")
-
-    #Take withdrawal from accounts in order
-    balances, income_sources, actual_withdrawal = withdrawal_waterfall(balances, withdrawal, order)
-
-    #Calculate RMD
-    rmd_by_account = calc_monthly_rmds(
-        balances= balances,
-        account_tax_map = account_tax_map,
-        age = age,
-        rmd_table=rmd_table,
-        rmd_start_age=rmd_start_age,
-    )
+    withdrawal_state["requested"] = 0.0            #what the strategy asked for; the waterfall may fund less
+    if m >= withdrawal_start_date:
+        strategy = get_strategy(withdrawal_type)
+
+        if "start_total" not in withdrawal_state:
+            if balances_actuals is not None and withdrawal_start_date in balances_actuals.index:
+                b0 = balances_actuals.loc[withdrawal_start_date, balances.index].astype(float)
+            else:
+                b0 = balances
+            withdrawal_state["start_total"] = np.array([float(b0.sum())])
+
+        delta_months = (m.to_period("M") - withdrawal_start_date.to_period("M")).n
+        ctx = {
+            "total": np.array([float(balances.sum())]),
+            "start_total": withdrawal_state["start_total"],
+            "ordered_balances": balances[order].to_numpy(dtype=float)[None, :],
+            "months_since_start": np.array([delta_months]),
+            "active": np.array([True]),
+            "age": np.array([age]),
+            "withdrawal_rate": np.array([float(withdrawal_rate)]),
+            "inflation_factor": np.array([inflation_factor]),
+            "assumptions": assumptions or {},
+            "rmd_table": rmd_table,
+            "tax_context": tax_context,
+        }
+        withdrawal = float(strategy(ctx, withdrawal_state)[0])
+        withdrawal_state["requested"] = withdrawal
+
+        #Take withdrawal from accounts in order
+        balances, income_sources, withdrawal = withdrawal_waterfall(balances, withdrawal, order)
 
-    for acct, rmd_amt in rmd_by_account.items():
-        already = income_sources.get(acct, 0.0)
-        if already >= rmd_amt:
-            continue
+    #Top up to the RMD on the prior year end balance of every eligible account
+    rmd_extra = 0.0
+    if not np.isnan(rmd_divisor):
+        required = calc_monthly_rmds(rmd_state["prior_year_end"], rmd_state["mask"], rmd_divisor)
+        draws = np.array([[income_sources.get(acct, 0.0) for acct in balances.index]])
+        new_balances, extra, extra_total = apply_rmd_topup(
+            balances.to_numpy(dtype=float)[None, :], draws, required, rmd_state.get("reinvest_idx")
+        )
+        for acct, amount in zip(balances.index, extra[0]):
+            if amount > 0:
+                income_sources[acct] = income_sources.get(acct, 0.0) + float(amount)
+        balances = pd.Series(new_balances[0], index=balances.index, name=balances.name)
+        rmd_extra = float(extra_total[0])
 
-        extra = rmd_amt - already
-        
-        
-    return balances, income_sources, actual_withdrawal, annual_w0, t0
\ No newline at end of file
+    return balances, income_sources, withdrawal, rmd_extra
\ No newline at end of file
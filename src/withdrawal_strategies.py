@@ -0,0 +1,169 @@
+import importlib
+from functools import lru_cache
+from typing import Callable, Dict, Iterable
+
+import numpy as np
+
+# A withdrawal strategy maps (ctx, state) -> monthly nominal withdrawal per path.
+#
+# ctx holds arrays with one entry per path:
+#   total               balance of all accounts
+#   start_total         balance to size the first withdrawal from
+#   ordered_balances    (paths x accounts) balances in withdrawal order
+#   months_since_start  months since the withdrawal start date
+#   age                 age in years
+#   withdrawal_rate     annual withdrawal rate
+#   inflation_factor    price growth since the withdrawal start date
+#   active              paths that have reached their withdrawal start date
+# plus the scenario `assumptions`, the `rmd_table` and an optional `tax_context`.
+#
+# state is a dict of per-path arrays owned by the strategy. It starts empty and
+# is kept between months by the caller, so strategies must initialise their own keys.
+
+WITHDRAWAL_STRATEGIES: Dict[str, Callable] = {}
+
+
+def register_strategy(name: str):
+    def decorator(fn):
+        WITHDRAWAL_STRATEGIES[name] = fn
+        return fn
+    return decorator
+
+
+def get_strategy(name: str) -> Callable:
+    try:
+        return WITHDRAWAL_STRATEGIES[name]
+    except KeyError:
+        raise ValueError(f"Unknown withdrawal type: {name}") from None
+
+
+def load_strategy_plugins(modules: Iterable[str] | None) -> None:
+    #Plugin modules call register_strategy() when imported
+    for module in modules or ():
+        importlib.import_module(module)
+
+
+def _state_array(state, key, n_paths, fill=np.nan):
+    if key not in state:
+        state[key] = np.full(n_paths, fill)
+    return state[key]
+
+
+def _initial_withdrawal(ctx, state, key="annual_w0"):
+    #Annual withdrawal set from the starting balance the first month a path is withdrawing
+    annual_w0 = _state_array(state, key, len(ctx["total"]))
+    new = np.isnan(annual_w0) & ctx["active"]
+    annual_w0[new] = (ctx["withdrawal_rate"] * ctx["start_total"])[new]
+    return annual_w0
+
+
+@lru_cache(maxsize=None)
+def vpw_rate_table(real_return: float = 0.04, final_age: int = 100, max_age: int = 120) -> np.ndarray:
+    #Annual VPW rate indexed by age: payment (at the start of each year) that
+    #amortises the portfolio to zero by final_age at real_return
+    ages = np.arange(max_age + 1)
+    years_left = np.maximum(final_age - ages + 1, 1)
+    if real_return == 0:
+        return 1.0 / years_left
+    r = real_return
+    return r / ((1 + r) * (1 - (1 + r) ** (-years_left)))
+
+
+@lru_cache(maxsize=None)
+def _divisor_by_age(rmd_items: tuple, max_age: int = 120) -> np.ndarray:
+    #Uniform lifetime divisors indexed by age; ages below the table add a year of life expectancy per year
+    rmd_table = dict(rmd_items)
+    first_age = min(rmd_table)
+    last_age = max(rmd_table)
+    ages = np.arange(max_age + 1)
+    divisors = np.array([rmd_table.get(min(max(a, first_age), last_age)) for a in ages], dtype=float)
+    divisors[ages < first_age] += first_age - ages[ages < first_age]
+    return divisors
+
+
+@register_strategy("VPW")
+def vpw_withdrawal(ctx, state):
+    return ctx["total"] * ctx["withdrawal_rate"] / 12.0
+
+
+@register_strategy("4pct")
+def classic_withdrawal(ctx, state):
+    annual_w0 = _initial_withdrawal(ctx, state)
+    annual_withdrawal = annual_w0 * ctx["inflation_factor"]
+    return annual_withdrawal / 12.0
+
+
+@register_strategy("vpw_age")
+def age_vpw_withdrawal(ctx, state):
+    assumptions = ctx["assumptions"]
+    table = vpw_rate_table(
+        float(assumptions.get("vpw_real_return", 0.04)),
+        int(assumptions.get("vpw_final_age", 100)),
+    )
+    age_idx = np.clip(np.asarray(ctx["age"], dtype=int), 0, len(table) - 1)
+    return ctx["total"] * table[age_idx] / 12.0
+
+
+@register_strategy("guyton_klinger")
+def guyton_klinger_withdrawal(ctx, state):
+    """
+    Guyton-Klinger guardrails, reviewed every 12 months after the start:
+      - inflation raise is skipped after a year the portfolio lost value
+      - capital preservation: cut by gk_adjustment when the current rate is
+        more than gk_guardrail above the initial rate
+      - prosperity: raise by gk_adjustment when it is more than gk_guardrail below
+    """
+    assumptions = ctx["assumptions"]
+    guardrail = float(assumptions.get("gk_guardrail", 0.20))
+    adjustment = float(assumptions.get("gk_adjustment", 0.10))
+
+    total = ctx["total"]
+    n_paths = len(total)
+    annual_w = _state_array(state, "annual_w", n_paths)
+    last_total = _state_array(state, "last_total", n_paths)
+    last_factor = _state_array(state, "last_factor", n_paths)
+
+    new = np.isnan(annual_w) & ctx["active"]
+    annual_w[new] = (ctx["withdrawal_rate"] * ctx["start_total"])[new]
+    last_total[new] = total[new]
+    last_factor[new] = ctx["inflation_factor"][new]
+
+    months = ctx["months_since_start"]
+    review = ~new & ~np.isnan(annual_w) & (months > 0) & (months % 12 == 0)
+    if review.any():
+        lost = total < last_total
+        cola = ctx["inflation_factor"] / last_factor
+        annual_w[:] = np.where(review & ~lost, annual_w * cola, annual_w)
+
+        initial_rate = ctx["withdrawal_rate"]
+        current_rate = np.divide(annual_w, total, out=np.full(n_paths, np.inf), where=total > 0)
+        cut = review & (current_rate > initial_rate * (1 + guardrail))
+        raise_ = review & (current_rate < initial_rate * (1 - guardrail))
+        annual_w[cut] *= 1 - adjustment
+        annual_w[raise_] *= 1 + adjustment
+
+        last_total[review] = total[review]
+        last_factor[review] = ctx["inflation_factor"][review]
+
+    return annual_w / 12.0
+
+
+@register_strategy("floor_ceiling")
+def floor_ceiling_withdrawal(ctx, state):
+    #Percent of balance, kept between a floor and ceiling of the inflation adjusted initial withdrawal
+    assumptions = ctx["assumptions"]
+    floor = float(assumptions.get("withdrawal_floor", 0.90))
+    ceiling = float(assumptions.get("withdrawal_ceiling", 1.25))
+
+    annual_w0 = _initial_withdrawal(ctx, state)
+    indexed_w0 = annual_w0 * ctx["inflation_factor"]
+    annual_withdrawal = np.clip(ctx["total"] * ctx["withdrawal_rate"], floor * indexed_w0, ceiling * indexed_w0)
+    return annual_withdrawal / 12.0
+
+
+@register_strategy("rmd")
+def rmd_withdrawal(ctx, state):
+    #Withdraw balance / uniform lifetime divisor each year
+    divisors = _divisor_by_age(tuple(sorted(ctx["rmd_table"].items())))
+    age_idx = np.clip(np.asarray(ctx["age"], dtype=int), 0, len(divisors) - 1)
+    return ctx["total"] / divisors[age_idx] / 12.0
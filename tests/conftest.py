@@ -0,0 +1,75 @@
+import json
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+#The modules in src/ import each other by name, as when a script runs from the repo root
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / "src"))
+
+CONFIG_FILES = (
+    "tax_system.json",
+    "federal_tax_2025.csv",
+    "ltcg_brackets.csv",
+    "virginia_tax_2025.csv",
+    "account_meta.csv",
+    "uniform_lifetime_table.csv",
+)
+
+
+def _copy_config(tmp_path) -> Path:
+    config_dir = tmp_path / "Config"
+    config_dir.mkdir()
+    for name in CONFIG_FILES:
+        shutil.copy(REPO / "Config" / name, config_dir / name)
+    return config_dir
+
+
+@pytest.fixture
+def config_dir(tmp_path) -> Path:
+    #A private copy of Config/, safe to edit, with no compiled bundle
+    return _copy_config(tmp_path)
+
+
+BALANCES = """Date,457(b),Brokerage,403(b),SERS,TSP,ROTH IRA,Checking
+2025-08-01,120000,250000,80000,60000,430000,90000,15000
+2025-09-01,121000,252000,80500,60500,433000,90500,15000
+"""
+
+CASHFLOWS = """account,start_date,end_date,monthly_amount
+TSP,2025-09-01,2035-10-01,1500
+Brokerage,2025-09-01,2035-10-01,2000
+457(b),2025-09-01,2035-10-01,1000
+Brokerage,2040-01-01,2040-06-01,-5000
+"""
+
+
+def _load_inputs(config_dir, tmp_path):
+    from run_projection import InputPaths, load_inputs
+
+    (tmp_path / "Balances.csv").write_text(BALANCES)
+    (tmp_path / "cashflow.csv").write_text(CASHFLOWS)
+    paths = InputPaths(
+        balances_csv=tmp_path / "Balances.csv",
+        cashflow_csv=tmp_path / "cashflow.csv",
+        account_meta_csv=config_dir / "account_meta.csv",
+        rmd_table_csv=config_dir / "uniform_lifetime_table.csv",
+        config_dir=config_dir,
+    )
+    cfg = json.loads((REPO / "Config" / "base.json").read_text())
+    return load_inputs({**cfg, "horizon": "2056-12-01"}, paths)
+
+
+@pytest.fixture
+def inputs(config_dir, tmp_path):
+    #Config/base.json over a small set of accounts, running past the first RMD year
+    return _load_inputs(config_dir, tmp_path)
+
+
+@pytest.fixture(scope="module")
+def module_inputs(tmp_path_factory):
+    #inputs shared by every test in a module, for tests that edit neither the config nor the inputs
+    tmp_path = tmp_path_factory.mktemp("inputs")
+    return _load_inputs(_copy_config(tmp_path), tmp_path)
@@ -0,0 +1,83 @@
+import os
+
+import pandas as pd
+import pytest
+
+from balances_store import BalancesStore, load_balances, month_key, read_balances_csv
+
+
+@pytest.fixture
+def store(tmp_path):
+    with BalancesStore(tmp_path / "Balances.sqlite") as store:
+        store.upsert_many([
+            ("2025-01-01", {"TSP": 100.0, "Brokerage": 50.0}),
+            ("2025-02-01", {"TSP": 110.0, "Brokerage": 55.0}),
+            ("2025-03-01", {"TSP": 120.0, "Brokerage": 60.0}),
+        ])
+        yield store
+
+
+def test_month_key_is_the_first_of_the_month():
+    assert month_key("2025-02-17") == month_key(pd.Timestamp("2025-02-01 12:00")) == "2025-02-01"
+
+
+def test_upsert_replaces_the_month(store):
+    store.upsert("2025-02-15", {"TSP": 111.0})
+
+    frame = store.frame()
+    assert store.months() == ["2025-01-01", "2025-02-01", "2025-03-01"]
+    feb = frame.set_index("Date").loc["2025-02-01"]
+    assert feb["TSP"] == 111.0
+    assert feb["Brokerage"] == 55.0                           #not given, so kept
+    assert store.has_month("2025-02-28") and not store.has_month("2025-04-01")
+
+
+def test_failed_upsert_writes_nothing(store):
+    with pytest.raises(ValueError):
+        store.upsert_many([("2025-04-01", {"TSP": 130.0}), ("2025-05-01", {"TSP": "n/a"})])
+
+    assert store.months() == ["2025-01-01", "2025-02-01", "2025-03-01"]
+
+
+def test_new_accounts_keep_their_first_seen_order(store):
+    store.upsert("2025-03-01", {"ROTH IRA": 7.0})
+
+    assert store.accounts == ["TSP", "Brokerage", "ROTH IRA"]
+    assert list(store.frame().columns) == ["Date", "TSP", "Brokerage", "ROTH IRA"]
+
+
+@pytest.mark.parametrize("start, end, months", [
+    ("2025-02-01", "2025-03-01", ["2025-02-01", "2025-03-01"]),   #both bounds included
+    ("2025-02-20", None, ["2025-02-01", "2025-03-01"]),           #any day of a month means that month
+    (None, "2025-01-31", ["2025-01-01"]),
+    (None, None, ["2025-01-01", "2025-02-01", "2025-03-01"]),
+    ("2025-04-01", None, []),
+])
+def test_frame_range(store, start, end, months):
+    frame = store.frame(start, end)
+
+    assert [d.strftime("%Y-%m-%d") for d in frame["Date"]] == months
+
+
+def test_export_csv_round_trips(store, tmp_path):
+    store.export_csv(tmp_path / "Balances.csv")
+
+    assert (tmp_path / "Balances.csv").read_text().splitlines()[1] == "1/1/2025,100.0,50.0"
+    pd.testing.assert_frame_equal(read_balances_csv(tmp_path / "Balances.csv"), store.frame(), check_dtype=False)
+    assert BalancesStore.from_csv(tmp_path / "Balances.csv", tmp_path / "copy.sqlite").frame().equals(store.frame())
+
+
+def test_load_balances_rereads_a_changed_file(store, tmp_path):
+    csv = tmp_path / "Balances.csv"
+    store.export_csv(csv)
+    first = load_balances(csv)
+    first.loc[0, "TSP"] = -1.0                                #callers get their own copy
+
+    assert load_balances(csv).loc[0, "TSP"] == 100.0
+    assert load_balances(store.path).equals(store.frame())
+
+    store.upsert("2025-01-01", {"TSP": 101.0})
+    store.export_csv(csv)
+    stat = csv.stat()
+    os.utime(csv, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))   #a clearly later mtime, however coarse the clock
+    assert load_balances(csv).loc[0, "TSP"] == 101.0
@@ -0,0 +1,122 @@
+import json
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import Balances_update
+from Balances_update import ingest_main, ingest_statements, parse_money_series
+from balances_store import BalancesStore
+
+MAPPING = {
+    "tsp": {"match": "tsp_*.csv", "date_column": "Date", "columns": {"TSP": "Total Balance"}},
+    "vanguard": {
+        "match": "vanguard*.csv",
+        "date_column": "As Of",
+        "account_column": "Account",
+        "amount_column": "Balance",
+        "accounts": {"Roth IRA 1234": "ROTH IRA", "Brokerage 5678": "Brokerage"},
+        "month_offset": 1,
+    },
+}
+
+
+def _write(path, text):
+    path.write_text(text)
+    return path
+
+
+@pytest.fixture
+def statements(tmp_path):
+    return [
+        _write(tmp_path / "tsp_2025.csv", 'Date,Total Balance\n1/1/2025,"$1,000.00"\n2/1/2025,"1,100.50"\n'),
+        #month end statements, so each is the next month's opening balance
+        _write(tmp_path / "vanguard_jan.csv", (
+            "As Of,Account,Balance\n"
+            "2025-01-31,Roth IRA 1234,500\n"
+            "2025-01-31,Brokerage 5678,(25.00)\n"
+            "2025-01-31,Checking 9999,7\n"
+        )),
+        #an older statement from the same month, read later
+        _write(tmp_path / "vanguard_jan_mid.csv", "As Of,Account,Balance\n2025-01-20,Roth IRA 1234,480\n2025-01-15,Brokerage 5678,30\n"),
+    ]
+
+
+@pytest.fixture
+def store_paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(Balances_update, "CSV_Path", tmp_path / "Balances.csv")
+    monkeypatch.setattr(Balances_update, "DB_Path", tmp_path / "Balances.sqlite")
+    return tmp_path / "Balances.csv", tmp_path / "Balances.sqlite"
+
+
+def test_parse_money_series():
+    parsed = parse_money_series(["$1,234.56", " (1,234.56) ", "", None, "7"])
+
+    assert parsed[[0, 1, 4]].tolist() == [1234.56, -1234.56, 7.0]
+    assert parsed[[2, 3]].isna().all()
+    assert parse_money_series(pd.Series([1, 2])).tolist() == [1.0, 2.0]
+
+
+def test_parse_money_series_lists_the_bad_cells():
+    with pytest.raises(ValueError, match=r"\['12abc', '1.2.3'\]"):
+        parse_money_series(["100", "12abc", "1.2.3"])
+
+
+def test_wide_and_long_statements(statements):
+    wide = ingest_statements(statements, MAPPING).set_index("Date")
+
+    assert list(wide.columns) == ["TSP", "ROTH IRA", "Brokerage"]      #ACCOUNTS order, unmapped accounts dropped
+    assert wide.loc["2025-01-01", "TSP"] == 1000.0
+    assert pd.isna(wide.loc["2025-01-01", "ROTH IRA"])
+    feb = wide.loc["2025-02-01"]
+    assert feb["TSP"] == 1100.5
+    #month_offset 1: the January statements land in February; the latest dated one in a month wins
+    assert feb["ROTH IRA"] == 500.0
+    assert feb["Brokerage"] == -25.0
+
+
+def test_later_file_breaks_a_tie(statements, tmp_path):
+    again = _write(tmp_path / "vanguard_jan_again.csv", "As Of,Account,Balance\n2025-01-31,Brokerage 5678,40\n")
+
+    wide = ingest_statements([*statements, again], MAPPING).set_index("Date")
+
+    assert wide.loc["2025-02-01", "Brokerage"] == 40.0
+
+
+def test_bad_cell_fails_the_file(tmp_path):
+    bad = _write(tmp_path / "tsp_bad.csv", "Date,Total Balance\n1/1/2025,twelve\n")
+
+    with pytest.raises(ValueError, match="Not a valid number"):
+        ingest_statements([bad], MAPPING)
+
+
+def test_ingest_main_writes_the_store_and_csv(statements, store_paths, tmp_path):
+    csv_path, db_path = store_paths
+    mapping = _write(tmp_path / "mapping.json", json.dumps(MAPPING))
+
+    ingest_main([str(mapping), str(tmp_path), "--dry-run"])
+    assert not db_path.exists()
+
+    ingest_main([str(mapping), *map(str, statements)])
+    with BalancesStore(db_path) as store:
+        assert store.months() == ["2025-01-01", "2025-02-01"]
+        assert store.frame().set_index("Date").loc["2025-02-01", "ROTH IRA"] == 500.0
+    assert pd.read_csv(csv_path)["Date"].tolist() == ["1/1/2025", "2/1/2025"]
+
+
+@pytest.mark.parametrize("answers", [["2025-01", "no"], ["2025-03", *["1"] * 6, "n"]])
+def test_aborted_entry_closes_the_store(store_paths, monkeypatch, answers):
+    _, db_path = store_paths
+    with BalancesStore(db_path) as store:
+        store.upsert("2025-01-01", {"TSP": 1.0})
+    opened = []
+    monkeypatch.setattr(Balances_update, "open_store", lambda: opened.append(BalancesStore(db_path)) or opened[-1])
+    monkeypatch.setattr("builtins.input", lambda prompt="": answers.pop(0))
+
+    Balances_update.main()
+
+    assert answers == []
+    with pytest.raises(sqlite3.ProgrammingError):
+        opened[0].months()
+    with BalancesStore(db_path) as store:
+        assert store.months() == ["2025-01-01"]
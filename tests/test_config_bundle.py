@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from config_bundle import bundle_path, compile_bundle, load_bundle
+from tax_engine import compile_tax_schedule, compile_tax_tables
+
+
+def test_load_bundle_reads_the_given_config_dir(config_dir):
+    bundle = load_bundle(config_dir)
+
+    assert bundle.path == bundle_path(config_dir)
+    assert bundle.path.parent == config_dir / ".compiled"
+    assert bundle.account_tax_map.loc["Brokerage", "account_type"] == "brokerage"
+    assert bundle.rmd_table[73] > bundle.rmd_table[90] > 0
+    assert set(bundle.tax_systems) >= {"federal", "ltcg", "virginia"}
+
+
+def test_stale_bundle_is_recompiled(config_dir):
+    first = load_bundle(config_dir).tax_systems["federal"]["tables"]
+    brackets = config_dir / "federal_tax_2025.csv"
+    brackets.write_text(brackets.read_text().replace(",0.1,", ",0.2,"))
+
+    second = load_bundle(config_dir).tax_systems["federal"]["tables"]
+    (_, before), = first.values()
+    (_, after), = second.values()
+    assert before[2][0] == pytest.approx(0.1)                 #(lowers, uppers, rates, fees)
+    assert after[2][0] == pytest.approx(0.2)
+
+
+def test_tax_path_uses_the_bundle_for_the_given_sources(config_dir, tmp_path):
+    account_meta = tmp_path / "account_meta.csv"
+    (config_dir / "account_meta.csv").rename(account_meta)
+    brackets = config_dir / "federal_tax_2025.csv"
+    brackets.write_text(brackets.read_text().replace(",0.1,", ",0.2,"))
+    sources = {"config_dir": str(config_dir), "account_meta_csv": str(account_meta)}
+
+    tables = compile_tax_tables(**sources)
+    schedule = compile_tax_schedule(2026, 2027, 0.02, **sources)
+
+    assert tables["federal"]["bracket"][2][0] == pytest.approx(0.2)
+    assert np.allclose(schedule["federal"]["bracket"][2][:, 0], 0.2)
+    #load_inputs and the tax path share one bundle instead of compiling a second one
+    assert [path.name for path in (config_dir / ".compiled").iterdir()] == [bundle_path(**sources).name]
+
+
+def test_tax_tables_follow_an_edit_in_the_same_process(inputs, config_dir):
+    from run_projection import run
+
+    before = run(inputs).projection["Total Tax"].sum()
+    tables = compile_tax_tables(**inputs.config_sources)
+    tax_system = config_dir / "tax_system.json"
+    tax_system.write_text(tax_system.read_text().replace('"standard_deduction": 15000.0', '"standard_deduction": 60000.0'))
+
+    after = run(inputs).projection["Total Tax"].sum()
+
+    assert after < before
+    assert tables["federal"]["standard_deduction"] == pytest.approx(15000.0)
+    assert compile_tax_tables(**inputs.config_sources)["federal"]["standard_deduction"] == pytest.approx(60000.0)
+    #unchanged sources keep hitting the cache
+    assert compile_tax_tables(**inputs.config_sources) is compile_tax_tables(**inputs.config_sources)
+
+
+def test_invalid_config_reports_every_problem(config_dir):
+    brackets = config_dir / "federal_tax_2025.csv"
+    rows = brackets.read_text().splitlines()
+    rows[2], rows[3] = rows[3], rows[2]                     #lower bounds out of order
+    brackets.write_text("\n".join(rows) + "\n")
+    meta = config_dir / "account_meta.csv"
+    meta.write_text(meta.read_text().rstrip() + "\nMattress,cash_under_mattress\n")
+
+    with pytest.raises(ValueError) as raised:
+        load_bundle(config_dir)
+
+    message = str(raised.value)
+    assert message.startswith(f"Invalid config in {config_dir}")
+    assert "federal_tax_2025.csv: lower bounds must increase" in message
+    assert "unknown account_type 'cash_under_mattress' for account 'Mattress'" in message
+    assert not bundle_path(config_dir).exists()
+
+
+def test_compile_bundle_rejects_a_bad_tax_system(config_dir):
+    (config_dir / "tax_system.json").write_text('{"federal": {"method": "flat", "brackets_file": 1}}')
+
+    with pytest.raises(ValueError, match="Invalid config") as raised:
+        compile_bundle(config_dir)
+
+    message = str(raised.value)
+    assert "missing tax system 'virginia'" in message
+    assert "'brackets_file' must be str, got 1" in message
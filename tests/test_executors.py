@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from executors import InProcessExecutor, PoolExecutor, SpoolExecutor, TaskFailed, get_executor, spool_worker
+from monte_carlo import compile_projection, run_monte_carlo
+
+N_PATHS, CHUNK_SIZE = 60, 15
+
+
+@pytest.fixture(scope="module")
+def plan(module_inputs):
+    assumptions = {**module_inputs.assumptions, "withdrawal_type": "4pct", "withdrawal_rate": 0.06}
+    plan = compile_projection(
+        module_inputs.account_tax_map, module_inputs.rmd_table, module_inputs.start_bal, module_inputs.cf,
+        module_inputs.months, assumptions, balances_actuals=module_inputs.balances_actuals,
+        config_sources=module_inputs.config_sources,
+    )
+    return plan, assumptions
+
+
+def _run(plan, executor):
+    plan, assumptions = plan
+    return run_monte_carlo(plan, assumptions, n_paths=N_PATHS, seed=5, chunk_size=CHUNK_SIZE, executor=executor)
+
+
+@pytest.fixture(scope="module")
+def expected(plan):
+    return _run(plan, InProcessExecutor())
+
+
+def _assert_same_summary(summary, expected):
+    assert summary.success_rate == expected.success_rate
+    assert 0 < expected.success_rate < 1
+    np.testing.assert_array_equal(summary.failures.failed_by_month, expected.failures.failed_by_month)
+    for metric in expected.sketches:
+        pd.testing.assert_frame_equal(summary.quantile_frame(metric), expected.quantile_frame(metric), rtol=0, atol=0)
+    pd.testing.assert_frame_equal(summary.path_summary, expected.path_summary)
+
+
+def test_pool_matches_in_process(plan, expected):
+    _assert_same_summary(_run(plan, PoolExecutor(3)), expected)
+
+
+def test_spool_with_local_workers_matches_in_process(plan, expected, tmp_path):
+    _assert_same_summary(_run(plan, SpoolExecutor(tmp_path, local_workers=2, poll_interval=0.05)), expected)
+
+
+def test_spool_retries_a_task_whose_lease_expired(plan, expected, tmp_path):
+    #A worker claims the first task and dies (no heartbeat); once the lease runs out it goes back to pending
+    claimed = []
+
+    def dead_then_live_worker():
+        while not claimed:
+            for path in sorted((tmp_path / "pending").glob("*.pkl")):
+                try:
+                    os.rename(path, tmp_path / "running" / f"{path.name}@dead")
+                except OSError:
+                    continue
+                claimed.append(path.name)
+                break
+            time.sleep(0.01)
+        spool_worker(tmp_path, poll_interval=0.05, heartbeat=0.1, idle_exit=1.0)
+
+    executor = SpoolExecutor(tmp_path, lease_timeout=0.5, poll_interval=0.05)
+    worker = threading.Thread(target=dead_then_live_worker, daemon=True)
+    worker.start()
+
+    summary = _run(plan, executor)
+
+    worker.join(5)
+    assert len(claimed) == 1
+    _assert_same_summary(summary, expected)
+    assert not any(list((tmp_path / name).iterdir()) for name in ("pending", "running", "done", "failed"))
+
+
+def _flaky(context, task):
+    #Fails the first time each task runs, in any process (the marker file survives the worker)
+    marker = context / f"task-{task}"
+    if not marker.exists():
+        marker.touch()
+        raise RuntimeError("transient")
+    return task * 10
+
+
+def _broken(context, task):
+    raise RuntimeError("always")
+
+
+@pytest.mark.parametrize("spec", ["inprocess", "pool:2"])
+def test_failed_tasks_are_retried(spec, tmp_path):
+    results = dict(get_executor(spec).map(_flaky, tmp_path, [1, 2, 3]))
+
+    assert results == {0: 10, 1: 20, 2: 30}
+
+
+def test_task_out_of_retries_raises():
+    with pytest.raises(TaskFailed, match="always"):
+        list(InProcessExecutor(max_retries=1).map(_broken, None, [1]))
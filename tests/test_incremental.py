@@ -0,0 +1,107 @@
+import copy
+
+import pandas as pd
+import pytest
+
+from incremental import (
+    BALANCE_ONLY_STRATEGIES,
+    INFLATION_INDEXED_STRATEGIES,
+    STAGE_ASSUMPTIONS,
+    STAGES,
+    IncrementalProjection,
+)
+from run_projection import run
+
+#A new value for every assumption a stage after balances reads
+EDITS = {
+    "inflation": 0.035,
+    "basis": "2026-01-01",
+    "pension": 4000,
+    "pension_start": "2027-06-01",
+    "brokerage_interest_yield": 0.02,
+    "brokerage_qdiv_yield": 0.03,
+    "brokerage_ltcg_realization_ratio": 0.5,
+    "brokerage_lot_method": "hifo",
+    "ssa_benefit": 2500,
+    "service_length": 30,
+    "filing_status": "single",
+}
+STRATEGIES = sorted(BALANCE_ONLY_STRATEGIES) + sorted(INFLATION_INDEXED_STRATEGIES) + ["net"]
+
+
+def _scenario(strategy):
+    #Six years of withdrawals, Social Security from 2040 and a Brokerage sale in 2040; "net" draws what nets 6000
+    scenario = {"withdrawal_type": strategy, "horizon": "2041-12-01"}
+    return {**scenario, "net_spending_real": 6000.0} if strategy == "net" else scenario
+
+
+def _expected_stages(key, strategy):
+    if strategy == "net" or (key == "inflation" and strategy in INFLATION_INDEXED_STRATEGIES):
+        return STAGES
+    first = min(STAGES.index(stage) for stage, keys in STAGE_ASSUMPTIONS.items() if key in keys)
+    return STAGES[first:]
+
+
+def _assert_same_result(result, expected):
+    assert list(result.projection.columns) == list(expected.projection.columns)
+    pd.testing.assert_frame_equal(result.projection, expected.projection, rtol=1e-9, atol=1e-6)
+    pd.testing.assert_frame_equal(
+        result.ledger.by_year_and_source().sort_index(axis=1),
+        expected.ledger.by_year_and_source().sort_index(axis=1),
+        rtol=1e-9, atol=1e-6,
+    )
+
+
+@pytest.fixture(scope="module", params=STRATEGIES)
+def strategy(request):
+    return request.param
+
+
+@pytest.fixture(scope="module")
+def base(module_inputs, strategy):
+    #One full run per strategy; each test edits its own copy
+    incremental = IncrementalProjection(module_inputs)
+    incremental.run(_scenario(strategy))
+    return incremental
+
+
+def _copy(incremental):
+    #Stages replace their outputs rather than mutate them, so the arrays can be shared
+    copied = copy.copy(incremental)
+    copied.outputs = dict(incremental.outputs)
+    return copied
+
+
+def test_every_stage_key_has_an_edit():
+    assert set(EDITS) == set().union(*STAGE_ASSUMPTIONS.values())
+
+
+@pytest.mark.parametrize("key", sorted(EDITS))
+def test_edit_matches_a_full_run(module_inputs, base, strategy, key):
+    incremental = _copy(base)
+    scenario = {**_scenario(strategy), key: EDITS[key]}
+
+    result = incremental.run(scenario)
+
+    assert incremental.recomputed == _expected_stages(key, strategy)
+    _assert_same_result(result, run(module_inputs, scenario))
+
+
+def test_first_run_matches_and_a_rerun_recomputes_nothing(module_inputs, base, strategy):
+    assert base.recomputed == STAGES
+    incremental = _copy(base)
+
+    result = incremental.run(_scenario(strategy))
+
+    assert incremental.recomputed == ()
+    _assert_same_result(result, run(module_inputs, _scenario(strategy)))
+
+
+def test_loop_assumptions_recompute_the_balances(module_inputs):
+    incremental = IncrementalProjection(module_inputs)
+    incremental.run()
+
+    result = incremental.run({"annual_return": 0.06, "annual_volatility": 0.2})
+
+    assert incremental.recomputed == STAGES
+    _assert_same_result(result, run(module_inputs, {"annual_return": 0.06}))
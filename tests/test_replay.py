@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from monte_carlo import compile_projection, replay_growth, replay_path, run_monte_carlo
+
+N_PATHS = 48
+
+
+def _run(inputs, **assumptions):
+    assumptions = {**inputs.assumptions, **assumptions}
+    plan = compile_projection(
+        inputs.account_tax_map, inputs.rmd_table, inputs.start_bal, inputs.cf, inputs.months, assumptions,
+        balances_actuals=inputs.balances_actuals, config_sources=inputs.config_sources,
+    )
+    return assumptions, run_monte_carlo(plan, assumptions, n_paths=N_PATHS, seed=11, chunk_size=16)
+
+
+def _replay(inputs, assumptions, summary, path_index):
+    return replay_path(
+        inputs.account_tax_map, inputs.rmd_table, inputs.start_bal, inputs.cf, inputs.months, assumptions,
+        seed=summary.seed, path_index=path_index, annual_volatility=summary.annual_volatility,
+        balances_actuals=inputs.balances_actuals, config_sources=inputs.config_sources,
+    )
+
+
+@pytest.mark.parametrize("inflation_volatility", [0.0, 0.01])
+def test_replayed_path_matches_its_monte_carlo_summary(inputs, inflation_volatility):
+    assumptions, summary = _run(inputs, inflation_volatility=inflation_volatility, withdrawal_rate=0.07)
+    paths = summary.path_summary.set_index("path")
+
+    for q in (0.05, 0.5, 0.95):
+        path_index = summary.select_path("ending_real", q)
+        detail = _replay(inputs, assumptions, summary, path_index)
+
+        assert detail["Net_Worth_Real"].iloc[-1] == pytest.approx(paths.loc[path_index, "ending_real"], rel=1e-9)
+        assert detail["Net_Worth_Real"].min() == pytest.approx(paths.loc[path_index, "min_real"], rel=1e-9)
+
+
+def test_select_path_ranks_the_summary(inputs):
+    _, summary = _run(inputs)
+    ending = summary.path_summary.set_index("path")["ending_real"]
+
+    assert summary.select_path("ending_real", 0.0) == ending.idxmin()
+    assert summary.select_path("ending_real", 1.0) == ending.idxmax()
+    assert sorted(summary.path_summary["path"]) == list(range(N_PATHS))
+
+
+def test_replay_growth_depends_only_on_seed_and_path(inputs):
+    n_months = len(inputs.months)
+
+    growth = replay_growth(11, 5, n_months, 0.07, 0.15)
+
+    np.testing.assert_array_equal(growth, replay_growth(11, 5, n_months, 0.07, 0.15))
+    assert not np.array_equal(growth, replay_growth(11, 6, n_months, 0.07, 0.15))
+    assert not np.array_equal(growth, replay_growth(12, 5, n_months, 0.07, 0.15))
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from monte_carlo import MC_METRICS, compile_projection, replay_path, run_monte_carlo
+from results_store import ResultsStore
+from run_projection import run
+
+N_PATHS, CHUNK_SIZE = 60, 20
+
+
+def _plan(inputs):
+    assumptions = {**inputs.assumptions, "withdrawal_rate": 0.07}
+    plan = compile_projection(
+        inputs.account_tax_map, inputs.rmd_table, inputs.start_bal, inputs.cf, inputs.months, assumptions,
+        balances_actuals=inputs.balances_actuals, config_sources=inputs.config_sources,
+    )
+    return plan, assumptions
+
+
+def test_pool_workers_fill_the_store(inputs, tmp_path):
+    plan, assumptions = _plan(inputs)
+    store = ResultsStore.create(
+        tmp_path / "store", ["base", "other"], N_PATHS, plan["months"], accounts=plan["accounts"], dtype="float64"
+    )
+
+    summary = run_monte_carlo(
+        plan, assumptions, n_paths=N_PATHS, seed=3, chunk_size=CHUNK_SIZE, store=store, scenario="base", workers=2
+    )
+
+    reader = ResultsStore.open(tmp_path / "store", "r")
+    paths = summary.path_summary.set_index("path").sort_index()
+    np.testing.assert_array_equal(reader.failed_month[0], paths["failed_month"])
+    np.testing.assert_array_equal(reader.failed_month[1], -1)                 #an unwritten scenario
+    ending = reader.metric("base", "Net_Worth_Real")[:, -1]
+    np.testing.assert_allclose(ending, paths["ending_real"], rtol=1e-12)
+
+    #the store summary folds the same chunks in the same order as the run
+    stored = reader.summary("base", chunk_size=CHUNK_SIZE)
+    assert stored.success_rate == summary.success_rate
+    for metric in summary.sketches:
+        np.testing.assert_allclose(stored.quantile_frame(metric), summary.quantile_frame(metric), rtol=1e-12)
+        np.testing.assert_allclose(stored.moments[metric].mean, summary.moments[metric].mean, rtol=1e-12)
+
+    path = summary.select_path("ending_real", 0.5)
+    frame = reader.path_frame("base", path)
+    detail = replay_path(
+        inputs.account_tax_map, inputs.rmd_table, inputs.start_bal, inputs.cf, inputs.months, assumptions,
+        seed=3, path_index=path, balances_actuals=inputs.balances_actuals, config_sources=inputs.config_sources,
+    )
+    assert list(frame.columns) == [*MC_METRICS, *plan["accounts"]]
+    np.testing.assert_allclose(frame["Net_Worth_Real"], detail["Net_Worth_Real"], rtol=1e-9)
+    np.testing.assert_allclose(frame[plan["accounts"]], detail[plan["accounts"]], rtol=1e-9, atol=1e-6)
+
+
+def test_scenario_store_path(inputs, tmp_path):
+    mc_cfg = {"paths": N_PATHS, "chunk_size": CHUNK_SIZE, "seed": 3, "store": str(tmp_path / "store")}
+
+    summary = run(inputs, {"withdrawal_rate": 0.07, "monte_carlo": mc_cfg}).monte_carlo
+
+    reader = ResultsStore.open(tmp_path / "store")
+    assert reader.scenarios == ["base"] and reader.balances is None
+    assert reader.summary("base", chunk_size=CHUNK_SIZE).success_rate == summary.success_rate
+    np.testing.assert_allclose(
+        reader.metric("base", "Net_Worth_Real")[:, -1],
+        summary.path_summary.sort_values("path")["ending_real"],
+        rtol=1e-6,                                                              #float32 by default
+    )
+
+
+def test_store_needs_a_fixed_path_count(inputs, tmp_path):
+    mc_cfg = {"paths": N_PATHS, "tolerance": 0.05, "store": str(tmp_path / "store")}
+
+    with pytest.raises(ValueError, match="fixed path count"):
+        run(inputs, {"monte_carlo": mc_cfg})
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from run_projection import Inputs, run
+from withdraw_engine import apply_rmd_topup, calc_monthly_rmds, rmd_divisor_schedule, rmd_eligibility_mask
+
+RMD_TABLE = {72: 27.4, 73: 26.5, 74: 25.5, 75: 24.6}
+
+
+def test_eligibility_mask_follows_the_account_order():
+    account_tax_map = pd.DataFrame(
+        {"account_type": ["TSP ", "roth_ira", "brokerage", "403b"]},
+        index=["TSP", "ROTH IRA", "Brokerage", "403(b)"],
+    )
+
+    mask = rmd_eligibility_mask(["403(b)", "Brokerage", "Unknown", "TSP", "ROTH IRA"], account_tax_map)
+
+    assert mask.tolist() == [True, False, False, True, False]
+
+
+def test_divisor_schedule_starts_in_the_year_of_the_start_age():
+    months = pd.date_range("2050-11-01", "2053-02-01", freq="MS")
+    birthday = pd.Timestamp("1978-02-07")
+
+    divisors = rmd_divisor_schedule(months, birthday, RMD_TABLE)
+
+    #age 73 is reached in 2051, so every 2051 month uses the age 73 divisor
+    years = np.asarray(months.year)
+    assert np.isnan(divisors[years < 2051]).all()
+    assert divisors[years == 2051] == pytest.approx(np.full(12, 26.5))
+    assert divisors[years == 2053] == pytest.approx([24.6, 24.6])
+    assert np.isnan(rmd_divisor_schedule(months, birthday, RMD_TABLE, rmd_start_age=75)[years < 2053]).all()
+
+
+def test_monthly_rmd_is_a_twelfth_of_the_eligible_balances():
+    prior_year_end = np.array([[265000.0, 100000.0, 53000.0], [0.0, 5.0, 26500.0]])
+    mask = np.array([True, False, True])
+
+    due = calc_monthly_rmds(prior_year_end, mask, np.array([26.5, np.nan]))
+
+    assert due[0] == pytest.approx([10000.0 / 12, 0.0, 2000.0 / 12])
+    assert due[1] == pytest.approx([0.0, 0.0, 0.0])
+
+
+def test_topup_takes_only_the_part_not_already_drawn():
+    balances = np.array([[5000.0, 300.0, 10000.0]])
+    draws = np.array([[1000.0, 0.0, 0.0]])
+    required = np.array([[800.0, 500.0, 0.0]])
+
+    new_balances, extra, total = apply_rmd_topup(balances, draws, required, reinvest_idx=2)
+
+    #the first account's draw already covers its RMD; the second can only give its balance
+    assert extra[0] == pytest.approx([0.0, 300.0, 0.0])
+    assert total == pytest.approx([300.0])
+    assert new_balances[0] == pytest.approx([5000.0, 0.0, 10300.0])
+
+
+def test_projection_tops_up_rmds_from_the_first_rmd_year(inputs):
+    #Spending only from the Roth IRA leaves every pre-tax RMD to the top-up
+    projection = run(inputs, {"withdrawal_order": ["ROTH IRA"]}).projection
+    years = projection["Date"].dt.year
+
+    assert (projection.loc[years < 2051, "RMD Extra"] == 0).all()
+    assert (projection.loc[years >= 2051, "RMD Extra"] > 0).all()
+    #the top-up is reinvested in Brokerage, not spent
+    without = run(inputs, {"withdrawal_order": ["ROTH IRA"], "rmd_start_age": 120}).projection
+    first = projection.index[years == 2051][0]
+    assert projection.loc[first, "Net_Worth"] == pytest.approx(without.loc[first, "Net_Worth"])
+    assert projection.loc[first, "Brokerage"] - without.loc[first, "Brokerage"] == pytest.approx(projection.loc[first, "RMD Extra"])
+
+
+def test_projection_does_not_depend_on_the_balance_column_order(inputs):
+    #The RMD mask and prior year end balances are positional, so the engine fixes its own account order
+    reordered = Inputs(**{**inputs.__dict__, "start_bal": inputs.start_bal.iloc[::-1]})
+
+    expected = run(inputs).projection
+    projection = run(reordered).projection
+
+    numeric = expected.select_dtypes("number").columns
+    pd.testing.assert_frame_equal(projection[numeric].reindex(columns=numeric), expected[numeric], rtol=1e-12)
@@ -0,0 +1,25 @@
+from pathlib import Path
+
+from run_projection import InputPaths, load_config
+
+REPO = Path(__file__).resolve().parents[1]
+
+
+def test_default_paths_are_the_repos_wherever_the_run_starts(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    paths = InputPaths()
+
+    assert paths.balances_csv == REPO / "data" / "Balances.csv"
+    assert paths.cashflow_csv == REPO / "data" / "cashflow_schedule.csv"
+    for path in (paths.account_meta_csv, paths.rmd_table_csv, paths.config_dir / "tax_system.json"):
+        assert path.is_file()
+    assert paths.config_sources()["config_dir"] == str(REPO / "Config")
+
+
+def test_scenario_paths_override_the_defaults(tmp_path):
+    cfg = {**load_config(REPO / "Config" / "base.json"), "paths": {"balances_csv": str(tmp_path / "b.sqlite")}}
+
+    paths = InputPaths.from_config(cfg)
+
+    assert paths.balances_csv == tmp_path / "b.sqlite"
+    assert paths.config_dir == REPO / "Config"
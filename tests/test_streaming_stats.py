@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from streaming_stats import FailureCounter, MomentAccumulator, QuantileSketch
+
+LEVELS = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+
+@pytest.fixture
+def values():
+    #(paths x months) skewed like ending net worth, one month with a spike of ties at zero
+    rng = np.random.default_rng(7)
+    values = rng.lognormal(13.0, 0.8, size=(20000, 3))
+    values[:4000, 2] = 0.0
+    return values
+
+
+def _chunks(values, size=1500):
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+def test_sketch_tracks_the_empirical_quantiles(values):
+    sketch = QuantileSketch(values.shape[1])
+    for chunk in _chunks(values):
+        sketch.update(chunk)
+
+    estimates = sketch.quantiles(LEVELS)
+
+    assert sketch.count == len(values)
+    assert sketch.weights.shape[1] <= sketch.compression / 2 + 1
+    for t in range(values.shape[1]):
+        #rank error: where each estimate falls in the sorted data
+        ranks = np.searchsorted(np.sort(values[:, t]), estimates[t]) / len(values)
+        above_ties = np.array(LEVELS) > 0.2 if t == 2 else np.ones(len(LEVELS), dtype=bool)
+        assert ranks[above_ties] == pytest.approx(np.array(LEVELS)[above_ties], abs=0.005)
+    #the 20% of paths at exactly zero stay there
+    assert estimates[2, :2] == pytest.approx([0.0, 0.0])
+    assert sketch.quantiles([0.0, 1.0]) == pytest.approx(np.column_stack([values.min(axis=0), values.max(axis=0)]))
+
+
+def test_update_equals_merging_chunk_sketches_in_order(values):
+    fed = QuantileSketch(values.shape[1])
+    for chunk in _chunks(values):
+        fed.update(chunk)
+
+    merged = None
+    for chunk in _chunks(values):
+        sketch = QuantileSketch.from_values(chunk)
+        merged = sketch if merged is None else merged.merge(sketch)
+
+    np.testing.assert_array_equal(fed.means, merged.means)
+    np.testing.assert_array_equal(fed.weights, merged.weights)
+    np.testing.assert_array_equal(fed.quantiles(LEVELS), merged.quantiles(LEVELS))
+
+
+def test_exact_sketch_matches_numpy(values):
+    sketch = QuantileSketch(values.shape[1], exact=True)
+    for chunk in _chunks(values):
+        sketch.update(chunk)
+
+    np.testing.assert_allclose(sketch.quantiles(LEVELS), np.quantile(values, LEVELS, axis=0).T)
+
+
+def test_moments_match_numpy(values):
+    acc = MomentAccumulator(values.shape[1])
+    for chunk in _chunks(values):
+        acc.update(chunk)
+
+    assert acc.count == len(values)
+    np.testing.assert_allclose(acc.mean, values.mean(axis=0))
+    np.testing.assert_allclose(acc.variance, values.var(axis=0, ddof=1), rtol=1e-9)
+
+
+def test_failure_counter_counts_paths_failed_by_each_month():
+    counter = FailureCounter(4)
+    counter.update([-1, 2, 0])
+    counter.update([-1, -1, 2, 3])
+
+    assert counter.count == 7
+    assert counter.failed_by_month.tolist() == [1, 1, 3, 4]
+    assert counter.failures == 4
+    assert counter.success_rate == pytest.approx(3 / 7)
+    assert FailureCounter(4).success_rate == 1.0
@@ -0,0 +1,143 @@
+import numpy as np
+import pytest
+
+from tax_lots import BatchTaxLots, LotSale, TaxLots
+
+SALE_FIELDS = ("basis_long", "proceeds_long", "basis_short", "proceeds_short")
+
+
+def _three_lots(method):
+    #At a price of 0.5: opening 1000 units (cost 600), 500 units bought at 2 in month 10 (cost 1000)
+    #and 2000 units bought at 0.5 in month 20 (cost 1000)
+    lots = TaxLots.opening(1000.0, 600.0, method)
+    lots.mark(2000.0)
+    lots.buy(1000.0, 10)
+    lots.mark(750.0)
+    lots.buy(1000.0, 20)
+    return lots
+
+
+def test_opening_lot_and_gain_fraction():
+    lots = TaxLots.opening(1000.0, 600.0)
+    lots.mark(1200.0)
+
+    assert lots.value == pytest.approx(1200.0)
+    assert lots.gain_fraction() == pytest.approx(0.5)
+
+    sale = lots.sell(300.0, 5)
+    assert (sale.basis_long, sale.proceeds_long) == pytest.approx((150.0, 300.0))
+    assert sale.gain_short == 0.0
+
+
+def test_fifo_sells_the_oldest_lot_first():
+    lots = _three_lots("fifo")
+
+    #1400 units: all of the opening lot (long term), then 400 of the month 10 units (short term)
+    sale = lots.sell(700.0, 21)
+
+    assert (sale.basis_long, sale.proceeds_long) == pytest.approx((600.0, 500.0))
+    assert (sale.basis_short, sale.proceeds_short) == pytest.approx((800.0, 200.0))
+    assert lots.open_lots()["units"].tolist() == pytest.approx([100.0, 2000.0])
+
+
+def test_hifo_sells_the_highest_cost_lot_first():
+    lots = _three_lots("hifo")
+
+    sale = lots.sell(100.0, 21)
+
+    #200 of the units bought at 2 (the highest cost per unit)
+    assert (sale.basis_short, sale.proceeds_short) == pytest.approx((400.0, 100.0))
+    assert sale.basis_long == 0.0
+    assert lots.open_lots()["units"].tolist() == pytest.approx([1000.0, 300.0, 2000.0])
+
+
+def test_holding_period_turns_long_term_after_twelve_months():
+    lots = TaxLots.opening(0.0, 0.0)
+    lots.buy(1000.0, 100)
+
+    assert lots.sell(100.0, 112).gain_short == 0.0
+    assert lots.sell(100.0, 112).basis_short == pytest.approx(100.0)
+    assert lots.sell(100.0, 113).basis_long == pytest.approx(100.0)
+
+
+def test_specific_lots_are_sold_first():
+    lots = _three_lots("fifo")
+    newest = lots.open_lots()["acquired"].idxmax()
+
+    sale = lots.sell(1000.0, 21, lot_ids=[newest])
+
+    #the whole month 20 lot, at cost, rather than the opening lot fifo would pick
+    assert (sale.basis_short, sale.proceeds_short) == pytest.approx((1000.0, 1000.0))
+    assert sale.basis_long == 0.0
+    assert newest not in lots.open_lots().index
+    with pytest.raises(KeyError):
+        lots.sell(10.0, 21, lot_ids=[newest])
+
+
+def test_sale_sums():
+    total = LotSale(1.0, 2.0, 3.0, 5.0) + LotSale(1.0, 1.0, 1.0, 1.0)
+
+    assert (total.gain_long, total.gain_short) == (1.0, 2.0)
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError, match="brokerage_lot_method"):
+        TaxLots("lifo")
+
+
+@pytest.mark.parametrize("method", ["fifo", "hifo"])
+def test_batch_lots_match_one_path_at_a_time(method):
+    rng = np.random.default_rng(0)
+    n_paths, n_months, first_ord = 40, 120, 100
+    balance = rng.uniform(0.0, 1e5, n_paths)
+    balance[:3] = 0.0
+    batch = BatchTaxLots(balance, balance * 0.7, first_ord, n_months, method)
+    singles = [TaxLots.opening(value, value * 0.7, method) for value in balance]
+
+    for t in range(n_months):
+        month_ord = first_ord + t
+        balance = balance * np.exp(rng.normal(0.005, 0.05, n_paths))
+        batch.mark(balance)
+        for lots, value in zip(singles, balance):
+            lots.mark(value)
+        assert batch.gain_fraction() == pytest.approx([lots.gain_fraction() for lots in singles], abs=1e-9)
+
+        #some paths sell part of the account, and every path sells out now and then
+        sell = np.where(rng.random(n_paths) < 0.5, balance * rng.uniform(0.0, 0.2, n_paths), 0.0)
+        if t % 50 == 49:
+            sell = balance.copy()
+        sale = batch.sell(sell, month_ord)
+        sales = [lots.sell(amount, month_ord) for lots, amount in zip(singles, sell)]
+        for field in SALE_FIELDS:
+            assert getattr(sale, field) == pytest.approx([getattr(s, field) for s in sales], abs=1e-6)
+        balance = balance - sell
+
+        dividend = balance * 0.001
+        buy = np.where(rng.random(n_paths) < 0.7, rng.uniform(0.0, 2000.0, n_paths), 0.0)
+        batch.reinvest(dividend, month_ord)
+        batch.buy(buy, month_ord)
+        for lots, amount, bought in zip(singles, dividend, buy):
+            lots.reinvest(amount, month_ord)
+            lots.buy(bought, month_ord)
+        balance = balance + buy
+
+    assert batch.value == pytest.approx([lots.value for lots in singles])
+
+
+@pytest.mark.parametrize("method", ["fifo", "hifo"])
+def test_monte_carlo_taxes_lot_sales_like_the_projection(inputs, method):
+    from monte_carlo import compile_projection, simulate_paths
+    from run_projection import run
+
+    result = run(inputs, {"brokerage_lot_method": method})
+    assumptions = result.assumptions
+    plan = compile_projection(
+        inputs.account_tax_map, inputs.rmd_table, inputs.start_bal, inputs.cf, inputs.months, assumptions,
+        balances_actuals=inputs.balances_actuals, config_sources=inputs.config_sources,
+    )
+    growth = np.full((1, len(inputs.months)), (1 + assumptions["annual_return"]) ** (1 / 12))
+
+    metrics = simulate_paths(plan, assumptions, growth)["metrics"]
+
+    for column in ("Fed Tax", "VA Tax", "Net_Worth"):
+        np.testing.assert_allclose(metrics[column][0], result.projection[column], rtol=1e-9, atol=1e-6)
@@ -0,0 +1,104 @@
+import json
+
+import numpy as np
+import pytest
+
+from tax_engine import compile_tax_schedule, load_brackets, tax_tables_for_year
+
+INFLATION = 0.03
+FIRST_YEAR, LAST_YEAR = 2024, 2030
+
+#A 2027 federal table with one bracket fewer than the 2025 one
+FEDERAL_2027 = """lower,upper,rate,fee
+0,12500,0.1,0
+12500,50000,0.12,0
+50000,105000,0.22,0
+105000,200000,0.24,0
+200000,640000,0.33,0
+640000,inf,0.37,0
+"""
+
+
+@pytest.fixture
+def schedule(config_dir):
+    (config_dir / "federal_tax_2027.csv").write_text(FEDERAL_2027)
+    path = config_dir / "tax_system.json"
+    systems = json.loads(path.read_text())
+    systems["federal"]["tables"] = {"2027": {"brackets_file": "federal_tax_2027.csv", "standard_deduction": 16000.0}}
+    systems["virginia"]["indexed"] = False
+    path.write_text(json.dumps(systems))
+    return compile_tax_schedule(FIRST_YEAR, LAST_YEAR, INFLATION, config_dir=str(config_dir))
+
+
+def _row(schedule, system, year):
+    row = year - FIRST_YEAR
+    return schedule[system]["standard_deduction"][row], [column[row] for column in schedule[system]["bracket"]]
+
+
+def _finite_uppers(uppers):
+    return uppers[np.isfinite(uppers)]
+
+
+def test_explicit_years_use_their_own_tables(schedule, config_dir):
+    for year, deduction, brackets_file in [(2025, 15000.0, "federal_tax_2025.csv"), (2027, 16000.0, "federal_tax_2027.csv")]:
+        lowers, uppers, rates, fees = load_brackets(config_dir / brackets_file)
+        got_deduction, (got_lowers, got_uppers, got_rates, _) = _row(schedule, "federal", year)
+
+        assert schedule["federal"]["cpi_years"][year - FIRST_YEAR] == 0
+        assert got_deduction == deduction
+        np.testing.assert_array_equal(got_lowers[:len(lowers)], lowers)
+        np.testing.assert_array_equal(got_rates[:len(rates)], rates)
+        np.testing.assert_array_equal(_finite_uppers(got_uppers), _finite_uppers(uppers))
+
+
+def test_shorter_table_is_padded_with_empty_brackets(schedule):
+    _, (lowers, uppers, rates, fees) = _row(schedule, "federal", 2027)
+
+    assert lowers.shape == (7,)
+    assert lowers[-1] == uppers[-1] == np.inf
+    assert rates[-1] == fees[-1] == 0
+
+
+@pytest.mark.parametrize("year, anchor, deduction", [(2026, 2025, 15000.0), (2028, 2027, 16000.0), (2030, 2027, 16000.0)])
+def test_later_years_index_the_nearest_earlier_table(schedule, year, anchor, deduction):
+    cpi_years = year - anchor
+    factor = (1 + INFLATION) ** cpi_years
+    anchor_deduction, (anchor_lowers, anchor_uppers, anchor_rates, _) = _row(schedule, "federal", anchor)
+    got_deduction, (lowers, uppers, rates, _) = _row(schedule, "federal", year)
+
+    assert anchor_deduction == deduction
+    assert schedule["federal"]["cpi_years"][year - FIRST_YEAR] == cpi_years
+    assert got_deduction == pytest.approx(deduction * factor)
+    np.testing.assert_allclose(lowers, anchor_lowers * factor)
+    np.testing.assert_allclose(_finite_uppers(uppers), _finite_uppers(anchor_uppers) * factor)
+    np.testing.assert_array_equal(rates, anchor_rates)
+
+
+def test_years_before_the_first_table_deflate_it(schedule):
+    deduction, _ = _row(schedule, "federal", 2024)
+
+    assert schedule["federal"]["cpi_years"][0] == -1
+    assert deduction == pytest.approx(15000.0 / (1 + INFLATION))
+
+
+def test_systems_that_are_not_indexed_stay_flat(schedule):
+    first_deduction, first_bracket = _row(schedule, "virginia", FIRST_YEAR)
+
+    np.testing.assert_array_equal(schedule["virginia"]["cpi_years"], 0)
+    np.testing.assert_array_equal(schedule["virginia"]["standard_deduction"], 8750.0)
+    for year in range(FIRST_YEAR, LAST_YEAR + 1):
+        _, bracket = _row(schedule, "virginia", year)
+        for column, first in zip(bracket, first_bracket):
+            np.testing.assert_array_equal(column, first)
+    #ltcg is still indexed, from its single 2025 table
+    assert schedule["ltcg"]["cpi_years"].tolist() == [-1, 0, 1, 2, 3, 4, 5]
+
+
+def test_tax_tables_for_year_takes_that_years_row(schedule):
+    tables = tax_tables_for_year(schedule, 2029)
+    deduction, bracket = _row(schedule, "federal", 2029)
+
+    assert tables["federal"]["standard_deduction"] == deduction
+    np.testing.assert_array_equal(tables["federal"]["bracket"][1], bracket[1])
+    #outside the schedule: the nearest end
+    assert tax_tables_for_year(schedule, 2040)["federal"]["standard_deduction"] == _row(schedule, "federal", LAST_YEAR)[0]
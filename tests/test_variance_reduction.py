@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from monte_carlo import compile_projection
+from run_projection import run
+from variance_reduction import failure_estimates
+
+N_PATHS = 1000
+METHODS = ["antithetic", "control_variate", "importance", "antithetic+control_variate"]
+
+
+@pytest.fixture(scope="module")
+def estimates(module_inputs):
+    #A fixed real draw that runs out of money on about 40% of paths
+    assumptions = {**module_inputs.assumptions, "withdrawal_type": "4pct", "withdrawal_rate": 0.06}
+    plan = compile_projection(
+        module_inputs.account_tax_map, module_inputs.rmd_table, module_inputs.start_bal, module_inputs.cf,
+        module_inputs.months, assumptions, balances_actuals=module_inputs.balances_actuals,
+        config_sources=module_inputs.config_sources,
+    )
+    return failure_estimates(plan, assumptions, ["plain", *METHODS], n_paths=N_PATHS, seed=1)
+
+
+def test_plain_estimate_is_the_failure_rate(estimates):
+    plain = estimates.loc["plain"]
+
+    assert 0.2 < plain["probability"] < 0.6
+    p = plain["probability"]
+    assert plain["std_error"] == pytest.approx(np.sqrt(p * (1 - p) / N_PATHS), rel=1e-3)
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_method_agrees_with_plain_monte_carlo(estimates, method):
+    plain, estimate = estimates.loc["plain"], estimates.loc[method]
+
+    assert estimate["n_paths"] == N_PATHS
+    assert abs(estimate["probability"] - plain["probability"]) < 3 * np.hypot(estimate["std_error"], plain["std_error"])
+
+
+@pytest.mark.parametrize("method", ["antithetic", "control_variate"])
+def test_method_reduces_the_variance(estimates, method):
+    assert estimates.loc[method, "variance_reduction"] > 1
+    assert estimates.loc[method, "effective_paths"] > N_PATHS
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError, match="stratified"):
+        failure_estimates({}, {}, ["antithetic+stratified"])
+
+
+def test_scenario_reports_the_estimates(module_inputs):
+    scenario = {
+        "withdrawal_type": "4pct",
+        "withdrawal_rate": 0.06,
+        "monte_carlo": {"paths": 200, "seed": 1, "failure_estimates": {"methods": ["plain", "antithetic"]}},
+    }
+
+    result = run(module_inputs, scenario)
+
+    assert list(result.failure_estimates.index) == ["plain", "antithetic"]
+    #plain estimation sees the same paths as the run itself
+    assert result.failure_estimates.loc["plain", "probability"] == pytest.approx(1 - result.monte_carlo.success_rate)
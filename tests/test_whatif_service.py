@@ -0,0 +1,97 @@
+import asyncio
+import json
+
+import pytest
+
+from monte_carlo import MC_METRICS
+from run_projection import Inputs
+from whatif_service import WhatIfEngine, WhatIfService
+
+
+@pytest.fixture
+def engine(inputs):
+    #A fixed real draw, so a high enough rate runs out of money
+    cfg = {**inputs.cfg, "withdrawal_type": "4pct"}
+    return WhatIfEngine(Inputs(**{**inputs.__dict__, "cfg": cfg, "assumptions": {**inputs.assumptions, "withdrawal_type": "4pct"}}))
+
+
+def _with_service(engine, coroutine, batch_window=0.05):
+    #Runs coroutine(service, port) against a live service on a free port
+    async def main():
+        service = WhatIfService(engine, batch_window=batch_window)
+        started = asyncio.get_running_loop().create_future()
+        task = asyncio.create_task(service.serve(0, ready=started.set_result))
+        server = await started
+        try:
+            return await coroutine(service, server.sockets[0].getsockname()[1])
+        finally:
+            task.cancel()
+
+    return asyncio.run(main())
+
+
+async def _post(port, path, body):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    data = json.dumps(body).encode()
+    writer.write(f"POST {path} HTTP/1.1\r\nContent-Length: {len(data)}\r\n\r\n".encode() + data)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(payload)
+
+
+@pytest.mark.parametrize("overrides", [
+    {"withdrawal_rate": 0.05},
+    {"withdrawal_rate": "0.09", "retirement": "2034-01-01"},
+])
+def test_batch_answer_matches_a_full_run(engine, overrides):
+    overrides = engine.normalize(overrides)
+
+    (batched,) = engine.evaluate_batch([(overrides, "full")])
+    full = engine.evaluate_full_run(overrides, "full")
+
+    assert batched.keys() == full.keys()
+    assert list(batched["projection"]) == list(full["projection"]) == ["Date", *MC_METRICS]
+    assert batched["projection"]["Date"] == full["projection"]["Date"]
+    for name in MC_METRICS:
+        assert batched["projection"][name] == pytest.approx(full["projection"][name], rel=1e-9, abs=1e-6)
+    assert (batched["failed"], batched["failed_date"]) == (full["failed"], full["failed_date"])
+    assert batched["failed"] == (overrides["withdrawal_rate"] > 0.08)
+
+
+def test_full_answer_follows_a_horizon_override(engine):
+    answer = engine.evaluate_full_run(engine.normalize({"horizon": "2040-06-01"}), "full")
+
+    assert answer["projection"]["Date"][-1] == "2040-06-01"
+    assert len(answer["projection"]["Net_Worth"]) == len(answer["projection"]["Date"])
+
+
+def test_concurrent_queries_share_one_batch_and_equal_overrides_one_cache_entry(engine):
+    async def queries(service, port):
+        answers = await asyncio.gather(*(service.query({"withdrawal_rate": rate}) for rate in (0.03, 0.04, 0.05)))
+        again = await service.query({"withdrawal_rate": "0.04"})
+        return answers, again, dict(service.stats)
+
+    answers, again, stats = _with_service(engine, queries)
+
+    assert (stats["batches"], stats["batched_requests"], stats["cache_hits"]) == (1, 3, 1)
+    assert again is answers[1]
+    assert answers[0]["ending"]["Net_Worth_Real"] > answers[2]["ending"]["Net_Worth_Real"]
+
+
+def test_bad_value_is_a_400(engine):
+    async def requests(service, port):
+        return (
+            await _post(port, "/projection", {"overrides": {"withdrawal_rate": "four percent"}}),
+            await _post(port, "/projection", {"overrides": {"retirement": "not a date"}}),
+            await _post(port, "/projection", {"overrides": {"withdrawal_rate": 0.04}}),
+            service.stats["batches"],
+        )
+
+    bad_rate, bad_date, good, batches = _with_service(engine, requests)
+
+    assert bad_rate[0] == 400 and "ValueError" in bad_rate[1]["error"]
+    assert bad_date[0] == 400
+    assert good[0] == 200 and not good[1]["failed"]
+    assert batches == 1                                     #the bad values never reached the batcher
@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from tax_engine import compile_tax_tables
+from withdraw_engine import _ytd_tax_vec, solve_gross_withdrawal
+from withdrawal_strategies import WITHDRAWAL_STRATEGIES, get_strategy, register_strategy
+
+
+@pytest.fixture
+def tax_tables(config_dir):
+    return compile_tax_tables(str(config_dir))
+
+
+def _net(gross, ordered_balances, ordinary_share, ltcg_share, ytd, tax_tables):
+    #What a gross draw leaves after the tax it adds, taking the accounts in order
+    taken = np.clip(gross[:, None] - np.cumsum(ordered_balances, axis=1) + ordered_balances, 0.0, ordered_balances)
+    add_ordinary = (taken * ordinary_share).sum(axis=1)
+    add_pref = (taken * ltcg_share).sum(axis=1)
+    before = _ytd_tax_vec(ytd, 0.0, ytd, tax_tables)[0]
+    after = _ytd_tax_vec(ytd + add_ordinary, add_pref, ytd + add_ordinary + add_pref, tax_tables)[0]
+    return gross - (after - before)
+
+
+def test_gross_up_nets_the_target(tax_tables):
+    #Paths from no income to deep in the brackets, with the draw crossing from brokerage into a pre-tax account
+    ytd = np.array([0.0, 20000.0, 90000.0, 250000.0])
+    ordered = np.tile([3000.0, 1e6], (len(ytd), 1))
+    ordinary_share = np.array([0.0, 1.0])
+    ltcg_share = np.array([0.5, 0.0])
+    target = np.full(len(ytd), 8000.0)
+
+    gross = solve_gross_withdrawal(target, ordered, ordinary_share, ltcg_share, ytd, 0.0, ytd, tax_tables)
+
+    assert np.all(gross >= target)
+    assert np.all(np.diff(gross) > 0)                           #more income already booked, more tax on the draw
+    net = _net(gross, ordered, ordinary_share, ltcg_share, ytd, tax_tables)
+    assert net == pytest.approx(target, abs=0.01)
+
+
+def test_gross_up_is_capped_at_the_balances(tax_tables):
+    ordered = np.array([[2000.0, 1000.0]])
+
+    gross = solve_gross_withdrawal(5000.0, ordered, np.array([1.0, 1.0]), np.zeros(2), 50000.0, 0.0, 50000.0, tax_tables)
+
+    assert gross == pytest.approx([3000.0])
+
+
+def test_gross_up_of_a_path_does_not_depend_on_its_batch(tax_tables):
+    ordered = np.array([[5000.0, 1e6], [1e6, 1e6], [0.0, 0.0]])
+    args = (np.array([0.2, 1.0]), np.array([0.4, 0.0]))
+    ytd = np.array([60000.0, 10000.0, 0.0])
+
+    batch = solve_gross_withdrawal(7000.0, ordered, *args, ytd, 0.0, ytd, tax_tables)
+    single = [solve_gross_withdrawal(7000.0, ordered[i:i + 1], *args, ytd[i:i + 1], 0.0, ytd[i:i + 1], tax_tables)[0] for i in range(3)]
+
+    assert batch == pytest.approx(single)
+    assert batch[2] == 0.0
+
+
+def _ctx(total, months_since_start, inflation_factor, withdrawal_rate=0.04, start_total=None, **assumptions):
+    total = np.asarray(total, dtype=float)
+    return {
+        "total": total,
+        "start_total": np.asarray(start_total if start_total is not None else total, dtype=float),
+        "months_since_start": np.full(len(total), months_since_start),
+        "active": np.ones(len(total), dtype=bool),
+        "withdrawal_rate": np.full(len(total), withdrawal_rate),
+        "inflation_factor": np.full(len(total), inflation_factor),
+        "assumptions": assumptions,
+    }
+
+
+def test_unknown_strategy_is_a_value_error():
+    with pytest.raises(ValueError, match="Unknown withdrawal type: nope"):
+        get_strategy("nope")
+
+
+def test_registered_plugin_is_found():
+    @register_strategy("test_fixed")
+    def fixed(ctx, state):
+        return np.full(len(ctx["total"]), 100.0)
+
+    try:
+        assert get_strategy("test_fixed")(_ctx([1e6], 0, 1.0), {}) == pytest.approx([100.0])
+    finally:
+        del WITHDRAWAL_STRATEGIES["test_fixed"]
+
+
+def test_4pct_indexes_the_first_withdrawal():
+    strategy, state = get_strategy("4pct"), {}
+
+    first = strategy(_ctx([1e6], 0, 1.0), state)
+    later = strategy(_ctx([5e5], 24, 1.1), state)
+
+    assert first == pytest.approx([1e6 * 0.04 / 12])
+    assert later == pytest.approx(first * 1.1)
+
+
+def test_guyton_klinger_guardrails():
+    strategy, state = get_strategy("guyton_klinger"), {}
+    strategy(_ctx([1e6, 1e6], 0, 1.0), state)
+
+    #a year on: one portfolio halved (rate above the guardrail, cut, no raise after a loss), one doubled (raise)
+    review = strategy(_ctx([5e5, 2e6], 12, 1.03), state)
+
+    annual = 1e6 * 0.04
+    assert review * 12 == pytest.approx([annual * 0.9, annual * 1.03 * 1.1])
+
+
+def test_floor_ceiling_bounds():
+    strategy, state = get_strategy("floor_ceiling"), {}
+    strategy(_ctx([1e6, 1e6], 0, 1.0), state)
+
+    annual = strategy(_ctx([1e5, 1e8], 12, 1.0), state) * 12
+
+    assert annual == pytest.approx([0.9 * 40000.0, 1.25 * 40000.0])